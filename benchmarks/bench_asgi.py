@@ -0,0 +1,76 @@
+"""
+Concurrent-connection throughput: WSGI (single-threaded wsgiref loop)
+against ASGI (sync views in the thread pool, async views in the event loop).
+Every view waits 20 ms, as a slow SQLite query or a notifier would.
+Run from the project root: python -m benchmarks.bench_asgi
+"""
+import asyncio
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from time import perf_counter, sleep
+
+from framework.asgi import AsgiFramework
+from framework.main import Framework
+
+DELAY = 0.02
+CONNECTIONS = 50
+
+
+class SlowView:
+    def __call__(self, request):
+        sleep(DELAY)
+        return '200 OK', 'sync'
+
+
+class AsyncSlowView:
+    async def __call__(self, request):
+        await asyncio.sleep(DELAY)
+        return '200 OK', 'async'
+
+
+routes = {'/sync/': SlowView(), '/async/': AsyncSlowView()}
+
+
+def run_wsgi(count):
+    application = Framework(routes, [])
+    for _ in range(count):
+        environ = {'PATH_INFO': '/sync/', 'REQUEST_METHOD': 'GET', 'QUERY_STRING': '',
+                   'wsgi.input': BytesIO()}
+        b''.join(application(environ, lambda status, headers: None))
+
+
+async def run_asgi(count, path):
+    application = AsgiFramework(routes, [], max_workers=CONNECTIONS)
+
+    async def one():
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            pass
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                 'headers': []}
+        await application(scope, receive, send)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    application.executor.shutdown()
+
+
+def measure(name, func):
+    start = perf_counter()
+    with redirect_stdout(StringIO()):
+        func()
+    elapsed = perf_counter() - start
+    print(f'{name:<24} {CONNECTIONS / elapsed:>10.1f} req/s')
+
+
+def main():
+    print(f'{CONNECTIONS} concurrent connections, view takes {DELAY * 1000:.0f} ms')
+    measure('WSGI', lambda: run_wsgi(CONNECTIONS))
+    measure('ASGI, sync view', lambda: asyncio.run(run_asgi(CONNECTIONS, '/sync/')))
+    measure('ASGI, async view', lambda: asyncio.run(run_asgi(CONNECTIONS, '/async/')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Cost of /copy-course/ cloning while the category grows:
+deepcopy of the course (the former clone) against the structural-sharing clone.
+Run from the project root: python -m benchmarks.bench_clone
+"""
+from copy import deepcopy
+from time import perf_counter
+
+from patterns.architectural_system_patterns import AssociationTable
+from patterns.behavioral_patterns import EmailNotifier, SmsNotifier
+from patterns.creational_patterns import Category, Course, Student
+
+SIZES = (10, 1000, 10000)
+REPEAT = 20
+
+
+def create_course(size):
+    """A course among size sibling courses, size students enrolled on them"""
+    table = AssociationTable()
+    category = Category('category', None)
+    notifiers = [EmailNotifier(), SmsNotifier()]
+    courses = [Course(f'course_{i}', category) for i in range(size)]
+    for i, course in enumerate(courses):
+        for notifier in notifiers:
+            course.attach(notifier)
+        table.add(Student(f'student_{i}'), course)
+    return courses[0]
+
+
+def measure(func, course):
+    count = len(course.category.courses)
+    start = perf_counter()
+    for i in range(REPEAT):
+        func(course, i)
+    elapsed = (perf_counter() - start) / REPEAT
+    # clones are linked into the category, drop them for the next run
+    for clone in course.category.courses[count:]:
+        course.category.remove_course(clone)
+    return elapsed
+
+
+def main():
+    print(f'{"courses":>8} {"deepcopy":>12} {"clone":>12}')
+    for size in SIZES:
+        course = create_course(size)
+        deep = measure(lambda obj, i: deepcopy(obj), course)
+        shared = measure(lambda obj, i: obj.clone(name=f'copy_{i}'), course)
+        print(f'{size:>8} {deep * 1e6:>9.1f} us {shared * 1e6:>9.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Response compression: bytes on the wire and time per page for the plain,
+gzip and deflate responses of the home page, the streamed student list
+and a cached page (its compressed body is reused by ETag).
+Run from the project root: python -m benchmarks.bench_compression
+"""
+from timeit import repeat
+from wsgiref.util import setup_testing_defaults
+
+from framework.main import Framework
+from patterns.structural_patterns import routes
+from urls import fronts
+
+PAGES = ('/', '/student-list/', '/courses/')
+ACCEPT = (('identity', None), ('gzip', 'gzip'), ('deflate', 'deflate'))
+
+
+def get(application, path, accept_encoding):
+    environ = {}
+    setup_testing_defaults(environ)
+    environ['PATH_INFO'] = path
+    if accept_encoding:
+        environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    result = {}
+
+    def start_response(code, headers):
+        result['headers'] = dict(headers)
+
+    result['size'] = sum(len(chunk) for chunk in application(environ, start_response))
+    return result
+
+
+def best(func, number):
+    return min(repeat(func, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    application = Framework(routes, fronts)
+    print(f'{"page":<16}{"encoding":<10}{"bytes":>8}{"ms":>10}')
+    for path in PAGES:
+        for name, accept_encoding in ACCEPT:
+            size = get(application, path, accept_encoding)['size']
+            ms = best(lambda: get(application, path, accept_encoding), 200)
+            print(f'{path:<16}{name:<10}{size:>8}{ms:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Memory of 100 000 students, 100 000 courses and 100 000 enrollments:
+the former dict-backed models with students/courses/observers lists
+against __slots__ models with the enrollments association table.
+Run from the project root: python -m benchmarks.bench_models_memory
+"""
+import gc
+import random
+import tracemalloc
+
+from patterns.architectural_system_patterns import AssociationTable
+from patterns.behavioral_patterns import EmailNotifier, SmsNotifier
+from patterns.creational_patterns import Category, Course, Student
+
+COUNT = 100000
+CATEGORIES = 100
+
+
+class DictStudent:
+    """Student before slots: courses list in __dict__"""
+
+    def __init__(self, name):
+        self.courses = []
+        self.name = name
+
+
+class DictCategory:
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.parent_category = None
+        self.courses = []
+
+
+class DictCourse:
+    """Course before slots: students and observers lists in __dict__"""
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+        category.courses.append(self)
+        self.students = []
+        self.observers = []
+
+
+def build_dict_models(notifiers):
+    categories = [DictCategory(i, f'category_{i}') for i in range(CATEGORIES)]
+    students = [DictStudent(f'student_{i}') for i in range(COUNT)]
+    courses = [DictCourse(f'course_{i}', categories[i % CATEGORIES]) for i in range(COUNT)]
+    for course in courses:
+        course.observers.extend(notifiers)
+    for student, course in zip(students, random.sample(courses, COUNT)):
+        course.students.append(student)
+        student.courses.append(course)
+    return categories, students, courses
+
+
+def build_slots_models(notifiers):
+    table = AssociationTable()
+    categories = [Category(f'category_{i}', None) for i in range(CATEGORIES)]
+    students = [Student(f'student_{i}') for i in range(COUNT)]
+    courses = [Course(f'course_{i}', categories[i % CATEGORIES]) for i in range(COUNT)]
+    for course in courses:
+        for notifier in notifiers:
+            course.attach(notifier)
+    for student, course in zip(students, random.sample(courses, COUNT)):
+        table.add(student, course)
+    return categories, students, courses, table
+
+
+def measure(build):
+    random.seed(1)
+    notifiers = [EmailNotifier(), SmsNotifier()]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build(notifiers)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return size
+
+
+def main():
+    # 100k students, 100k courses and 100k links between them
+    objects = 3 * COUNT
+    results = {}
+    for name, build in (('dict models', build_dict_models),
+                        ('slots models', build_slots_models)):
+        results[name] = size = measure(build)
+        print(f'{name:<13} {size / 2 ** 20:>8.1f} MiB  '
+              f'{size / objects:>6.1f} bytes per object')
+    saved = results['dict models'] - results['slots models']
+    print(f'saved         {saved / 2 ** 20:>8.1f} MiB  '
+          f'{saved / objects * 100000 / 2 ** 20:>6.1f} MiB per 100k objects')
+
+
+if __name__ == '__main__':
+    main()
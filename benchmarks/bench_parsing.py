@@ -0,0 +1,73 @@
+"""
+Parsing of large forms: the old split + quopri decoding against the single-pass parser,
+and streaming multipart/form-data with a file upload.
+Run from the project root: python -m benchmarks.bench_parsing
+"""
+from io import BytesIO
+from quopri import decodestring
+from timeit import repeat
+from urllib.parse import quote_plus
+
+from framework.http_requests import GetRequest, PostRequest
+
+FIELDS = 5000
+
+
+def old_decode_value(data):
+    decoded_data = {}
+    for k, v in data.items():
+        value = bytes(v.replace('%', '=').replace('+', ' '), 'UTF-8')
+        decoded_data[k] = decodestring(value).decode('UTF-8')
+    return decoded_data
+
+
+def old_parse(data):
+    """Request.parse_input_data + Framework.decode_value as they were: decoded twice"""
+    parsed_data = {}
+    for item in data.split('&'):
+        k, v = item.split('=')
+        parsed_data[k] = v
+    old_decode_value(parsed_data)
+    return old_decode_value(parsed_data)
+
+
+def make_form(count):
+    return '&'.join(f'field_{i}={quote_plus(f"значение номер {i}")}' for i in range(count))
+
+
+def make_multipart(file_size):
+    boundary = 'benchmarkboundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="name"\r\n\r\nstudent\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="data.bin"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    body += b'x' * file_size + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+def best(func, number):
+    return min(repeat(func, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    form = make_form(FIELDS)
+    print(f'urlencoded form, {FIELDS} fields, {len(form) // 1024} KB')
+    print(f'  old parser       {best(lambda: old_parse(form), 20):>8.2f} ms')
+    print(f'  new parser       {best(lambda: GetRequest.parse_input_data(form), 20):>8.2f} ms')
+
+    for size in (1024 * 1024, 8 * 1024 * 1024):
+        content_type, body = make_multipart(size)
+
+        def parse():
+            environ = {'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body)),
+                       'wsgi.input': BytesIO(body)}
+            request = PostRequest()
+            request.get_request_params(environ)
+            request.files['file'].close()
+
+        elapsed = best(parse, 5)
+        print(f'multipart, {size // 1024 // 1024} MB file {elapsed:>8.2f} ms '
+              f'({size / 1024 / 1024 / elapsed * 1000:.0f} MB/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Dispatch microbenchmark: lookup cost of Router for 10 .. 10 000 routes.
+Run from the project root: python -m benchmarks.bench_routing
+"""
+from timeit import repeat
+
+from framework.routing import Router
+
+
+class View:
+    def __call__(self, request):
+        return '200 OK', ''
+
+
+def build_routes(count):
+    routes = {}
+    for i in range(count // 2):
+        routes[f'/static-{i}/'] = View()
+        routes[f'/section-{i}/<int:id>/'] = View()
+    return routes
+
+
+def measure(router, path, number=100000):
+    best = min(repeat(lambda: router.match(path), number=number, repeat=5))
+    return best / number * 1e9
+
+
+def main():
+    print(f'{"routes":>8} {"static, ns":>12} {"dynamic, ns":>12} {"404, ns":>10}')
+    for count in (10, 100, 1000, 10000):
+        router = Router(build_routes(count))
+        last = count // 2 - 1
+        static_ns = measure(router, f'/static-{last}/')
+        dynamic_ns = measure(router, f'/section-{last}/42/')
+        missing_ns = measure(router, '/missing/42/')
+        print(f'{count:>8} {static_ns:>12.0f} {dynamic_ns:>12.0f} {missing_ns:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
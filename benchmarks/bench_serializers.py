@@ -0,0 +1,58 @@
+"""
+/api/ payload of 1 000 courses with 5 000 enrolled students:
+jsonpickle over the whole graph against the compiled CourseSchema encoder.
+Run from the project root: python -m benchmarks.bench_serializers
+"""
+import random
+from time import perf_counter
+
+from patterns.behavioral_patterns import BaseSerializer, EmailNotifier, SmsNotifier
+from patterns.creational_patterns import Category, CourseFactory, CourseSchema, Student, \
+    enrollments
+
+COURSES = 1000
+STUDENTS = 5000
+REPEAT = 5
+
+
+def create_courses():
+    random.seed(1)
+    categories = [Category(f'category_{i}', None) for i in range(20)]
+    notifiers = [EmailNotifier(), SmsNotifier()]
+    courses = []
+    for i in range(COURSES):
+        course = CourseFactory.create('record', f'course_{i}', random.choice(categories))
+        for notifier in notifiers:
+            course.attach(notifier)
+        courses.append(course)
+    for i in range(STUDENTS):
+        student = Student(f'student_{i}')
+        student.id = i
+        for course in random.sample(courses, 3):
+            enrollments.add(student, course)
+    return courses
+
+
+def measure(func):
+    best = None
+    for _ in range(REPEAT):
+        start = perf_counter()
+        data = func()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+
+def main():
+    courses = create_courses()
+    schema = CourseSchema()
+    selected = CourseSchema(['name', 'category'])
+    for name, func in (('jsonpickle', lambda: BaseSerializer(courses).save()),
+                       ('schema', lambda: schema.dumps(schema.dump_many(courses))),
+                       ('schema, 2 fields', lambda: selected.dumps(selected.dump_many(courses)))):
+        elapsed, size = measure(func)
+        print(f'{name:<17} {elapsed * 1000:>9.2f} ms  {size / 1024:>9.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
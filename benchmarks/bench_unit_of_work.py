@@ -0,0 +1,51 @@
+"""
+Bulk import of 10 000 students: one mapper and one commit per object
+against a single batched Unit of Work transaction.
+Run from the project root: python -m benchmarks.bench_unit_of_work
+"""
+import os
+import tempfile
+from time import perf_counter
+
+from patterns.architectural_system_patterns import UnitOfWork
+from patterns.creational_patterns import ConnectionPool, MapperRegistry, Student, StudentMapper
+
+COUNT = 10000
+
+
+def create_pool(folder, name):
+    pool = ConnectionPool(os.path.join(folder, name))
+    with open(os.path.join('utils', 'create_db.sql'), encoding='utf-8') as f:
+        pool.get_connection().executescript(f.read())
+    return pool
+
+
+def import_one_by_one(pool):
+    for i in range(COUNT):
+        StudentMapper(pool.get_connection()).insert(Student(f'student_{i}'))
+
+
+def import_unit_of_work(pool):
+    MapperRegistry.set_pool(pool)
+    UnitOfWork.new_current()
+    UnitOfWork.get_current().set_mapper_registry(MapperRegistry)
+    for i in range(COUNT):
+        Student(f'student_{i}').mark_new()
+    UnitOfWork.get_current().commit()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        for name, func in (('one by one', import_one_by_one),
+                           ('unit of work', import_unit_of_work)):
+            pool = create_pool(folder, f'{name.replace(" ", "_")}.sqlite')
+            start = perf_counter()
+            func(pool)
+            elapsed = perf_counter() - start
+            pool.release_thread()
+            pool.close()
+            print(f'{name:<14} {elapsed:>8.3f} s  {COUNT / elapsed:>10.0f} students/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""
+Load test on recorded or generated traffic.
+Record: RECORD_TRAFFIC=logs/traffic.jsonl python run.py (the TrafficRecorder front)
+Generate: python -m benchmarks.loadtest generate browse --size small --count 5000 -o logs/browse.jsonl
+Replay in-process, on a seeded site with a temporary database:
+    python -m benchmarks.loadtest replay logs/browse.jsonl --seed small --concurrency 4
+Replay over sockets against python run.py (--seed sends the seed traffic first):
+    python -m benchmarks.loadtest replay logs/browse.jsonl --url http://127.0.0.1:8000 --seed small
+Baseline: --save-baseline logs/baseline.json, then --baseline logs/baseline.json --threshold 0.2
+exits with 1 when throughput, a route's p95 or its allocations got worse than the threshold.
+Run from the project root.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+from base64 import b64decode
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import count
+from time import perf_counter, perf_counter_ns
+from urllib.parse import urlsplit
+
+from benchmarks import scenarios
+
+QUANTILES = (0.5, 0.95, 0.99)
+# allocations are measured on this many requests of every route
+ALLOCATION_SAMPLES = 50
+# latency changes below this are noise whatever the threshold is
+MIN_DELTA_MS = 0.1
+
+
+def load_records(file_name):
+    with open(file_name, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_body(record):
+    if 'body_base64' in record:
+        return b64decode(record['body_base64'])
+    return record.get('body', '').encode('utf-8')
+
+
+def get_route(record):
+    return record.get('route') or record['path']
+
+
+class InProcessClient:
+    """Calls the WSGI application with a synthetic environ, no sockets"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def request(self, record):
+        """(status, body size)"""
+        body = get_body(record)
+        environ = {
+            'REQUEST_METHOD': record['method'],
+            'PATH_INFO': record['path'],
+            'QUERY_STRING': record.get('query', ''),
+            'CONTENT_TYPE': record.get('content_type', ''),
+            'CONTENT_LENGTH': str(len(body)) if body else '',
+            'SERVER_NAME': 'loadtest',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in record.get('headers', {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        status = []
+        result = self.application(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            size = sum(len(chunk) for chunk in result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0][:3]), size
+
+    def close(self):
+        pass
+
+
+class SocketClient:
+    """HTTP/1.1 keep-alive connection per thread"""
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connections = []
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.connection = connection
+            self.connections.append(connection)
+        return connection
+
+    def request(self, record):
+        body = get_body(record)
+        target = record['path'] + (f'?{record["query"]}' if record.get('query') else '')
+        headers = dict(record.get('headers', {}))
+        if body:
+            headers['Content-Type'] = record.get('content_type', '')
+        for attempt in (1, 2):
+            connection = self.get_connection()
+            try:
+                connection.request(record['method'], target, body=body or None, headers=headers)
+                response = connection.getresponse()
+                return response.status, len(response.read())
+            except (ConnectionError, http.client.HTTPException):
+                # the server closed the keep-alive connection
+                connection.close()
+                self.local.connection = None
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+class RouteStats:
+    __slots__ = ('latencies', 'errors', 'bytes', 'allocations')
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self.allocations = []
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.errors += other.errors
+        self.bytes += other.bytes
+
+
+def replay(client, records, concurrency=1, repeat=1, warmup=0):
+    """({route: RouteStats}, wall seconds), requests are taken in order by the threads"""
+    for record in records[:warmup]:
+        client.request(record)
+    total = len(records) * repeat
+    index = count()
+
+    def work():
+        stats = defaultdict(RouteStats)
+        while (i := next(index)) < total:
+            record = records[i % len(records)]
+            route_stats = stats[get_route(record)]
+            start = perf_counter_ns()
+            try:
+                status, size = client.request(record)
+            except Exception:
+                route_stats.errors += 1
+                continue
+            route_stats.latencies.append(perf_counter_ns() - start)
+            route_stats.bytes += size
+            if status >= 500:
+                route_stats.errors += 1
+        return stats
+
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = [executor.submit(work) for _ in range(concurrency)]
+    wall = perf_counter() - start
+    stats = defaultdict(RouteStats)
+    for result in results:
+        for route, route_stats in result.result().items():
+            stats[route].merge(route_stats)
+    return stats, wall
+
+
+def measure_allocations(client, records, stats, samples=ALLOCATION_SAMPLES):
+    """Peak of memory allocated by one request, in one thread so requests don't mix"""
+    by_route = defaultdict(list)
+    for record in records:
+        route_records = by_route[get_route(record)]
+        if len(route_records) < samples:
+            route_records.append(record)
+    tracemalloc.start()
+    try:
+        for route, route_records in by_route.items():
+            for record in route_records:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                client.request(record)
+                stats[route].allocations.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[max(math.ceil(q * len(sorted_values)) - 1, 0)]
+
+
+def summarize(latencies, requests, errors, wall):
+    latencies = sorted(latencies)
+    summary = {'count': requests, 'errors': errors, 'rps': round(requests / wall, 1) if wall else 0.0}
+    for q in QUANTILES:
+        summary[f'p{int(q * 100)}_ms'] = round(percentile(latencies, q) / 1e6, 3)
+    return summary
+
+
+def make_report(stats, wall):
+    routes = {}
+    for route, route_stats in sorted(stats.items()):
+        summary = summarize(route_stats.latencies, len(route_stats.latencies) + route_stats.errors,
+                            route_stats.errors, wall)
+        summary['kib_per_request'] = round(route_stats.bytes / max(len(route_stats.latencies), 1) / 1024, 2)
+        if route_stats.allocations:
+            summary['alloc_kib'] = round(sum(route_stats.allocations) / len(route_stats.allocations) / 1024, 1)
+        routes[route] = summary
+    latencies = [ns for route_stats in stats.values() for ns in route_stats.latencies]
+    errors = sum(route_stats.errors for route_stats in stats.values())
+    return {'total': summarize(latencies, len(latencies) + errors, errors, wall), 'routes': routes}
+
+
+def print_report(report):
+    print(f'{"route":<28}{"count":>7}{"rps":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          f'{"errors":>8}{"KiB":>8}{"alloc KiB":>11}')
+    rows = list(report['routes'].items()) + [('total', report['total'])]
+    for route, summary in rows:
+        alloc = summary.get('alloc_kib')
+        print(f'{route[:27]:<28}{summary["count"]:>7}{summary["rps"]:>9.1f}{summary["p50_ms"]:>9.3f}'
+              f'{summary["p95_ms"]:>9.3f}{summary["p99_ms"]:>9.3f}{summary["errors"]:>8}'
+              f'{summary.get("kib_per_request", ""):>8}{"" if alloc is None else alloc:>11}')
+
+
+def compare(report, baseline, threshold, min_delta_ms=MIN_DELTA_MS):
+    """Regressions against the baseline report, an empty list when there are none"""
+    regressions = []
+    total, base_total = report['total'], baseline['total']
+    if total['rps'] < base_total['rps'] * (1 - threshold):
+        regressions.append(f'throughput {total["rps"]} rps, baseline {base_total["rps"]}')
+    if total['errors'] > base_total['errors']:
+        regressions.append(f'errors {total["errors"]}, baseline {base_total["errors"]}')
+    for route, summary in report['routes'].items():
+        base = baseline['routes'].get(route)
+        if base is None:
+            continue
+        p95, base_p95 = summary['p95_ms'], base['p95_ms']
+        if p95 > base_p95 * (1 + threshold) and p95 - base_p95 > min_delta_ms:
+            regressions.append(f'{route}: p95 {p95} ms, baseline {base_p95} ms')
+        alloc, base_alloc = summary.get('alloc_kib'), base.get('alloc_kib')
+        if alloc is not None and base_alloc is not None and alloc > base_alloc * (1 + threshold) \
+                and alloc - base_alloc > 1:
+            regressions.append(f'{route}: {alloc} KiB allocated, baseline {base_alloc} KiB')
+    return regressions
+
+
+def prepare_in_process(size, folder):
+    """The application of run.py on a temporary database, seeded when size is given"""
+    from patterns.behavioral_patterns import BufferedFileWriter, FakeGateway, Subject
+    from patterns.creational_patterns import ConnectionPool, MapperRegistry
+
+    pool = ConnectionPool(os.path.join(folder, 'loadtest.sqlite'))
+    with open(os.path.join('utils', 'create_db.sql'), encoding='utf-8') as f:
+        pool.get_connection().executescript(f.read())
+    MapperRegistry.set_pool(pool)
+
+    from framework.main import Framework
+    from framework.templator import precompile
+    from patterns.structural_patterns import routes
+    from urls import fronts, static_files
+    import views
+
+    # the project's log and the gateways stay untouched
+    views.logger.writer = BufferedFileWriter(os.path.join(folder, 'log.txt'))
+    views.email_notifier.gateway = FakeGateway()
+    views.sms_notifier.gateway = FakeGateway()
+    Subject.dispatcher = None
+    precompile()
+    first_category_id = None
+    if size:
+        categories, _, _ = scenarios.seed_site(views.site, size)
+        first_category_id = categories[0].id
+    # the connection of the seeding thread goes back for the requests
+    pool.release_thread()
+    return Framework(routes, fronts, static=static_files), first_category_id
+
+
+def run_replay(args):
+    records = load_records(args.file)
+    if not records:
+        print(f'{args.file} has no requests')
+        return 1
+    with tempfile.TemporaryDirectory() as folder:
+        if args.url:
+            client = SocketClient(args.url)
+            if args.seed:
+                seed_stats, _ = replay(client, list(scenarios.seed_traffic(args.seed)))
+                print(f'seeded by {sum(len(s.latencies) for s in seed_stats.values())} requests')
+        else:
+            application, first_category_id = prepare_in_process(args.seed, folder)
+            if first_category_id:
+                print(f'categories of the seeded site start from id {first_category_id}, '
+                      f'generate traffic with --first-category-id {first_category_id}')
+            client = InProcessClient(application)
+        try:
+            stats, wall = replay(client, records, args.concurrency, args.repeat, args.warmup)
+            if args.allocations and not args.url:
+                measure_allocations(client, records, stats)
+        finally:
+            client.close()
+    report = make_report(stats, wall)
+    print(f'{report["total"]["count"]} requests in {wall:.2f} s, concurrency {args.concurrency}, '
+          f'{"socket " + args.url if args.url else "in-process"}')
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'baseline saved to {args.save_baseline}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f'REGRESSIONS over {args.threshold:.0%}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+        print(f'no regressions over {args.threshold:.0%}')
+    return 0
+
+
+def run_generate(args):
+    if args.scenario == 'seed':
+        records = scenarios.seed_traffic(args.size, args.random_seed, args.first_category_id)
+    else:
+        records = scenarios.browse_traffic(args.size, args.count, args.random_seed,
+                                           args.first_category_id)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            scenarios.write_records(records, f)
+    else:
+        scenarios.write_records(records, sys.stdout)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadtest')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='traffic of a scenario as JSON lines')
+    generate.add_argument('scenario', choices=('browse', 'seed'))
+    generate.add_argument('--size', choices=scenarios.SIZES, default='small')
+    generate.add_argument('--count', type=int, default=10000, help='requests of browse')
+    generate.add_argument('--random-seed', type=int, default=0)
+    generate.add_argument('--first-category-id', type=int, default=0)
+    generate.add_argument('-o', '--output', help='file, stdout by default')
+
+    replay_parser = commands.add_parser('replay', help='replays a JSON lines file')
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('--url', help='server to send requests to, in-process by default')
+    replay_parser.add_argument('--seed', choices=scenarios.SIZES,
+                               help='data to create before the run')
+    replay_parser.add_argument('--concurrency', type=int, default=1)
+    replay_parser.add_argument('--repeat', type=int, default=1, help='passes over the file')
+    replay_parser.add_argument('--warmup', type=int, default=100, help='first requests sent unmeasured')
+    replay_parser.add_argument('--allocations', action='store_true',
+                               help='memory allocated per request of every route (in-process)')
+    replay_parser.add_argument('--save-baseline', help='writes the report to the file')
+    replay_parser.add_argument('--baseline', help='report to compare with')
+    replay_parser.add_argument('--threshold', type=float, default=0.2,
+                               help='allowed share of slowdown, 0.2 - 20%%')
+
+    args = parser.parse_args(argv)
+    return run_replay(args) if args.command == 'replay' else run_generate(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
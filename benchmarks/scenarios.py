@@ -0,0 +1,135 @@
+"""
+Data and traffic for python -m benchmarks.loadtest:
+seed_site() fills the engine in-process, seed_traffic() makes the same
+data by POST requests (for a server started from scratch),
+browse_traffic() - a mix of page and API reads.
+"""
+import json
+import random
+from urllib.parse import urlencode
+
+from patterns.architectural_system_patterns import UnitOfWork
+from patterns.creational_patterns import MapperRegistry, enrollments
+
+# (categories, courses, students)
+SIZES = {
+    'small': (50, 500, 1000),
+    'medium': (500, 5000, 10000),
+    'large': (2000, 20000, 50000),
+}
+COURSE_TYPES = ('record', 'interactive')
+# every ROOT_EVERY-th category is a root, the others are nested into earlier ones
+ROOT_EVERY = 10
+ENROLLMENTS_PER_STUDENT = 3
+
+
+def parent_index(index, rng):
+    if index % ROOT_EVERY == 0:
+        return None
+    return rng.randrange(index)
+
+
+def seed_site(site, size='small', seed=0):
+    """Categories, courses and enrolled students straight in the engine and the database"""
+    categories_count, courses_count, students_count = SIZES[size]
+    rng = random.Random(seed)
+    categories = []
+    for index in range(categories_count):
+        parent = parent_index(index, rng)
+        category = site.create_category(f'category_{index}',
+                                        categories[parent] if parent is not None else None)
+        categories.append(category)
+        site.categories.append(category)
+    courses = []
+    for index in range(courses_count):
+        course = site.create_course(COURSE_TYPES[index % 2], f'course_{index}',
+                                    categories[rng.randrange(categories_count)])
+        courses.append(course)
+        site.courses.append(course)
+
+    unit_of_work = UnitOfWork()
+    unit_of_work.set_mapper_registry(MapperRegistry)
+    token = UnitOfWork.set_current(unit_of_work)
+    try:
+        students = []
+        for index in range(students_count):
+            student = site.create_user('student', f'student_{index}')
+            site.students.append(student)
+            student.mark_new()
+            students.append(student)
+        unit_of_work.commit()
+        for student in students:
+            for course in rng.sample(courses, min(ENROLLMENTS_PER_STUDENT, courses_count)):
+                # straight to the table: no notifications for seeded data
+                enrollments.add(student, course)
+    finally:
+        UnitOfWork.current.reset(token)
+    return categories, courses, students
+
+
+def form(method, path, data=None, query=None, route=None):
+    record = {'method': method, 'path': path, 'query': urlencode(query or {}),
+              'route': route or path, 'headers': {'accept-encoding': 'gzip, deflate'}}
+    if data is not None:
+        record['content_type'] = 'application/x-www-form-urlencoded'
+        record['body'] = urlencode(data)
+    return record
+
+
+def seed_traffic(size='small', seed=0, first_category_id=0):
+    """
+    POST requests making the data of seed_site(), replay them with concurrency 1:
+    /create-course/ remembers the category of the previous GET.
+    Category ids are counted from first_category_id (the next id of a fresh server is 0)
+    """
+    categories_count, courses_count, students_count = SIZES[size]
+    rng = random.Random(seed)
+    first_id = first_category_id
+    for index in range(categories_count):
+        parent = parent_index(index, rng)
+        data = {'name': f'category_{index}'}
+        if parent is not None:
+            data['category_id'] = first_id + parent
+        yield form('POST', '/create-category/', data)
+    for index in range(courses_count):
+        category_id = first_id + rng.randrange(categories_count)
+        yield form('GET', '/create-course/', query={'id': category_id})
+        yield form('POST', '/create-course/', {'name': f'course_{index}'})
+    for index in range(students_count):
+        yield form('POST', '/create-student/', {'name': f'student_{index}'})
+    for index in range(students_count):
+        for course in rng.sample(range(courses_count), min(ENROLLMENTS_PER_STUDENT, courses_count)):
+            yield form('POST', '/add-student/',
+                       {'course_name': f'course_{course}', 'student_name': f'student_{index}'})
+
+
+def browse_traffic(size='small', count=10000, seed=0, first_category_id=0):
+    """Reads of a seeded site, weighted like a catalogue: lists, API pages, a category"""
+    categories_count, courses_count, students_count = SIZES[size]
+    rng = random.Random(seed)
+    pages = [
+        (10, lambda: form('GET', '/')),
+        (10, lambda: form('GET', '/courses/')),
+        (5, lambda: form('GET', '/students/')),
+        (20, lambda: form('GET', f'/courses-list/{first_category_id + rng.randrange(categories_count)}/',
+                          route='/courses-list/<int:id>/')),
+        (15, lambda: form('GET', '/api/', query={
+            'offset': rng.randrange(0, courses_count, 50), 'limit': 50})),
+        (10, lambda: form('GET', '/api/categories/', query={
+            'offset': rng.randrange(0, categories_count, 20), 'limit': 20, 'fields': 'id,name,course_count'})),
+        (10, lambda: form('GET', '/api/students/', query={
+            'offset': rng.randrange(0, students_count, 50), 'limit': 50})),
+        (10, lambda: form('GET', '/student-list/', query={
+            'after': rng.randrange(students_count), 'limit': 50})),
+        (5, lambda: form('GET', '/contact/')),
+        (5, lambda: form('GET', '/static/style.css', route='/static/')),
+    ]
+    weights = [weight for weight, _ in pages]
+    makers = [maker for _, maker in pages]
+    for maker in rng.choices(makers, weights, k=count):
+        yield maker()
+
+
+def write_records(records, file):
+    for record in records:
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from wsgiref.util import FileWrapper
+
+from framework.http_requests import HttpError, RequestEntityTooLarge, MAX_BODY_SIZE, CHUNK_SIZE
+from framework.main import Framework
+from framework.middleware import wrap_async_stage
+
+
+class AsgiFramework(Framework):
+    """
+    ASGI entry point on the same routes and fronts as the WSGI Framework.
+    Views with async def __call__ are awaited in the event loop,
+    plain sync views run in a thread pool so a slow one doesn't block others.
+    """
+
+    def __init__(self, routes_obj, fronts_obj, max_workers=None, static=None):
+        # the stages are compiled by Framework.__init__, they need the executor
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='view')
+        super().__init__(routes_obj, fronts_obj, static=static)
+        self.async_views = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise NotImplementedError(f'Unsupported scope type {scope["type"]}')
+
+        try:
+            body = await self.read_body(receive)
+            environ = self.get_environ(scope, body)
+            if self.static is not None and self.static.matches(environ['PATH_INFO']):
+                await self.send_static(send, environ)
+                return
+            request = self.get_request(environ)
+        except HttpError as e:
+            await send({
+                'type': 'http.response.start',
+                'status': int(e.code.split(' ', 1)[0]),
+                'headers': [(b'content-type', b'text/html')],
+            })
+            await send({'type': 'http.response.body', 'body': e.message.encode('utf-8')})
+            return
+        code, headers, body = await self.handler(request)
+        self.invalidate_after_commit(request)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if isinstance(body, bytes):
+            headers = self.length_headers(code, headers, [body])
+
+        await send({
+            'type': 'http.response.start',
+            'status': int(code.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers],
+        })
+        await self.send_body(send, body)
+
+    def wrap_stage(self, middleware, handler, timer):
+        return wrap_async_stage(middleware, handler, timer, self.executor)
+
+    async def send_static(self, send, environ):
+        code, headers, body = self.static.get_response(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(code.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers],
+        })
+        # the file is read in the thread pool, chunk by chunk
+        await self.send_body(send, body if isinstance(body, bytes) else FileWrapper(body, CHUNK_SIZE))
+
+    async def dispatch(self, request):
+        view = self.get_view(request)
+        response = self.get_cached_response(view, request, request.environ)
+        if response is None:
+            code, body = await self.call_view(view, request)
+            response = self.finish_response(view, request, request.environ, code, body)
+        return response
+
+    async def send_body(self, send, body):
+        if hasattr(body, '__aiter__'):
+            async for chunk in body:
+                await self.send_chunk(send, chunk)
+        elif isinstance(body, (str, bytes)):
+            await self.send_chunk(send, body)
+        else:
+            # sync generators may do blocking work, e.g. fetch rows
+            chunks = iter(Framework.encode_body(body))
+            loop = asyncio.get_running_loop()
+            # the request's context variables (unit of work, connection) are kept
+            context = contextvars.copy_context()
+            while True:
+                chunk = await loop.run_in_executor(self.executor, context.run, next, chunks, None)
+                if chunk is None:
+                    break
+                await self.send_chunk(send, chunk)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    async def send_chunk(send, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    async def call_view(self, view, request):
+        if self.is_async(view):
+            try:
+                return await view(request)
+            except HttpError as e:
+                return e.code, e.message
+        loop = asyncio.get_running_loop()
+        # context is copied so the view sees the caller's context variables
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor, context.run, Framework.call_view, view, request)
+
+    def is_async(self, view):
+        key = id(view)
+        if key not in self.async_views:
+            self.async_views[key] = inspect.iscoroutinefunction(view) or \
+                inspect.iscoroutinefunction(getattr(view, '__call__', None))
+        return self.async_views[key]
+
+    @staticmethod
+    async def read_body(receive):
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise RequestEntityTooLarge(f'Request body is over {MAX_BODY_SIZE} bytes')
+            chunks.append(chunk)
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    @staticmethod
+    def get_environ(scope, body):
+        """WSGI-like environ, so request parsing is shared with Framework"""
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                environ[f'HTTP_{name}'] = value
+        return environ
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from time import monotonic
+
+
+class CacheEntry:
+    __slots__ = ('code', 'headers', 'body', 'etag', 'expires')
+
+    def __init__(self, code, headers, body, expires):
+        self.code = code
+        self.headers = headers
+        self.body = body
+        self.etag = f'"{sha1(body).hexdigest()}"'
+        self.expires = expires
+
+
+class ResponseCache:
+    """
+    Rendered responses of read-only views: LRU with TTL.
+    Views opt in with AppRoute(url, cache=<ttl seconds>),
+    views with AppRoute(url, invalidates_cache=True) clear it on success.
+    """
+
+    def __init__(self, max_entries=256, default_ttl=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.expires < monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, code, headers, body, ttl=None):
+        ttl = self.default_ttl if ttl is None or ttl is True else ttl
+        entry = CacheEntry(code, headers, body, monotonic() + ttl)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, prefix=None):
+        """Drops entries which path starts with prefix, all of them without prefix"""
+        with self.lock:
+            if prefix is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    @staticmethod
+    def etag_matches(entry, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        tags = (tag.strip() for tag in if_none_match.split(','))
+        return any(tag.removeprefix('W/') == entry.etag for tag in tags)
@@ -0,0 +1,209 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+from framework.middleware import Middleware
+
+# types worth compressing, images and archives are compressed already
+COMPRESSIBLE_TYPES = frozenset((
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+))
+# smaller bodies aren't compressed: the gzip header and a packet make the gain zero
+MIN_SIZE = 500
+# compressed bodies of responses with an ETag (the cached ones) kept for reuse
+MAX_CACHED_BODIES = 256
+# zlib wbits: gzip container for gzip, zlib container for deflate (RFC 9110)
+WBITS = {'gzip': 31, 'deflate': 15}
+
+
+def get_header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_accept_encoding(accept_encoding):
+    """{coding: q} of the Accept-Encoding header"""
+    codings = {}
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class CompressionMiddleware(Middleware):
+    """
+    gzip / deflate of responses by Accept-Encoding of the client.
+    Bodies of known size under min_size stay as they are, streamed bodies
+    (generators, template streams) are compressed chunk by chunk,
+    every chunk is flushed so the page still goes to the client as it renders.
+    The encoding is chosen by the headers only, a stream is read when it's sent.
+    Should be one of the first fronts: its after_response runs last
+    """
+
+    order = -95
+
+    def __init__(self, level=6, min_size=MIN_SIZE, content_types=COMPRESSIBLE_TYPES,
+                 encodings=('gzip', 'deflate')):
+        self.level = level
+        self.min_size = min_size
+        self.content_types = frozenset(content_types)
+        self.encodings = encodings
+        # {(etag, encoding): compressed body}
+        self.compressed = OrderedDict()
+        self.lock = threading.Lock()
+
+    def choose_encoding(self, accept_encoding):
+        if not accept_encoding:
+            return None
+        codings = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0.0
+        for encoding in self.encodings:
+            q = codings.get(encoding, codings.get('*', 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def not_modified_headers(self, request, headers):
+        headers = self.vary_headers(headers)
+        if self.choose_encoding(request.environ.get('HTTP_ACCEPT_ENCODING')) is None:
+            return headers
+        return [(name, f'W/{value}' if name.lower() == 'etag' and not value.startswith('W/')
+                 else value) for name, value in headers]
+
+    def is_compressible(self, code, headers):
+        if code[:3] in ('204', '304') or code.startswith('1'):
+            return False
+        if get_header(headers, 'Content-Encoding') is not None:
+            return False
+        content_type = get_header(headers, 'Content-Type') or ''
+        return content_type.split(';', 1)[0].strip().lower() in self.content_types
+
+    @staticmethod
+    def vary_headers(headers):
+        """Caches should keep compressed and plain responses apart"""
+        vary = get_header(headers, 'Vary')
+        if vary is None:
+            return headers + [('Vary', 'Accept-Encoding')]
+        if 'accept-encoding' in vary.lower() or vary.strip() == '*':
+            return headers
+        return [(name, f'{value}, Accept-Encoding' if name.lower() == 'vary' else value)
+                for name, value in headers]
+
+    @staticmethod
+    def encoded_headers(headers, encoding, content_length=None):
+        """
+        Content-Encoding added, Content-Length replaced, ETag made weak:
+        the compressed body isn't byte-equal to the one the ETag was made for,
+        and If-None-Match with a weak tag still matches (like nginx does)
+        """
+        result = []
+        for name, value in headers:
+            lower = name.lower()
+            if lower == 'content-length':
+                continue
+            if lower == 'etag' and not value.startswith('W/'):
+                value = f'W/{value}'
+            result.append((name, value))
+        result.append(('Content-Encoding', encoding))
+        if content_length is not None:
+            result.append(('Content-Length', str(content_length)))
+        return result
+
+    def after_response(self, request, response):
+        code, headers, body = response
+        if code.startswith('304'):
+            # no body and no Content-Type, the validators should be those of the 200 response
+            return code, self.not_modified_headers(request, headers), body
+        if not self.is_compressible(code, headers):
+            return response
+        headers = self.vary_headers(headers)
+        encoding = self.choose_encoding(request.environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return code, headers, body
+
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if isinstance(body, bytes):
+            if len(body) < self.min_size:
+                return code, headers, body
+            body = self.compress_body(body, encoding, get_header(headers, 'ETag'))
+            return code, self.encoded_headers(headers, encoding, len(body)), body
+        if hasattr(body, '__aiter__'):
+            return code, self.encoded_headers(headers, encoding), self.compress_async(body, encoding)
+        # the stream isn't read here: under ASGI after_response runs in the event loop,
+        # and the chunks may come from a blocking source (a database cursor, a file),
+        # they are pulled by the server together with the compressed ones
+        content_length = get_header(headers, 'Content-Length')
+        if content_length is not None and content_length.isdigit() \
+                and int(content_length) < self.min_size:
+            return code, headers, body
+        return code, self.encoded_headers(headers, encoding), \
+            self.compress_stream(body, encoding)
+
+    def compress_body(self, body, encoding, etag=None):
+        """The same ETag means the same body: a cached page is compressed once"""
+        key = (etag, encoding)
+        if etag is not None:
+            with self.lock:
+                compressed = self.compressed.get(key)
+                if compressed is not None:
+                    self.compressed.move_to_end(key)
+                    return compressed
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[encoding])
+        compressed = compressor.compress(body) + compressor.flush()
+        if etag is not None:
+            with self.lock:
+                self.compressed[key] = compressed
+                while len(self.compressed) > MAX_CACHED_BODIES:
+                    self.compressed.popitem(last=False)
+        return compressed
+
+    def compress_stream(self, body, encoding):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[encoding])
+        try:
+            # chunks are gathered up to min_size, so tiny first chunks don't get
+            # a sync flush each, then every chunk is flushed as it comes
+            head = []
+            size = 0
+            chunks = iter(body)
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                head.append(chunk)
+                size += len(chunk)
+                if size >= self.min_size:
+                    break
+            yield compressor.compress(b''.join(head)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if chunk:
+                    yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    async def compress_async(self, body, encoding):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[encoding])
+        async for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
@@ -1,42 +1,454 @@
-class Request:
+from binascii import a2b_qp
+from email.parser import HeaderParser
+from http.cookies import SimpleCookie, CookieError
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote_plus
+
+# request bodies above this size are rejected with 413
+MAX_BODY_SIZE = 10 * 1024 * 1024
+# uploaded files bigger than this are spooled to disk
+MAX_MEMORY_FILE_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class HttpError(Exception):
+    code = '400 Bad Request'
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class BadRequest(HttpError):
+    code = '400 Bad Request'
+
+
+class RequestEntityTooLarge(HttpError):
+    code = '413 Request Entity Too Large'
+
+
+class MultiDict(dict):
+    """
+    dict with the last value of every key,
+    all the values of a repeated key are in getlist(key).
+    Lists are kept only for the keys that are repeated
+    """
+
+    def __init__(self, pairs=(), lists=None):
+        if isinstance(pairs, dict):
+            # made by a parser: the last values and the lists of repeated keys
+            super().__init__(pairs)
+            self.lists = lists if lists is not None else {}
+            return
+        super().__init__()
+        self.lists = {}
+        for key, value in pairs:
+            self.add(key, value)
+
+    def add(self, key, value):
+        if key in self:
+            values = self.lists.get(key)
+            if values is None:
+                self.lists[key] = [super().__getitem__(key), value]
+            else:
+                values.append(value)
+        super().__setitem__(key, value)
+
+    def __setitem__(self, key, value):
+        self.lists.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.lists.pop(key, None)
+        super().__delitem__(key)
+
+    def getlist(self, key):
+        values = self.lists.get(key)
+        if values is not None:
+            return list(values)
+        return [self[key]] if key in self else []
+
+
+class UploadedFile:
+    """file part of multipart/form-data, file is rewound to the start"""
+
+    def __init__(self, name, filename, content_type, file, size):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = file
+        self.size = size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+class RequestParser:
+
+    @staticmethod
+    def unquote(value):
+        """
+        unquote_plus, but %XX escapes are decoded by binascii.a2b_qp (C code,
+        the same =XX escapes in quoted-printable): urllib decodes them one by one
+        in Python, a form in Cyrillic has an escape per byte.
+        When a2b_qp can't give the same result (malformed escapes, line breaks,
+        an escaped '=', bytes that aren't utf-8) the value goes to urllib
+        """
+        if '%' not in value:
+            return value.replace('+', ' ') if '+' in value else value
+        if '\n' not in value and '\r' not in value:
+            try:
+                decoded = a2b_qp(value.replace('%', '=').replace('+', ' '))
+            except ValueError:
+                # not ASCII
+                decoded = None
+            # every escape is 3 characters for 1 byte, else a2b_qp skipped some
+            if decoded is not None and len(decoded) == len(value) - 2 * value.count('%') \
+                    and b'=' not in decoded:
+                try:
+                    return decoded.decode('utf-8')
+                except UnicodeDecodeError:
+                    pass
+        return unquote_plus(value)
 
     @staticmethod
     def parse_input_data(data: str):
-        parsed_data = dict()
+        """
+        Query string or urlencoded body in one pass into a plain dict,
+        lists are made only for repeated keys
+        """
+        values = {}
+        lists = {}
         if data:
-            params = data.split('&')
-            for item in params:
-                k, v = item.split('=')
-                parsed_data[k] = v
-        return parsed_data
+            unquote = RequestParser.unquote
+            for item in data.split('&'):
+                if not item:
+                    continue
+                key, _, value = item.partition('=')
+                if '%' in key or '+' in key:
+                    key = unquote(key)
+                if '%' in value or '+' in value:
+                    value = unquote(value)
+                if key in values:
+                    repeated = lists.get(key)
+                    if repeated is None:
+                        lists[key] = [values[key], value]
+                    else:
+                        repeated.append(value)
+                values[key] = value
+        return MultiDict(values, lists)
 
 
-class GetRequest(Request):
+class GetRequest(RequestParser):
 
     @staticmethod
     def get_request_params(environ):
-        query_string = environ['QUERY_STRING']
+        query_string = environ.get('QUERY_STRING', '')
         request_params = GetRequest.parse_input_data(query_string)
         return request_params
 
 
-class PostRequest(Request):
+class PostRequest(RequestParser):
 
-    @staticmethod
-    def get_wsgi_input_data(env) -> bytes:
+    def __init__(self, max_body_size=None):
+        self.max_body_size = max_body_size or MAX_BODY_SIZE
+        self.files = MultiDict()
+
+    def get_content_length(self, env):
         content_length_data = env.get('CONTENT_LENGTH')
-        content_length = int(content_length_data) if content_length_data else 0
+        try:
+            content_length = int(content_length_data) if content_length_data else 0
+        except ValueError:
+            raise BadRequest(f'Wrong Content-Length: {content_length_data}')
+        if content_length > self.max_body_size:
+            raise RequestEntityTooLarge(
+                f'Request body {content_length} bytes, limit is {self.max_body_size}')
+        return content_length
+
+    def get_wsgi_input_data(self, env) -> bytes:
+        content_length = self.get_content_length(env)
         data = env['wsgi.input'].read(content_length) if content_length > 0 else b''
         return data
 
     def parse_wsgi_input_data(self, data: bytes) -> dict:
-        parsed_data = dict()
+        parsed_data = MultiDict()
         if data:
             data_str = data.decode(encoding='utf-8')
             parsed_data = self.parse_input_data(data_str)
         return parsed_data
 
     def get_request_params(self, environ):
+        content_type = environ.get('CONTENT_TYPE', '')
+        if content_type.startswith('multipart/form-data'):
+            parser = MultipartParser(
+                environ['wsgi.input'], self.get_boundary(content_type),
+                self.get_content_length(environ))
+            data, self.files = parser.parse()
+            return data
         data = self.get_wsgi_input_data(environ)
         data = self.parse_wsgi_input_data(data)
         return data
+
+    @staticmethod
+    def get_boundary(content_type):
+        message = HeaderParser().parsestr(f'Content-Type: {content_type}\r\n\r\n')
+        boundary = message.get_param('boundary')
+        if not boundary:
+            raise BadRequest('No boundary in multipart/form-data request')
+        return boundary.encode('latin-1')
+
+
+class LimitedStream:
+    """wsgi.input that can't be read past Content-Length"""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.remaining = limit
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+class Request:
+    """
+    Request passed to views: query, body, headers and cookies
+    are parsed on the first access only and then cached.
+    Old-style access works too: request['data'], request.get('date')
+    """
+
+    __slots__ = ('environ', 'method', 'path', 'path_params', 'extra', 'max_body_size',
+                 '_params', '_data', '_files', '_headers', '_cookies', '_body')
+
+    # keys of the former request dict
+    properties = frozenset(('method', 'path', 'path_params', 'request_params', 'data', 'files'))
+
+    def __init__(self, environ, path=None, max_body_size=None):
+        self.environ = environ
+        self.method = environ['REQUEST_METHOD']
+        self.path = path if path is not None else environ['PATH_INFO']
+        self.path_params = {}
+        # values set by fronts and middleware
+        self.extra = {}
+        self.max_body_size = max_body_size
+        self._params = None
+        self._data = None
+        self._files = None
+        self._headers = None
+        self._cookies = None
+        self._body = None
+
+    @property
+    def params(self):
+        if self._params is None:
+            self._params = GetRequest.get_request_params(self.environ)
+        return self._params
+
+    request_params = params
+
+    def _parse_body(self):
+        if self.method in ('GET', 'HEAD') or self._body is not None:
+            self._data, self._files = MultiDict(), MultiDict()
+            return
+        post_request = PostRequest(self.max_body_size)
+        self._data = post_request.get_request_params(self.environ)
+        self._files = post_request.files
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._parse_body()
+        return self._data
+
+    @property
+    def files(self):
+        if self._files is None:
+            self._parse_body()
+        return self._files
+
+    @property
+    def body(self):
+        """Raw body as a stream limited by Content-Length, instead of data"""
+        if self._body is None:
+            content_length = PostRequest(self.max_body_size).get_content_length(self.environ)
+            self._body = LimitedStream(self.environ['wsgi.input'], content_length)
+        return self._body
+
+    @property
+    def headers(self):
+        """Header names are lower case: request.headers['content-type']"""
+        if self._headers is None:
+            headers = {}
+            for key, value in self.environ.items():
+                if key.startswith('HTTP_'):
+                    headers[key[5:].replace('_', '-').lower()] = value
+                elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                    headers[key.replace('_', '-').lower()] = value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            cookie = SimpleCookie()
+            try:
+                cookie.load(self.environ.get('HTTP_COOKIE', ''))
+            except CookieError:
+                pass
+            self._cookies = {name: morsel.value for name, morsel in cookie.items()}
+        return self._cookies
+
+    def __getitem__(self, key):
+        if key in self.properties:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in ('method', 'path', 'path_params'):
+            setattr(self, key, value)
+        elif key in ('request_params', 'data', 'files'):
+            setattr(self, f'_{key.replace("request_", "")}', value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.properties or key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f'<Request {self.method} {self.path}>'
+
+
+class MultipartParser:
+    """
+    Streaming multipart/form-data parser:
+    the body is read by chunks, files go to SpooledTemporaryFile
+    """
+
+    def __init__(self, stream, boundary: bytes, content_length, chunk_size=CHUNK_SIZE,
+                 max_memory_file_size=MAX_MEMORY_FILE_SIZE):
+        self.stream = stream
+        self.delimiter = b'\r\n--' + boundary
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+        self.max_memory_file_size = max_memory_file_size
+
+    def read(self):
+        if self.remaining <= 0:
+            return b''
+        chunk = self.stream.read(min(self.chunk_size, self.remaining))
+        self.remaining -= len(chunk)
+        if not chunk:
+            self.remaining = 0
+        return chunk
+
+    def parse(self):
+        fields, files = MultiDict(), MultiDict()
+        delimiter = self.delimiter
+        # the first boundary isn't preceded by CRLF
+        buffer = b'\r\n' + self.read()
+        part = None
+
+        while True:
+            if part is None:
+                start = buffer.find(delimiter)
+                while start == -1 or len(buffer) < start + len(delimiter) + 2:
+                    chunk = self.read()
+                    if not chunk:
+                        raise BadRequest('Unexpected end of multipart body')
+                    buffer += chunk
+                    start = buffer.find(delimiter)
+                end = start + len(delimiter)
+                if buffer[end:end + 2] == b'--':
+                    break
+                # CRLF after the boundary, then the part headers
+                buffer = buffer[end + 2:]
+                while b'\r\n\r\n' not in buffer:
+                    chunk = self.read()
+                    if not chunk:
+                        raise BadRequest('Unexpected end of multipart headers')
+                    buffer += chunk
+                headers, buffer = buffer.split(b'\r\n\r\n', 1)
+                part = self.start_part(headers.decode('utf-8'))
+                continue
+
+            end = buffer.find(delimiter)
+            if end == -1:
+                # the delimiter may be split between chunks
+                keep = len(delimiter) - 1
+                if len(buffer) > keep:
+                    part.write(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                chunk = self.read()
+                if not chunk:
+                    raise BadRequest('Unexpected end of multipart part')
+                buffer += chunk
+                continue
+            part.write(buffer[:end])
+            buffer = buffer[end:]
+            part.finish(fields, files)
+            part = None
+        return fields, files
+
+    def start_part(self, headers):
+        message = HeaderParser().parsestr(headers)
+        name = message.get_param('name', header='content-disposition')
+        filename = message.get_param('filename', header='content-disposition')
+        if name is None:
+            raise BadRequest('multipart part without name')
+        if filename is None:
+            return FieldPart(name, message.get_content_charset() or 'utf-8')
+        return FilePart(name, filename, message.get_content_type(), self.max_memory_file_size)
+
+
+class FieldPart:
+
+    def __init__(self, name, charset):
+        self.name = name
+        self.charset = charset
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    def finish(self, fields, files):
+        fields.add(self.name, self.data.decode(self.charset))
+
+
+class FilePart:
+
+    def __init__(self, name, filename, content_type, max_memory_size):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = SpooledTemporaryFile(max_size=max_memory_size)
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def finish(self, fields, files):
+        self.file.seek(0)
+        files.add(self.name, UploadedFile(
+            self.name, self.filename, self.content_type, self.file, self.size))
@@ -1,6 +1,8 @@
-from quopri import decodestring
-
-from framework.http_requests import PostRequest, GetRequest
+from framework.cache import ResponseCache
+from framework.http_requests import Request, HttpError
+from framework.metrics import Profiled, registry
+from framework.middleware import compile_pipeline, wrap_stage
+from framework.routing import Router
 
 
 class PageNotFound404:
@@ -8,13 +10,149 @@ class PageNotFound404:
         return '404 WHAT', '404 PAGE Not Found'
 
 
+class MethodNotAllowed405:
+    def __init__(self, allowed):
+        self.allowed = allowed
+
+    def __call__(self, request):
+        return '405 Method Not Allowed', f'405 Allowed: {", ".join(self.allowed)}'
+
+
 class Framework:
 
-    def __init__(self, routes_obj, fronts_obj):
+    def __init__(self, routes_obj, fronts_obj, cache=None, static=None):
         self.routes_list = routes_obj
         self.fronts_list = fronts_obj
+        # route table is compiled once, views are registered at import time
+        self.router = Router(routes_obj)
+        self.cache = cache if cache is not None else ResponseCache()
+        # StaticFiles: files under its prefix bypass fronts and views
+        self.static = static
+        # Front Controller pattern: fronts are nested around dispatch once
+        self.handler, self.stage_timers = compile_pipeline(
+            self.fronts_list, self.dispatch, self.wrap_stage)
+        # own time of every stage on /metrics
+        registry.register('framework_stage', self.stage_stats)
+
+    wrap_stage = staticmethod(wrap_stage)
+
+    def stage_stats(self):
+        return [({'stage': name}, timer.stats()) for name, timer in self.stage_timers.items()]
 
     def __call__(self, environ, start_response):
+        if self.static is not None and self.static.matches(environ['PATH_INFO']):
+            return self.static(environ, start_response)
+        request = self.get_request(environ)
+        code, headers, body = self.handler(request)
+        self.invalidate_after_commit(request)
+        body = self.encode_body(body)
+        start_response(code, self.length_headers(code, headers, body))
+        return body
+
+    def dispatch(self, request):
+        view = self.get_view(request)
+        response = self.get_cached_response(view, request, request.environ)
+        if response is None:
+            # start controller for request
+            code, body = self.call_view(view, request)
+            response = self.finish_response(view, request, request.environ, code, body)
+        return response
+
+    @staticmethod
+    def content_type(view):
+        """Content type of the view, bodies of text types are utf-8"""
+        content_type = getattr(view, 'content_type', 'text/html')
+        if 'charset' not in content_type and \
+                (content_type.startswith('text/') or content_type == 'application/json'):
+            content_type = f'{content_type}; charset=utf-8'
+        return content_type
+
+    @staticmethod
+    def cache_key(request, environ):
+        return f'{request["path"]}?{environ.get("QUERY_STRING", "")}'
+
+    def get_cached_response(self, view, request, environ):
+        """(code, headers, body) of a cached GET, None when the view has to be called"""
+        if request['method'] != 'GET' or not getattr(view, 'cache_ttl', None):
+            return None
+        entry = self.cache.get(self.cache_key(request, environ))
+        if entry is None:
+            return None
+        return self.cached_response(entry, environ)
+
+    def cached_response(self, entry, environ):
+        headers = [('ETag', entry.etag), ('Cache-Control', 'no-cache')]
+        if self.cache.etag_matches(entry, environ.get('HTTP_IF_NONE_MATCH')):
+            return '304 Not Modified', headers, b''
+        return entry.code, entry.headers + headers, entry.body
+
+    def finish_response(self, view, request, environ, code, body):
+        headers = [('Content-Type', self.content_type(view))]
+        success = code.startswith('2')
+        invalidates = getattr(view, 'invalidates_cache', None)
+        # only writes change the data, GET of a form page leaves the cache alone
+        if success and invalidates and request['method'] not in ('GET', 'HEAD'):
+            # the view has changed the objects in memory already,
+            # the database rows are committed later by the fronts
+            self.invalidate(invalidates)
+            request['invalidates_cache'] = invalidates
+        ttl = getattr(view, 'cache_ttl', None)
+        if success and ttl and request['method'] == 'GET':
+            body = b''.join(self.encode_body(body))
+            entry = self.cache.set(self.cache_key(request, environ), code, headers, body, ttl)
+            return self.cached_response(entry, environ)
+        return code, headers, body
+
+    def invalidate(self, invalidates):
+        if invalidates is True:
+            self.cache.invalidate()
+        else:
+            for prefix in invalidates:
+                self.cache.invalidate(prefix)
+
+    def invalidate_after_commit(self, request):
+        """
+        Called when all the fronts are done, the unit of work is committed:
+        a GET served between the view and the commit could cache the old rows
+        """
+        invalidates = request.get('invalidates_cache')
+        if invalidates:
+            self.invalidate(invalidates)
+
+    @staticmethod
+    def length_headers(code, headers, chunks):
+        """Content-Length of a body known in whole, streamed ones go chunked"""
+        if not isinstance(chunks, list) or code[:3] in ('204', '304'):
+            return headers
+        if any(name.lower() == 'content-length' for name, _ in headers):
+            return headers
+        return headers + [('Content-Length', str(sum(len(chunk) for chunk in chunks)))]
+
+    @staticmethod
+    def encode_body(body):
+        """
+        body may be a str, bytes or an iterable of them (generator, template stream),
+        iterables are sent to the client chunk by chunk
+        """
+        if isinstance(body, str):
+            return [body.encode('utf-8')]
+        if isinstance(body, bytes):
+            return [body]
+        return Framework.iter_chunks(body)
+
+    @staticmethod
+    def iter_chunks(body):
+        try:
+            for chunk in body:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if chunk:
+                    yield chunk
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def get_request(self, environ):
         # get request path
         path = environ['PATH_INFO']
 
@@ -22,41 +160,26 @@ class Framework:
         if not path.endswith('/'):
             path = f'{path}/'
 
-        request = dict()
-        method = environ['REQUEST_METHOD']
-        request['method'] = method
+        # query string and body are parsed only when the view asks for them
+        return Request(environ, path)
 
-        if method == 'POST':
-            data = PostRequest().get_request_params(environ)
-            request['data'] = Framework.decode_value(data)
-            print(f'POST-request: {Framework.decode_value(data)}')
-        if method == 'GET':
-            request_params = GetRequest().get_request_params(environ)
-            request['request_params'] = Framework.decode_value(request_params)
-            print(f'GET-params:'f' {Framework.decode_value(request_params)}')
+    @staticmethod
+    def call_view(view, request):
+        try:
+            # sampled requests are profiled here, in the thread running the view
+            with Profiled():
+                return view(request)
+        except HttpError as e:
+            return e.code, e.message
 
+    def get_view(self, request):
         # Page Controller pattern
-        if path in self.routes_list:
-            view = self.routes_list[path]
-            print(view)
-        else:
-            view = PageNotFound404()
-
-        # Front Controller pattern
-        # request = {}
-        # for front in self.fronts_list:
-        #     front(request)
-
-        # start controller for request
-        code, body = view(request)
-        start_response(code, [('Content-Type', 'text/html')])
-        return [body.encode('utf-8')]
-
-    @staticmethod
-    def decode_value(data):
-        decoded_data = {}
-        for k, v in data.items():
-            value = bytes(v.replace('%', '=').replace("+", " "), 'UTF-8')
-            value_decode_str = decodestring(value).decode('UTF-8')
-            decoded_data[k] = value_decode_str
-        return decoded_data
+        handlers, path_params = self.router.match(request['path'])
+        request['path_params'] = path_params
+        if handlers is None:
+            return PageNotFound404()
+        request['route'] = handlers.url
+        view = handlers.get(request['method']) or handlers.get(Router.ANY)
+        if view is None:
+            return MethodNotAllowed405(sorted(handlers))
+        return view
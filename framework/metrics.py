@@ -0,0 +1,342 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import tracemalloc
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter_ns, strftime
+
+from framework.middleware import Middleware
+
+# upper bounds of histogram buckets, seconds
+BUCKETS = (0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+           0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# time spent in a request by kind: render, db; the view gets the rest
+KINDS = ('total', 'view', 'render', 'db')
+
+# {kind: ns} of the current request, None outside of a request
+current_timings = ContextVar('current_timings', default=None)
+# cProfile.Profile of a sampled request, enabled around the view call
+current_profile = ContextVar('current_profile', default=None)
+
+
+def record(kind, ns):
+    """Adds time to the current request, e.g. record('db', ns)"""
+    timings = current_timings.get()
+    if timings is not None:
+        timings[kind] = timings.get(kind, 0) + ns
+
+
+class Timed:
+    """with Timed('render'): ... - the block time goes to the current request"""
+
+    __slots__ = ('kind', 'start')
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        record(self.kind, perf_counter_ns() - self.start)
+
+
+class Profiled:
+    """
+    with Profiled(): ... - the block runs under the profiler of the current request,
+    in the thread that runs it (the view thread of the ASGI framework)
+    """
+
+    __slots__ = ('profile',)
+
+    def __enter__(self):
+        self.profile = current_profile.get()
+        if self.profile is not None:
+            try:
+                self.profile.enable()
+            except ValueError:
+                # another profiler is active in this thread
+                self.profile = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.profile is not None:
+            self.profile.disable()
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, quantiles are interpolated inside a bucket"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.bounds = [int(bound * 1e9) for bound in buckets]
+        # the last bucket is +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+        self.lock = threading.Lock()
+
+    def observe(self, ns):
+        index = bisect_left(self.bounds, ns)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum_ns += ns
+            if ns > self.max_ns:
+                self.max_ns = ns
+
+    def quantile(self, q):
+        """Seconds"""
+        with self.lock:
+            counts, count, max_ns = list(self.counts), self.count, self.max_ns
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[index - 1] if index else 0
+                upper = self.bounds[index] if index < len(self.bounds) else max_ns
+                upper = min(upper, max_ns)
+                return (lower + (upper - lower) * (rank - seen) / bucket_count) / 1e9
+            seen += bucket_count
+        return max_ns / 1e9
+
+    def cumulative(self):
+        with self.lock:
+            counts = list(self.counts)
+        total = 0
+        for bound, bucket_count in zip(self.bounds + [None], counts):
+            total += bucket_count
+            yield ('+Inf' if bound is None else f'{bound / 1e9:g}'), total
+
+
+class MetricsRegistry:
+    """
+    Histograms by (metric name, labels) and gauges read at export time:
+    register(prefix, collect), collect() gives [(labels, {name: value})]
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.collectors = {}
+        self.lock = threading.Lock()
+
+    def register(self, prefix, collect):
+        """The same prefix registered again replaces the previous collector"""
+        with self.lock:
+            self.collectors[prefix] = collect
+
+    def histogram(self, metric, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe_request(self, route, method, timings):
+        for kind in KINDS:
+            ns = timings.get(kind)
+            if ns is not None:
+                self.histogram('framework_request_duration_seconds',
+                               route=route, method=method, kind=kind).observe(ns)
+
+    @staticmethod
+    def format_labels(labels):
+        return ','.join(f'{name}="{str(value).replace(chr(34), chr(39))}"'
+                        for name, value in labels)
+
+    def gauges(self):
+        """Lines of the registered collectors, a gauge per stats key"""
+        lines = []
+        for prefix, collect in sorted(self.collectors.items()):
+            values = {}
+            for labels, stats in collect():
+                text = self.format_labels(sorted(labels.items()))
+                for key, value in stats.items():
+                    values.setdefault(f'{prefix}_{key}', []).append(
+                        f'{{{text}}} {value:g}' if text else f' {value:g}')
+            for name, samples in values.items():
+                lines.append(f'# TYPE {name} gauge')
+                lines.extend(f'{name}{sample}' for sample in samples)
+        return lines
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        names = sorted({name for name, _ in self.histograms})
+        for name in names:
+            lines.append(f'# TYPE {name} histogram')
+            items = sorted((labels, histogram) for (metric, labels), histogram
+                           in list(self.histograms.items()) if metric == name)
+            for labels, histogram in items:
+                text = self.format_labels(labels)
+                for le, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{{text},le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{{text}}} {histogram.sum_ns / 1e9:.9f}')
+                lines.append(f'{name}_count{{{text}}} {histogram.count}')
+            lines.append(f'# TYPE {name}_quantile gauge')
+            for labels, histogram in items:
+                text = self.format_labels(labels)
+                for q in QUANTILES:
+                    lines.append(f'{name}_quantile{{{text},quantile="{q}"}} '
+                                 f'{histogram.quantile(q):.9f}')
+        lines.extend(self.gauges())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware(Middleware):
+    """
+    Per-route latency: total, render and db time recorded during the request,
+    the view gets the rest. Should be the first front
+    """
+
+    order = -100
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or registry
+        self.tokens = ContextVar('metrics_token', default=None)
+
+    def before_request(self, request):
+        timings = {'start': perf_counter_ns()}
+        self.tokens.set(current_timings.set(timings))
+
+    def after_response(self, request, response):
+        timings = current_timings.get()
+        token = self.tokens.get()
+        if timings is None or token is None:
+            return response
+        current_timings.reset(token)
+        total = perf_counter_ns() - timings.pop('start')
+        timings['total'] = total
+        timings['view'] = max(total - timings.get('render', 0) - timings.get('db', 0), 0)
+        route = request.get('route') or '<unmatched>'
+        self.metrics.observe_request(route, request.method, timings)
+        return response
+
+
+class MemoryTracing:
+    """
+    tracemalloc is process-wide: it's started by the first request that needs it
+    and stopped after the last one, overlapping requests keep it running
+    """
+
+    def __init__(self):
+        self.users = 0
+        self.started = False
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if not self.users:
+                # tracing started by someone else isn't stopped by us
+                self.started = not tracemalloc.is_tracing()
+                if self.started:
+                    tracemalloc.start()
+            self.users += 1
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if not self.users and self.started:
+                self.started = False
+                tracemalloc.stop()
+
+
+memory_tracing = MemoryTracing()
+
+
+class ProfilingMiddleware(Middleware):
+    """
+    Opt-in sampling profiler: a sample_rate share of requests runs under cProfile
+    (and tracemalloc with memory=True), hot spots of requests slower
+    than slow_ms are written to folder. The profiler is enabled around the call
+    of a sync view in the thread that runs it (the thread pool under ASGI),
+    async views share the event loop with other requests and aren't profiled
+    """
+
+    order = -90
+
+    def __init__(self, sample_rate=0.01, slow_ms=500, folder=os.path.join('logs', 'profiles'),
+                 memory=False, top=30):
+        self.sample_rate = sample_rate
+        self.slow_ns = slow_ms * 1_000_000
+        self.folder = folder
+        self.memory = memory
+        self.top = top
+        self.state = ContextVar('profiling_state', default=None)
+        self.lock = threading.Lock()
+
+    def before_request(self, request):
+        if random.random() >= self.sample_rate:
+            self.state.set(None)
+            current_profile.set(None)
+            return
+        snapshot = None
+        if self.memory:
+            memory_tracing.acquire()
+            snapshot = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        self.state.set((profile, snapshot, perf_counter_ns()))
+        current_profile.set(profile)
+
+    def after_response(self, request, response):
+        state = self.finish()
+        if state is None:
+            return response
+        profile, memory_stats, elapsed = state
+        if elapsed >= self.slow_ns:
+            self.dump(request, elapsed, profile, memory_stats)
+        return response
+
+    def on_error(self, request, error):
+        self.finish()
+
+    def finish(self):
+        """(profile, memory stats, elapsed ns) of a sampled request, None for others"""
+        state = self.state.get()
+        if state is None:
+            return None
+        self.state.set(None)
+        current_profile.set(None)
+        profile, snapshot, start = state
+        elapsed = perf_counter_ns() - start
+        memory_stats = None
+        if snapshot is not None:
+            try:
+                memory_stats = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')[:self.top]
+            finally:
+                memory_tracing.release()
+        return profile, memory_stats, elapsed
+
+    def dump(self, request, elapsed, profile, memory_stats):
+        text = io.StringIO()
+        text.write(f'{request.method} {request.path} took {elapsed / 1e6:.2f} ms\n\n')
+        if profile.getstats():
+            pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(self.top)
+        else:
+            # an async view, or the response was given by a cache or a front
+            text.write('no view calls profiled\n')
+        if memory_stats:
+            text.write('\nmemory allocated during the request:\n')
+            for stat in memory_stats:
+                text.write(f'{stat}\n')
+        route = (request.get('route') or request.path).strip('/').replace('/', '_') or 'index'
+        os.makedirs(self.folder, exist_ok=True)
+        file_name = os.path.join(self.folder, f'{strftime("%Y%m%d-%H%M%S")}-{route}-{elapsed}.txt')
+        with self.lock, open(file_name, 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
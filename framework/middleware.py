@@ -0,0 +1,203 @@
+import asyncio
+import contextvars
+import threading
+from time import perf_counter_ns
+
+
+class Middleware:
+    """
+    Front controller stage.
+    before_request may return a response to skip the rest of the chain,
+    after_response may return a changed (code, headers, body) response.
+    An optional complete_response(request, response) does blocking work
+    (a database commit) before after_response: the ASGI framework runs it
+    in its thread pool instead of the event loop.
+    on_error is called when an inner stage, the view or complete_response raises,
+    the exception goes on after it.
+    Stages with lower order run first.
+    """
+
+    order = 0
+
+    def before_request(self, request):
+        return None
+
+    def after_response(self, request, response):
+        return response
+
+    def on_error(self, request, error):
+        pass
+
+
+class FunctionMiddleware(Middleware):
+    """Plain front function front(request) used as a before-request hook"""
+
+    def __init__(self, func):
+        self.func = func
+        self.order = getattr(func, 'order', 0)
+        self.__name__ = getattr(func, '__name__', type(func).__name__)
+
+    def before_request(self, request):
+        return self.func(request)
+
+
+class ClosingBody:
+    """Streamed body calling callback when the server closes it, e.g. to free a connection"""
+
+    def __init__(self, body, callback):
+        self.body = body
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            callback, self.callback = self.callback, None
+            if callback is not None:
+                callback()
+
+
+def as_middleware(front):
+    if hasattr(front, 'before_request') or hasattr(front, 'after_response'):
+        return front
+    return FunctionMiddleware(front)
+
+
+def stage_name(middleware):
+    return getattr(middleware, '__name__', type(middleware).__name__)
+
+
+def normalize_response(response):
+    """(code, body) of a view or (code, headers, body)"""
+    if len(response) == 3:
+        return response
+    code, body = response
+    return code, [('Content-Type', 'text/html')], body
+
+
+class StageTimer:
+    """Own latency of a stage, the inner stages and the view excluded"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.lock = threading.Lock()
+
+    def record(self, ns):
+        with self.lock:
+            self.count += 1
+            self.total_ns += ns
+            if ns > self.max_ns:
+                self.max_ns = ns
+
+    def stats(self):
+        with self.lock:
+            return {
+                'count': self.count,
+                'total_ms': self.total_ns / 1e6,
+                'avg_ms': self.total_ns / self.count / 1e6 if self.count else 0.0,
+                'max_ms': self.max_ns / 1e6,
+            }
+
+
+def compile_pipeline(fronts, handler, wrap):
+    """
+    Nests the stages around handler once, so a request makes
+    plain nested calls. Without fronts the handler itself is returned.
+    wrap(middleware, handler, timer) builds one stage
+    """
+    timers = {}
+    middlewares = sorted((as_middleware(front) for front in fronts),
+                         key=lambda middleware: getattr(middleware, 'order', 0))
+    for middleware in reversed(middlewares):
+        name = stage_name(middleware)
+        if name in timers:
+            name = f'{name}_{len(timers)}'
+        timer = timers[name] = StageTimer(name)
+        handler = wrap(middleware, handler, timer)
+    return handler, timers
+
+
+def wrap_stage(middleware, handler, timer):
+    before = getattr(middleware, 'before_request', None)
+    after = getattr(middleware, 'after_response', None)
+    complete = getattr(middleware, 'complete_response', None)
+    on_error = getattr(middleware, 'on_error', None)
+
+    def stage(request):
+        start = perf_counter_ns()
+        if before is not None:
+            response = before(request)
+            if response is not None:
+                timer.record(perf_counter_ns() - start)
+                return normalize_response(response)
+        inner_start = perf_counter_ns()
+        try:
+            response = handler(request)
+        except Exception as e:
+            if on_error is not None:
+                on_error(request, e)
+            raise
+        inner_ns = perf_counter_ns() - inner_start
+        if complete is not None:
+            try:
+                complete(request, response)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(request, e)
+                raise
+        if after is not None:
+            response = after(request, response) or response
+        timer.record(perf_counter_ns() - start - inner_ns)
+        return response
+
+    return stage
+
+
+def wrap_async_stage(middleware, handler, timer, executor=None):
+    """
+    The same stage for the ASGI framework: hooks are sync, the handler is awaited,
+    complete_response runs in executor (None - the default one of the loop)
+    """
+    before = getattr(middleware, 'before_request', None)
+    after = getattr(middleware, 'after_response', None)
+    complete = getattr(middleware, 'complete_response', None)
+    on_error = getattr(middleware, 'on_error', None)
+
+    async def stage(request):
+        start = perf_counter_ns()
+        if before is not None:
+            response = before(request)
+            if response is not None:
+                timer.record(perf_counter_ns() - start)
+                return normalize_response(response)
+        inner_start = perf_counter_ns()
+        try:
+            response = await handler(request)
+        except Exception as e:
+            if on_error is not None:
+                on_error(request, e)
+            raise
+        inner_ns = perf_counter_ns() - inner_start
+        if complete is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                # context is copied: complete_response sees the request's context variables
+                await loop.run_in_executor(
+                    executor, contextvars.copy_context().run, complete, request, response)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(request, e)
+                raise
+        if after is not None:
+            response = after(request, response) or response
+        timer.record(perf_counter_ns() - start - inner_ns)
+        return response
+
+    return stage
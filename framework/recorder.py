@@ -0,0 +1,73 @@
+import atexit
+import json
+import os
+from base64 import b64encode
+from io import BytesIO
+from time import perf_counter_ns, time
+
+from framework.middleware import Middleware
+
+# request headers kept in the record, they change what the server sends
+RECORDED_HEADERS = ('HTTP_ACCEPT_ENCODING',)
+
+
+class TrafficRecorder(Middleware):
+    """
+    Writes every request as a JSON line: method, path, query, body, status
+    and timing, the file is replayed by python -m benchmarks.loadtest.
+    Bodies over max_body_size (file uploads) are not kept.
+    A line is one write() to a file opened for appending,
+    so forked workers may share the file
+    """
+
+    order = -110
+
+    def __init__(self, file_name=os.path.join('logs', 'traffic.jsonl'), max_body_size=64 * 1024):
+        self.file_name = file_name
+        self.max_body_size = max_body_size
+        self.fd = os.open(file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        atexit.register(os.close, self.fd)
+
+    def before_request(self, request):
+        environ = request.environ
+        body = b''
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if 0 < content_length <= self.max_body_size:
+            # the view reads the body later, it gets the copy
+            body = environ['wsgi.input'].read(content_length)
+            environ['wsgi.input'] = BytesIO(body)
+        request['recorder'] = (perf_counter_ns(), body, content_length)
+
+    def after_response(self, request, response):
+        state = request.get('recorder')
+        if state is None:
+            return response
+        start, body, content_length = state
+        environ = request.environ
+        record = {
+            'ts': round(time(), 3),
+            'method': request.method,
+            'path': environ['PATH_INFO'],
+            'query': environ.get('QUERY_STRING', ''),
+            'route': request.get('route'),
+            'status': int(response[0][:3]),
+            'duration_ms': round((perf_counter_ns() - start) / 1e6, 3),
+        }
+        if content_length:
+            record['content_type'] = environ.get('CONTENT_TYPE', '')
+            if not body:
+                record['skipped_body_size'] = content_length
+            else:
+                try:
+                    record['body'] = body.decode('utf-8')
+                except UnicodeDecodeError:
+                    record['body_base64'] = b64encode(body).decode('ascii')
+        headers = {key[5:].replace('_', '-').lower(): environ[key]
+                   for key in RECORDED_HEADERS if key in environ}
+        if headers:
+            record['headers'] = headers
+        os.write(self.fd, (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        return response
@@ -0,0 +1,150 @@
+import re
+
+
+class Converter:
+    """Typed path segment, e.g. <int:id>"""
+
+    regex = '[^/]+'
+
+    def to_python(self, value):
+        return value
+
+
+class IntConverter(Converter):
+    regex = '[0-9]+'
+
+    def to_python(self, value):
+        return int(value)
+
+
+class SlugConverter(Converter):
+    regex = '[-a-zA-Z0-9_]+'
+
+
+class PathConverter(Converter):
+    """Consumes the rest of the path, slashes included"""
+    regex = '.+'
+
+
+CONVERTERS = {
+    'str': Converter(),
+    'int': IntConverter(),
+    'slug': SlugConverter(),
+    'path': PathConverter(),
+}
+
+PARAM_RE = re.compile(r'^<(?:(?P<converter>\w+):)?(?P<name>\w+)>$')
+
+
+class Handlers(dict):
+    """{method: view} of one route, url is the route pattern"""
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+
+
+class RouteNode:
+    """Node of the prefix trie: one node per path segment"""
+
+    __slots__ = ('static', 'params', 'handlers')
+
+    def __init__(self):
+        self.static = {}
+        # [(name, converter, compiled regex, child node)]
+        self.params = []
+        self.handlers = None
+
+
+class Router:
+    """
+    Route table compiled once at startup.
+
+    Routes without parameters are resolved with a single dict lookup,
+    parametrized ones (/courses/<int:id>/) walk a segment trie, so the
+    lookup cost depends on the path depth and not on the number of routes.
+    A route target is either a view or a dict {method: view}.
+    """
+
+    ANY = '*'
+
+    def __init__(self, routes=None):
+        self.static = {}
+        self.root = RouteNode()
+        for url, target in (routes or {}).items():
+            self.add(url, target)
+
+    @staticmethod
+    def normalize(target):
+        if isinstance(target, dict):
+            return {method.upper(): view for method, view in target.items()}
+        return {Router.ANY: target}
+
+    def add(self, url, target):
+        handlers = self.normalize(target)
+        segments = self.split(url)
+        if not any(PARAM_RE.match(segment) for segment in segments):
+            self.static.setdefault(url, Handlers(url)).update(handlers)
+            return
+
+        node = self.root
+        for segment in segments:
+            param = PARAM_RE.match(segment)
+            if param is None:
+                node = node.static.setdefault(segment, RouteNode())
+                continue
+            name = param.group('name')
+            converter_name = param.group('converter') or 'str'
+            try:
+                converter = CONVERTERS[converter_name]
+            except KeyError:
+                raise ValueError(f'Unknown converter "{converter_name}" in {url}')
+            for param_name, param_converter, _, child in node.params:
+                if param_name == name and param_converter is converter:
+                    node = child
+                    break
+            else:
+                child = RouteNode()
+                regex = re.compile(converter.regex)
+                node.params.append((name, converter, regex, child))
+                node = child
+        if node.handlers is None:
+            node.handlers = Handlers(url)
+        node.handlers.update(handlers)
+
+    @staticmethod
+    def split(path):
+        return [segment for segment in path.split('/') if segment]
+
+    def match(self, path):
+        """Returns (handlers, path params) or (None, {})"""
+        handlers = self.static.get(path)
+        if handlers is not None:
+            return handlers, {}
+        params = {}
+        handlers = self._walk(self.root, self.split(path), 0, params)
+        return handlers, params
+
+    def _walk(self, node, segments, index, params):
+        if index == len(segments):
+            return node.handlers
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            handlers = self._walk(child, segments, index + 1, params)
+            if handlers is not None:
+                return handlers
+        for name, converter, regex, child in node.params:
+            if isinstance(converter, PathConverter):
+                rest = '/'.join(segments[index:])
+                if child.handlers is not None and regex.fullmatch(rest):
+                    params[name] = converter.to_python(rest)
+                    return child.handlers
+                continue
+            if regex.fullmatch(segment):
+                params[name] = converter.to_python(segment)
+                handlers = self._walk(child, segments, index + 1, params)
+                if handlers is not None:
+                    return handlers
+                del params[name]
+        return None
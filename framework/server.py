@@ -0,0 +1,504 @@
+"""
+Prefork WSGI server: the master loads the application once, then forks
+workers that accept connections on one shared socket (or on their own
+SO_REUSEPORT sockets). Workers speak HTTP/1.1 with keep-alive and may
+serve connections by a pool of threads.
+
+SIGHUP - graceful reload: new workers are started, the old ones finish
+their requests and exit. SIGTERM / SIGINT - graceful stop.
+
+Every worker has its own copy of what the application keeps in memory
+(the Engine with categories and courses, the response cache), so one worker
+is started by default: with more of them a category created on one worker
+isn't seen by the others. Start several only for an application whose state
+is in the database.
+
+python -m framework.server simple_wsgi:application --threads 8
+"""
+import argparse
+import gc
+import os
+import selectors
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from importlib import import_module
+from time import monotonic, sleep
+from urllib.parse import unquote
+from wsgiref import util
+
+from framework.http_requests import LimitedStream
+
+KEEP_ALIVE_TIMEOUT = 5
+GRACEFUL_TIMEOUT = 30
+BACKLOG = 1024
+# socket buffer the response headers and the first chunks are gathered into
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def load_application(target):
+    """'module:attribute', the attribute defaults to application"""
+    module_name, _, attribute = target.partition(':')
+    module = import_module(module_name)
+    return getattr(module, attribute or 'application')
+
+
+class FileWrapper(util.FileWrapper):
+    """wsgi.file_wrapper: a file body the worker sends by sendfile()"""
+
+
+class WSGIRequestHandler(BaseHTTPRequestHandler):
+    """One connection: HTTP/1.1 requests until the client or the server closes it"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'TKvitko'
+    timeout = KEEP_ALIVE_TIMEOUT
+    wbufsize = WRITE_BUFFER_SIZE
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+            if len(self.raw_requestline) > 65536:
+                self.send_error(414)
+                return
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if not self.parse_request():
+                return
+            self.run_application()
+            self.wfile.flush()
+        except TimeoutError:
+            # the keep-alive connection was idle for too long
+            self.close_connection = True
+
+    def get_environ(self):
+        path, _, query = self.path.partition('?')
+        environ = {
+            'REQUEST_METHOD': self.command,
+            # PEP 3333: bytes of the decoded path as latin-1
+            'PATH_INFO': unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0] if self.client_address else '',
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': self.headers.get('Content-Length', ''),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': self.server.threads > 1,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        for name, value in self.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                continue
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def run_application(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.send_error(411, 'Chunked request bodies are not supported')
+            self.close_connection = True
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_error(400, 'Wrong Content-Length')
+            self.close_connection = True
+            return
+        environ = self.get_environ()
+        body = LimitedStream(self.rfile, content_length)
+        environ['wsgi.input'] = body
+        if self.server.stopping:
+            self.close_connection = True
+
+        response = ResponseWriter(self)
+        try:
+            result = self.server.application(environ, response.start_response)
+            try:
+                response.write_result(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except Exception:
+            self.log_error('application error on %s', self.path)
+            sys.excepthook(*sys.exc_info())
+            if not response.headers_sent:
+                response.send_server_error()
+            # the client can't tell where a broken response ends
+            self.close_connection = True
+            return
+        # the unread rest of the body would be taken for the next request
+        if body.remaining > 0:
+            for _ in body:
+                pass
+
+    def log_request(self, code='-', size='-'):
+        if self.server.access_log:
+            super().log_request(code, size)
+
+
+class ResponseWriter:
+    """start_response() and the body: Content-Length when known, chunked otherwise"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+        self.chunked = False
+        self.send_body = handler.command != 'HEAD'
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info is not None:
+            try:
+                if self.headers_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise AssertionError('start_response() was called twice')
+        self.status = status
+        self.headers = list(headers)
+        return self.write
+
+    def send_headers(self, content_length=None):
+        handler = self.handler
+        names = {name.lower() for name, _ in self.headers}
+        if 'content-length' not in names:
+            if content_length is not None:
+                self.headers.append(('Content-Length', str(content_length)))
+            elif handler.request_version == 'HTTP/1.1':
+                self.headers.append(('Transfer-Encoding', 'chunked'))
+                self.chunked = self.send_body
+            else:
+                # HTTP/1.0 client: the end of the body is the end of the connection
+                handler.close_connection = True
+        if handler.close_connection:
+            self.headers.append(('Connection', 'close'))
+        elif handler.request_version == 'HTTP/1.0':
+            self.headers.append(('Connection', 'keep-alive'))
+        lines = [f'{handler.protocol_version} {self.status}\r\n']
+        if 'date' not in names:
+            lines.append(f'Date: {handler.date_time_string()}\r\n')
+        if 'server' not in names:
+            lines.append(f'Server: {handler.server_version}\r\n')
+        lines.extend(f'{name}: {value}\r\n' for name, value in self.headers)
+        lines.append('\r\n')
+        handler.wfile.write(''.join(lines).encode('latin-1'))
+        self.headers_sent = True
+        code = self.status.split(' ', 1)[0]
+        handler.log_request(code, content_length if content_length is not None else '-')
+
+    def write(self, data):
+        if self.status is None:
+            raise AssertionError('write() before start_response()')
+        if not self.headers_sent:
+            self.send_headers()
+        if not data or not self.send_body:
+            return
+        wfile = self.handler.wfile
+        if self.chunked:
+            wfile.write(b'%x\r\n' % len(data))
+            wfile.write(data)
+            wfile.write(b'\r\n')
+        else:
+            wfile.write(data)
+
+    def write_result(self, result):
+        if isinstance(result, FileWrapper) and self.send_file(result):
+            return
+        if isinstance(result, (list, tuple)):
+            # the whole body is known: one write with Content-Length
+            if not self.headers_sent:
+                self.send_headers(sum(len(chunk) for chunk in result))
+            for chunk in result:
+                self.write(chunk)
+        else:
+            for chunk in result:
+                self.write(chunk)
+        if not self.headers_sent:
+            self.send_headers(0)
+        if self.chunked:
+            self.handler.wfile.write(b'0\r\n\r\n')
+
+    def send_file(self, result):
+        """The file goes from the page cache to the socket, without Python buffers"""
+        content_length = next((value for name, value in self.headers
+                               if name.lower() == 'content-length'), None)
+        if content_length is None or self.headers_sent or not hasattr(result.filelike, 'fileno'):
+            return False
+        self.send_headers()
+        if self.send_body:
+            self.handler.wfile.flush()
+            self.handler.connection.sendfile(result.filelike, result.filelike.tell(),
+                                             int(content_length))
+        return True
+
+    def send_server_error(self):
+        body = b'Internal Server Error'
+        self.status = '500 Internal Server Error'
+        self.headers = [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))]
+        self.handler.close_connection = True
+        self.send_headers()
+        if self.send_body:
+            self.handler.wfile.write(body)
+
+
+class Worker:
+    """Child process: accepts connections, threads > 1 serve them by a thread pool"""
+
+    def __init__(self, application, sock, threads=1, access_log=False):
+        self.application = application
+        self.socket = sock
+        self.threads = threads
+        self.access_log = access_log
+        self.server_name, self.server_port = sock.getsockname()[:2]
+        self.stopping = False
+        # a connection is accepted only when a thread is free to serve it
+        self.slots = threading.Semaphore(threads)
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        executor = ThreadPoolExecutor(self.threads, thread_name_prefix='worker') \
+            if self.threads > 1 else None
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        try:
+            while not self.stopping:
+                if not self.slots.acquire(timeout=0.5):
+                    continue
+                connection = None
+                while connection is None and not self.stopping:
+                    if selector.select(timeout=0.5):
+                        try:
+                            connection, address = self.socket.accept()
+                        except (BlockingIOError, InterruptedError):
+                            # another worker took it
+                            pass
+                if connection is None:
+                    self.slots.release()
+                    break
+                if executor is None:
+                    self.handle(connection, address)
+                else:
+                    executor.submit(self.handle, connection, address)
+        finally:
+            selector.close()
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def handle(self, connection, address):
+        try:
+            connection.setblocking(True)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            WSGIRequestHandler(connection, address, self)
+        except OSError:
+            # the client went away
+            pass
+        finally:
+            try:
+                connection.close()
+            finally:
+                self.slots.release()
+
+
+class PreforkServer:
+    """
+    Master process: binds the socket, loads the application,
+    forks workers and keeps their number, reloads them on SIGHUP
+    """
+
+    def __init__(self, application, host='', port=8080, workers=None, threads=1,
+                 reuse_port=None, preload=True, graceful_timeout=GRACEFUL_TIMEOUT,
+                 access_log=False):
+        # application or 'module:attribute', without preload every worker
+        # imports it, so the code is reloaded on SIGHUP
+        self.application = application
+        self.host = host
+        self.port = port
+        # workers don't share memory, see the module docstring
+        self.workers = workers or 1
+        self.threads = max(threads, 1)
+        if reuse_port is None:
+            reuse_port = hasattr(socket, 'SO_REUSEPORT') and sys.platform.startswith('linux')
+        self.reuse_port = reuse_port
+        self.preload = preload
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.socket = None
+        # pid -> generation, workers of older generations are being stopped
+        self.children = {}
+        self.generation = 0
+        self.stopping = False
+        self.reload_requested = False
+
+    def create_socket(self, listen):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        if listen:
+            sock.listen(BACKLOG)
+        sock.setblocking(False)
+        return sock
+
+    def get_application(self):
+        if isinstance(self.application, str):
+            return load_application(self.application)
+        return self.application
+
+    def prepare(self):
+        """Everything workers share is created before fork"""
+        # with SO_REUSEPORT the master only holds the port, workers listen on their own sockets
+        self.socket = self.create_socket(listen=not self.reuse_port)
+        self.port = self.socket.getsockname()[1]
+        if self.preload:
+            self.application = self.get_application()
+        # objects of the master are never freed in workers:
+        # without gc.freeze() collections would write to their pages and copy them
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return
+        # worker
+        code = 0
+        try:
+            sock = self.create_socket(listen=True) if self.reuse_port else self.socket
+            application = self.application if self.preload else self.get_application()
+            Worker(application, sock, self.threads, self.access_log).run()
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def serve_forever(self):
+        self.prepare()
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        print(f'Master {os.getpid()}: http://{self.host or "0.0.0.0"}:{self.port}, '
+              f'{self.workers} workers x {self.threads} threads'
+              f'{", SO_REUSEPORT" if self.reuse_port else ""}')
+        if self.workers > 1:
+            print(f'Master {os.getpid()}: warning: {self.workers} workers keep their own '
+                  f'in-memory state (site, response cache), data created on one worker '
+                  f'is not visible on the others', file=sys.stderr)
+        for _ in range(self.workers):
+            self.spawn()
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload()
+                self.reap()
+                current = sum(1 for generation in self.children.values()
+                              if generation == self.generation)
+                for _ in range(self.workers - current):
+                    self.spawn()
+                sleep(0.2)
+        finally:
+            self.stop()
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if not pid:
+                return
+            self.children.pop(pid, None)
+
+    def reload(self):
+        """New workers are started first, so the socket is served all the time"""
+        self.reload_requested = False
+        old = [pid for pid, generation in self.children.items()
+               if generation == self.generation]
+        self.generation += 1
+        print(f'Master {os.getpid()}: reloading workers')
+        for _ in range(self.workers):
+            self.spawn()
+        self.kill(old, signal.SIGTERM)
+
+    def kill(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def stop(self):
+        self.kill(list(self.children), signal.SIGTERM)
+        deadline = monotonic() + self.graceful_timeout
+        while self.children and monotonic() < deadline:
+            self.reap()
+            sleep(0.1)
+        self.kill(list(self.children), signal.SIGKILL)
+        while self.children:
+            self.reap()
+            sleep(0.05)
+        self.socket.close()
+
+
+def add_arguments(parser):
+    parser.add_argument('--host', default='', help='interface to bind, all by default')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, each keeps its own in-memory state')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker')
+    parser.add_argument('--no-reuse-port', action='store_true',
+                        help='share one listening socket instead of SO_REUSEPORT')
+    parser.add_argument('--no-preload', action='store_true',
+                        help='workers import the application, SIGHUP reloads the code')
+    parser.add_argument('--access-log', action='store_true')
+
+
+def serve(application, args):
+    PreforkServer(application, host=args.host, port=args.port, workers=args.workers,
+                  threads=args.threads, reuse_port=False if args.no_reuse_port else None,
+                  preload=not args.no_preload, access_log=args.access_log).serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prefork WSGI server')
+    parser.add_argument('application', help='module:attribute, e.g. simple_wsgi:application')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    # a database connection per thread, the application reads it on import
+    os.environ.setdefault('DB_POOL_SIZE', str(max(8, args.threads)))
+    sys.path.insert(0, os.getcwd())
+    serve(args.application, args)
+
+
+if __name__ == '__main__':
+    main()
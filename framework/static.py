@@ -0,0 +1,193 @@
+import gzip
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import sha1
+from wsgiref.util import FileWrapper
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from framework.http_requests import CHUNK_SIZE
+
+# check files for changes on every request (in production - off)
+AUTO_RELOAD = os.environ.get('STATIC_AUTO_RELOAD', '1') != '0'
+# fingerprinted urls never change, browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml')
+# smaller files aren't compressed, the headers would eat the gain
+MIN_COMPRESS_SIZE = 512
+
+
+class StaticAsset:
+    """A file with its validators and compressed variants, read once"""
+
+    __slots__ = ('name', 'path', 'content_type', 'size', 'mtime', 'last_modified',
+                 'digest', 'hashed_name', 'variants')
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        content_type, _ = mimetypes.guess_type(name)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        with open(path, 'rb') as f:
+            data = f.read()
+        stat = os.stat(path)
+        self.size = len(data)
+        self.mtime = stat.st_mtime
+        self.last_modified = formatdate(int(stat.st_mtime), usegmt=True)
+        self.digest = sha1(data).hexdigest()
+        root, ext = os.path.splitext(name)
+        self.hashed_name = f'{root}.{self.digest[:10]}{ext}'
+        # {encoding: compressed bytes}, only the ones that are really smaller
+        self.variants = {}
+        if self.size >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            self.variants['gzip'] = self.read_variant(path + '.gz') or \
+                gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants['br'] = self.read_variant(path + '.br') or brotli.compress(data)
+            for encoding, compressed in list(self.variants.items()):
+                if len(compressed) >= self.size * 0.9:
+                    del self.variants[encoding]
+
+    @staticmethod
+    def read_variant(path):
+        """Precompressed file next to the original, made by a build step"""
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        return None
+
+    def etag(self, encoding=None):
+        return f'"{self.digest[:20]}-{encoding}"' if encoding else f'"{self.digest[:20]}"'
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+
+class StaticFiles:
+    """
+    Files of folder served under prefix, mounted with Framework(..., static=StaticFiles()).
+    The folder is scanned once: ETag, Last-Modified, gzip (and brotli, when the
+    module is installed) variants are prepared at startup. url('style.css') gives
+    a fingerprinted url, /static/style.<hash>.css, which is cached for a year
+    """
+
+    def __init__(self, folder='static', prefix='/static/', auto_reload=None):
+        self.folder = folder
+        self.prefix = prefix if prefix.endswith('/') else prefix + '/'
+        self.auto_reload = AUTO_RELOAD if auto_reload is None else auto_reload
+        self.scan()
+
+    def scan(self):
+        """{url name: (asset, fingerprinted)} for every file of the folder"""
+        assets = {}
+        for root, _, files in os.walk(self.folder):
+            for file_name in files:
+                if file_name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                asset = StaticAsset(name, path)
+                assets[name] = (asset, False)
+                assets[asset.hashed_name] = (asset, True)
+        self.assets = assets
+
+    def url(self, name):
+        """Fingerprinted url of the file, for templates: {{ static('style.css') }}"""
+        entry = self.get_asset(name)
+        return f'{self.prefix}{entry[0].hashed_name if entry else name}'
+
+    def get_asset(self, name):
+        """(asset, fingerprinted) or None, a changed file is read again"""
+        entry = self.assets.get(name)
+        if entry is not None and self.auto_reload and entry[0].is_stale():
+            self.scan()
+            entry = self.assets.get(name)
+        return entry
+
+    def matches(self, path):
+        return path.startswith(self.prefix)
+
+    @staticmethod
+    def choose_encoding(asset, accept_encoding):
+        if not asset.variants or not accept_encoding:
+            return None
+        accepted = set()
+        for item in accept_encoding.split(','):
+            coding, _, params = item.strip().partition(';')
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            accepted.add(coding.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.variants and encoding in accepted:
+                return encoding
+        return None
+
+    @staticmethod
+    def not_modified(asset, etag, environ):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                return int(asset.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def get_response(self, environ):
+        """(code, headers, body), body is bytes or an open file"""
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            return '405 Method Not Allowed', [('Allow', 'GET, HEAD')], b''
+        name = environ['PATH_INFO'][len(self.prefix):]
+        entry = self.get_asset(name)
+        if entry is None:
+            return '404 Not Found', [('Content-Type', 'text/plain')], b'404 File Not Found'
+        asset, fingerprinted = entry
+
+        encoding = self.choose_encoding(asset, environ.get('HTTP_ACCEPT_ENCODING'))
+        etag = asset.etag(encoding)
+        headers = [
+            ('ETag', etag),
+            ('Last-Modified', asset.last_modified),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL),
+        ]
+        if asset.variants:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if self.not_modified(asset, etag, environ):
+            return '304 Not Modified', headers, b''
+
+        headers.append(('Content-Type', asset.content_type))
+        if encoding is not None:
+            body = asset.variants[encoding]
+            headers.append(('Content-Encoding', encoding))
+            headers.append(('Content-Length', str(len(body))))
+            return '200 OK', headers, body if method == 'GET' else b''
+        headers.append(('Content-Length', str(asset.size)))
+        if method == 'HEAD':
+            return '200 OK', headers, b''
+        return '200 OK', headers, open(asset.path, 'rb')
+
+    def __call__(self, environ, start_response):
+        code, headers, body = self.get_response(environ)
+        start_response(code, headers)
+        if isinstance(body, bytes):
+            return [body]
+        # the server may send the file with sendfile()
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(body, CHUNK_SIZE)
@@ -1,22 +1,121 @@
 import os
 
-from jinja2 import Template
-from jinja2 import FileSystemLoader
+from jinja2 import FileSystemLoader, FileSystemBytecodeCache
 from jinja2.environment import Environment
 
+from framework.metrics import Timed
+
+# перечитывать ли шаблоны с диска при их изменении (в продакшене - выключить)
+AUTO_RELOAD = os.environ.get('TEMPLATES_AUTO_RELOAD', '1') != '0'
+# сколько скомпилированных шаблонов держать в памяти на одно окружение
+CACHE_SIZE = 400
+# папка для байткода шаблонов, None - временная папка системы
+BYTECODE_CACHE_DIR = os.environ.get('TEMPLATES_BYTECODE_CACHE')
+
+# сколько событий шаблона собирать в один кусок при потоковом рендеринге
+STREAM_BUFFER_SIZE = 64
+
+# окружения на весь процесс, ключ - папка с шаблонами
+environments = {}
+
+
+def static(name):
+    """
+    Адрес статического файла без отпечатка, пока StaticFiles
+    не зарегистрировал свой static() через add_global
+    :param name: путь файла внутри папки static
+    """
+    return f'/static/{name}'
+
+
+# функции и значения, доступные во всех шаблонах, например static()
+template_globals = {'static': static}
+
+
+def add_global(name, value):
+    """
+    Регистрация глобальной переменной шаблонов, в т.ч. для созданных окружений
+    :param name: имя в шаблоне
+    :param value: значение или функция
+    """
+    template_globals[name] = value
+    for env in environments.values():
+        env.globals[name] = value
+
+
+def configure(auto_reload=None, cache_size=None, bytecode_cache_dir=None):
+    """
+    Изменение настроек шаблонизатора, созданные окружения сбрасываются
+    :param auto_reload: проверять ли изменение файлов шаблонов
+    :param cache_size: размер кэша скомпилированных шаблонов
+    :param bytecode_cache_dir: папка для байткода шаблонов
+    """
+    global AUTO_RELOAD, CACHE_SIZE, BYTECODE_CACHE_DIR
+    if auto_reload is not None:
+        AUTO_RELOAD = auto_reload
+    if cache_size is not None:
+        CACHE_SIZE = cache_size
+    if bytecode_cache_dir is not None:
+        BYTECODE_CACHE_DIR = bytecode_cache_dir
+    environments.clear()
+
+
+def get_environment(folder='templates'):
+    """
+    Окружение для папки создается один раз и переиспользуется,
+    чтобы не терять кэш скомпилированных шаблонов между запросами
+    :param folder: папка с шаблонами
+    :return: окружение jinja2
+    """
+    env = environments.get(folder)
+    if env is None:
+        if BYTECODE_CACHE_DIR:
+            os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+        env = Environment(
+            loader=FileSystemLoader(folder),
+            auto_reload=AUTO_RELOAD,
+            cache_size=CACHE_SIZE,
+            bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+        )
+        env.globals.update(template_globals)
+        env = environments.setdefault(folder, env)
+    return env
+
+
+def precompile(folder='templates'):
+    """
+    Прогрев: компилирует все шаблоны папки при старте сервера
+    :param folder: папка с шаблонами
+    :return: количество скомпилированных шаблонов
+    """
+    env = get_environment(folder)
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
 
 def render(template_name, folder='templates', **kwargs):
     """
-    Минимальный пример работы с шаблонизатором
+    Рендеринг шаблона через общее окружение папки
     :param template_name: имя шаблона
     :param kwargs: параметры для передачи в шаблон
     :return:
     """
+    with Timed('render'):
+        template = get_environment(folder).get_template(template_name)
+        return template.render(**kwargs)
 
-    # создаем объект окружения
-    env = Environment()
-    # указываем папку для поиска шаблонов
-    env.loader = FileSystemLoader(folder)
-    # находим шаблон в окружении
-    template = env.get_template(template_name)
-    return template.render(**kwargs)
+
+def stream_render(template_name, folder='templates', **kwargs):
+    """
+    Потоковый рендеринг: страница отдается частями по мере генерации,
+    не собираясь целиком в памяти
+    :param template_name: имя шаблона
+    :param kwargs: параметры для передачи в шаблон
+    :return: итератор по кускам страницы
+    """
+    template = get_environment(folder).get_template(template_name)
+    stream = template.stream(**kwargs)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream
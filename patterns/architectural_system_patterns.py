@@ -1,14 +1,23 @@
-from threading import local
+from array import array
+from contextvars import ContextVar
+from threading import Lock
+
+from framework.middleware import ClosingBody, Middleware
 
 
 class UnitOfWork:
-    """Architectural system pattern Unit of Work"""
-    current = local()
+    """
+    Architectural system pattern Unit of Work.
+    The current one is a context variable: every request thread
+    and every asyncio task has its own
+    """
+    current = ContextVar('unit_of_work', default=None)
 
     def __init__(self):
         self.new_objects = []
         self.dirty_objects = []
         self.removed_objects = []
+        self.identity_map = IdentityMap()
 
     def set_mapper_registry(self, MapperRegistry):
         self.MapperRegistry = MapperRegistry
@@ -23,42 +32,386 @@ class UnitOfWork:
         self.removed_objects.append(obj)
 
     def commit(self):
-        self.insert_new()
-        self.update_dirty()
-        self.delete_removed()
+        """
+        All pending changes go in one transaction:
+        objects are grouped by mapper, every group is one executemany.
+        BEGIN IMMEDIATE takes the write lock before the first insert,
+        sqlite has a single writer, so ids of a batch are consecutive
+        and insert_many counts them back from last_insert_rowid()
+        """
+        batches = self.get_batches()
+        connections = {id(mapper.connection): mapper.connection
+                       for mapper, _, _, _ in batches}.values()
+        try:
+            for connection in connections:
+                if not connection.in_transaction:
+                    connection.execute('BEGIN IMMEDIATE')
+            inserted = []
+            for mapper, new, dirty, removed in batches:
+                if new:
+                    inserted.append((mapper, new, mapper.insert_many(new)))
+                if dirty:
+                    mapper.update_many(dirty)
+                if removed:
+                    mapper.delete_many(removed)
+            for connection in connections:
+                connection.commit()
+        except Exception:
+            for connection in connections:
+                connection.rollback()
+            raise
+        finally:
+            self.rollback()
+
+        # generated ids are written back only when the transaction is committed
+        for mapper, objects, ids in inserted:
+            for obj, obj_id in zip(objects, ids):
+                if obj_id is None:
+                    continue
+                obj.id = obj_id
+                self.identity_map.add(mapper.tablename, obj_id, obj)
+        for mapper, _, _, removed in batches:
+            for obj in removed:
+                self.identity_map.remove(mapper.tablename, getattr(obj, 'id', None))
 
+    def rollback(self):
         self.new_objects.clear()
         self.dirty_objects.clear()
         self.removed_objects.clear()
 
-    def insert_new(self):
-        print(self.new_objects)
-        for obj in self.new_objects:
-            print(f"Вывожу {self.MapperRegistry}")
-            self.MapperRegistry.get_mapper(obj).insert(obj)
-
-    def update_dirty(self):
-        for obj in self.dirty_objects:
-            self.MapperRegistry.get_mapper(obj).update(obj)
-
-    def delete_removed(self):
-        for obj in self.removed_objects:
-            self.MapperRegistry.get_mapper(obj).delete(obj)
+    def get_batches(self):
+        """[(mapper, new objects, dirty objects, removed objects)], one mapper per class"""
+        batches = {}
+        for position, objects in enumerate(
+                (self.new_objects, self.dirty_objects, self.removed_objects)):
+            for obj in objects:
+                batch = batches.get(type(obj))
+                if batch is None:
+                    mapper = self.MapperRegistry.get_mapper(obj)
+                    batch = batches[type(obj)] = (mapper, [], [], [])
+                batch[position + 1].append(obj)
+        return list(batches.values())
 
     @staticmethod
     def new_current():
-        __class__.set_current(UnitOfWork())
+        unit_of_work = UnitOfWork()
+        __class__.set_current(unit_of_work)
+        return unit_of_work
 
     @classmethod
     def set_current(cls, unit_of_work):
-        cls.current.unit_of_work = unit_of_work
+        """Returns a token for UnitOfWork.current.reset()"""
+        return cls.current.set(unit_of_work)
 
     @classmethod
     def get_current(cls):
-        return cls.current.unit_of_work
+        return cls.current.get()
+
+
+class UnitOfWorkMiddleware(Middleware):
+    """
+    Unit of Work per request: changes registered by the view are committed
+    after a successful response, rolled back after an error response or an exception.
+    The request checks a connection out of the pool on its first query,
+    the connection goes back after the response (after a streamed body is sent)
+    """
+
+    order = -50
+
+    def __init__(self, mapper_registry):
+        self.mapper_registry = mapper_registry
+        # (unit of work token, pool, pool token)
+        self.tokens = ContextVar('unit_of_work_token', default=None)
+
+    def before_request(self, request):
+        unit_of_work = UnitOfWork()
+        unit_of_work.set_mapper_registry(self.mapper_registry)
+        pool = self.mapper_registry.pool
+        self.tokens.set((UnitOfWork.set_current(unit_of_work), pool, pool.begin_request()))
+
+    def complete_response(self, request, response):
+        # blocking sqlite commit, the ASGI framework calls it in the thread pool
+        unit_of_work = UnitOfWork.get_current()
+        if unit_of_work is None:
+            return
+        if str(response[0]).startswith(('4', '5')):
+            unit_of_work.rollback()
+        else:
+            unit_of_work.commit()
+
+    def after_response(self, request, response):
+        code, headers, body = response
+        if isinstance(body, (str, bytes)) or hasattr(body, '__aiter__'):
+            self.close()
+            return response
+        # rows of a streamed body are fetched while it's sent
+        checkout = self.close(release=False)
+        if checkout is None:
+            return response
+        return code, headers, StreamedBody(body, checkout)
+
+    def on_error(self, request, error):
+        unit_of_work = UnitOfWork.get_current()
+        if unit_of_work is not None:
+            unit_of_work.rollback()
+        self.close()
+
+    def close(self, release=True):
+        """Resets the context of the request, returns the connection checkout"""
+        tokens = self.tokens.get()
+        if tokens is None:
+            return None
+        self.tokens.set(None)
+        token, pool, pool_token = tokens
+        try:
+            UnitOfWork.current.reset(token)
+        except ValueError:
+            # the token was made in another context
+            UnitOfWork.current.set(None)
+        return pool.end_request(pool_token, release)
+
+
+class StreamedBody(ClosingBody):
+    """
+    Body rendered while it's sent: queries of the template (lazy collections)
+    go through the connection of the request, it's released when the body is closed
+    """
+
+    def __init__(self, body, checkout):
+        super().__init__(body, checkout.release)
+        self.checkout = checkout
+
+    def __iter__(self):
+        iterator = iter(self.body)
+        request_checkout = self.checkout.pool.request_checkout
+        while True:
+            token = request_checkout.set(self.checkout)
+            try:
+                chunk = next(iterator, None)
+            finally:
+                request_checkout.reset(token)
+            if chunk is None:
+                return
+            yield chunk
+
+
+class IdentityMap:
+    """Architectural system pattern Identity Map: one object per (table, id)"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get(self, table, id):
+        return self.objects.get((table, id))
+
+    def add(self, table, id, obj):
+        self.objects[(table, id)] = obj
+
+    def remove(self, table, id):
+        self.objects.pop((table, id), None)
+
+    def clear(self):
+        self.objects.clear()
+
+    def __len__(self):
+        return len(self.objects)
+
+
+class AssociationTable:
+    """
+    Architectural system pattern Association Table Mapping:
+    many-to-many links (students - courses) are kept once, in a few flat arrays
+    of integer handles, instead of object lists on both sides. An object gets its
+    handle on the first link, the handle is stored in its attr attribute (a slot).
+    Every link is two edges, the edges of an object are chained by next_edges
+    """
+
+    def __init__(self, attr='handle'):
+        self.attr = attr
+        # handle -> object, handle -> its last edge or -1
+        self.objects = []
+        self.heads = array('i')
+        # edge -> partner handle, edge -> previous edge of the same object or -1
+        self.targets = array('I')
+        self.next_edges = array('i')
+        # chain of removed edges to reuse
+        self.free_edge = -1
+        # handles of discarded objects to reuse
+        self.free_handles = []
+        self.count = 0
+        self.lock = Lock()
+
+    def get_handle(self, obj):
+        handle = getattr(obj, self.attr, None)
+        if handle is None:
+            if self.free_handles:
+                handle = self.free_handles.pop()
+                self.objects[handle] = obj
+            else:
+                handle = len(self.objects)
+                self.objects.append(obj)
+                self.heads.append(-1)
+            setattr(obj, self.attr, handle)
+        return handle
+
+    def iter_partners(self, handle):
+        """Partner handles, the last linked first"""
+        targets, next_edges = self.targets, self.next_edges
+        edge = self.heads[handle]
+        while edge != -1:
+            yield targets[edge]
+            edge = next_edges[edge]
+
+    def add_edge(self, handle, partner):
+        edge = self.free_edge
+        if edge == -1:
+            edge = len(self.targets)
+            self.targets.append(partner)
+            self.next_edges.append(self.heads[handle])
+        else:
+            self.free_edge = self.next_edges[edge]
+            self.targets[edge] = partner
+            self.next_edges[edge] = self.heads[handle]
+        self.heads[handle] = edge
+
+    def remove_edge(self, handle, partner):
+        previous = -1
+        edge = self.heads[handle]
+        while edge != -1:
+            if self.targets[edge] == partner:
+                if previous == -1:
+                    self.heads[handle] = self.next_edges[edge]
+                else:
+                    self.next_edges[previous] = self.next_edges[edge]
+                self.next_edges[edge] = self.free_edge
+                self.free_edge = edge
+                return True
+            previous, edge = edge, self.next_edges[edge]
+        return False
+
+    def add(self, left, right):
+        """Links two objects, False when they were linked already"""
+        with self.lock:
+            left_handle, right_handle = self.get_handle(left), self.get_handle(right)
+            if right_handle in self.iter_partners(left_handle):
+                return False
+            self.add_edge(left_handle, right_handle)
+            self.add_edge(right_handle, left_handle)
+            self.count += 1
+            return True
+
+    def remove(self, left, right):
+        with self.lock:
+            left_handle = getattr(left, self.attr, None)
+            right_handle = getattr(right, self.attr, None)
+            if left_handle is None or right_handle is None \
+                    or not self.remove_edge(left_handle, right_handle):
+                return False
+            self.remove_edge(right_handle, left_handle)
+            self.count -= 1
+            return True
+
+    def discard(self, obj):
+        """Drops all the links of the object and the reference to it"""
+        with self.lock:
+            handle = getattr(obj, self.attr, None)
+            if handle is None:
+                return
+            for partner in list(self.iter_partners(handle)):
+                self.remove_edge(partner, handle)
+                self.remove_edge(handle, partner)
+                self.count -= 1
+            self.objects[handle] = None
+            self.free_handles.append(handle)
+            setattr(obj, self.attr, None)
+
+    def related(self, obj):
+        """Linked objects in the order of linking"""
+        handle = getattr(obj, self.attr, None)
+        if handle is None:
+            return []
+        objects = self.objects
+        related = [objects[partner] for partner in self.iter_partners(handle)]
+        related.reverse()
+        return related
+
+    def count_related(self, obj):
+        handle = getattr(obj, self.attr, None)
+        return 0 if handle is None else sum(1 for _ in self.iter_partners(handle))
+
+    def __len__(self):
+        return self.count
+
+
+class LazyCollection:
+    """
+    Descriptor: related collection loaded on the first access.
+    A mapper sets the loader with LazyCollection.defer(obj, name, loader),
+    plain assignment stores the collection as usual.
+    Works with __slots__ models: the collection is kept in the _<name> slot
+    and the loader in _<name>_loader. With an AssociationTable the collection
+    lives in the table, loaded objects are linked there
+    """
+
+    def __init__(self, table=None):
+        self.table = table
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot_name = f'_{name}'
+        self.loader_name = f'_{name}_loader'
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        loader = getattr(obj, self.loader_name, None)
+        if loader is not None:
+            setattr(obj, self.loader_name, None)
+            loader, link = loader
+            value = loader()
+            if self.table is not None and link:
+                for item in value:
+                    self.table.add(obj, item)
+            else:
+                setattr(obj, self.slot_name, value)
+        value = getattr(obj, self.slot_name, None)
+        if value is not None:
+            return value
+        if self.table is not None:
+            return self.table.related(obj)
+        value = []
+        setattr(obj, self.slot_name, value)
+        return value
+
+    def __set__(self, obj, value):
+        if getattr(obj, self.loader_name, None) is not None:
+            setattr(obj, self.loader_name, None)
+        if self.table is None:
+            setattr(obj, self.slot_name, value)
+            return
+        if getattr(obj, self.slot_name, None) is not None:
+            setattr(obj, self.slot_name, None)
+        for item in self.table.related(obj):
+            self.table.remove(obj, item)
+        for item in value:
+            self.table.add(obj, item)
+
+    @staticmethod
+    def defer(obj, name, loader, link=True):
+        """
+        link=False keeps the loaded collection on the object only,
+        for objects that shouldn't stay referenced by the table
+        """
+        setattr(obj, f'_{name}', None)
+        setattr(obj, f'_{name}_loader', (loader, link))
+
+    @staticmethod
+    def is_loaded(obj, name):
+        return getattr(obj, f'_{name}_loader', None) is None
 
 
 class DomainObject:
+    __slots__ = ()
 
     def mark_new(self):
         UnitOfWork.get_current().register_new(self)
@@ -68,3 +421,93 @@ class DomainObject:
 
     def mark_removed(self):
         UnitOfWork.get_current().register_removed(self)
+
+
+class IndexedCollection(list):
+    """
+    Architectural system pattern Repository:
+    list of domain objects with dict indexes kept up to date on every change.
+    unique - attribute names, one object per value (the first one added),
+    multi - {index name: key function}, list of objects per key.
+    Index keys are taken when an object is added to the collection.
+    """
+
+    def __init__(self, items=(), unique=(), multi=None):
+        super().__init__()
+        self.unique = {attr: {} for attr in unique}
+        self.multi = {name: (key, {}) for name, key in (multi or {}).items()}
+        self.extend(items)
+
+    def _add_to_indexes(self, obj):
+        for attr, index in self.unique.items():
+            value = getattr(obj, attr, None)
+            if value is not None:
+                index.setdefault(value, obj)
+        for key, index in self.multi.values():
+            index.setdefault(key(obj), []).append(obj)
+
+    def _remove_from_indexes(self, obj):
+        for attr, index in self.unique.items():
+            value = getattr(obj, attr, None)
+            if index.get(value) is obj:
+                del index[value]
+                # another object with the same value takes its place
+                for item in self:
+                    if item is not obj and getattr(item, attr, None) == value:
+                        index[value] = item
+                        break
+        for key, index in self.multi.values():
+            group = index.get(key(obj), [])
+            if obj in group:
+                group.remove(obj)
+
+    def reindex(self):
+        for index in self.unique.values():
+            index.clear()
+        for _, index in self.multi.values():
+            index.clear()
+        for obj in self:
+            self._add_to_indexes(obj)
+
+    def get(self, attr, value, default=None):
+        return self.unique[attr].get(value, default)
+
+    def filter(self, name, key):
+        return list(self.multi[name][1].get(key, ()))
+
+    def append(self, obj):
+        super().append(obj)
+        self._add_to_indexes(obj)
+
+    def extend(self, items):
+        for obj in items:
+            self.append(obj)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def insert(self, index, obj):
+        super().insert(index, obj)
+        self.reindex()
+
+    def remove(self, obj):
+        super().remove(obj)
+        self._remove_from_indexes(obj)
+
+    def pop(self, index=-1):
+        obj = super().pop(index)
+        self._remove_from_indexes(obj)
+        return obj
+
+    def clear(self):
+        super().clear()
+        self.reindex()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self.reindex()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self.reindex()
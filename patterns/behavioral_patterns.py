@@ -1,7 +1,15 @@
+import atexit
 import os
+import threading
+from itertools import islice
+from json import dumps as json_dumps
+from queue import Queue, Empty, Full
+from time import monotonic, sleep
 
 from jsonpickle import dumps, loads
-from framework.templator import render
+
+from framework.http_requests import BadRequest
+from framework.templator import render, stream_render
 
 
 class Observer:
@@ -10,30 +18,250 @@ class Observer:
     def update(self, subject):
         pass
 
+    def message(self, subject):
+        """Taken at notify(): everything the notification needs from the subject"""
+        return subject
+
+    def send(self, message):
+        """Delivers a message, may be called by a background worker"""
+        self.update(message)
+
 
 class Subject:
     """subject for observing"""
 
+    __slots__ = ('observers',)
+
+    # NotificationDispatcher: observers are notified in background threads,
+    # None - synchronously inside notify()
+    dispatcher = None
+
     def __init__(self):
-        self.observers = []
+        # a tuple: subjects without observers share the empty one
+        self.observers = ()
+
+    def attach(self, observer):
+        if observer not in self.observers:
+            self.observers += (observer,)
+
+    def detach(self, observer):
+        self.observers = tuple(item for item in self.observers if item is not observer)
 
     def notify(self):
+        dispatcher = self.dispatcher
         for item in self.observers:
-            item.update(self)
+            if dispatcher is None:
+                item.update(self)
+            else:
+                dispatcher.submit(item, item.message(self))
 
 
-class SmsNotifier(Observer):
-    """SMS notification"""
+class ConsoleGateway:
+    """Prints messages instead of a real SMS/SMTP gateway"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def send(self, message):
+        print(self.prefix, message)
+
+
+class FakeGateway:
+    """
+    Local gateway for tests: keeps sent messages in memory,
+    the first fail_times sends raise ConnectionError
+    """
+
+    def __init__(self, fail_times=0, delay=0.0):
+        self.messages = []
+        self.calls = 0
+        self.fail_times = fail_times
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        self.send_batch([message])
+
+    def send_batch(self, messages):
+        with self.lock:
+            self.calls += 1
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise ConnectionError('fake gateway failure')
+        if self.delay:
+            sleep(self.delay)
+        with self.lock:
+            self.messages.extend(messages)
+
+
+class Notifier(Observer):
+    """Builds a message from the subject and sends it through a gateway"""
+
+    prefix = 'Sending:'
+
+    def __init__(self, gateway=None):
+        self.gateway = gateway or ConsoleGateway(self.prefix)
 
     def update(self, subject):
-        print('Sending SMS:', 'Welcome onboard, ', subject.students[-1].name)
+        self.send(self.message(subject))
 
+    def message(self, subject):
+        return f'Welcome onboard, {subject.students[-1].name}'
 
-class EmailNotifier(Observer):
+    def send(self, message):
+        self.gateway.send(message)
+
+    def send_batch(self, messages):
+        send_batch = getattr(self.gateway, 'send_batch', None)
+        if send_batch is not None:
+            send_batch(messages)
+            return
+        for message in messages:
+            self.gateway.send(message)
+
+
+class SmsNotifier(Notifier):
+    """SMS notification"""
+
+    prefix = 'Sending SMS:'
+
+
+class EmailNotifier(Notifier):
     """Email notification"""
 
-    def update(self, subject):
-        print(('Sending email', 'Welcome onboard, ', subject.students[-1].name))
+    prefix = 'Sending email:'
+
+
+class NotificationDispatcher:
+    """
+    Subject.notify() only builds the messages and puts them into a bounded
+    queue, a pool of background threads sends them. Messages of one observer
+    go by batches (observer.send_batch), a failed send is retried with
+    exponential backoff. When the queue is full notify() waits up to
+    submit_timeout seconds, then the notification is dropped
+    """
+
+    stop_signal = object()
+
+    def __init__(self, workers=2, batch_size=20, max_retries=3, retry_delay=0.5,
+                 max_queue_size=1000, submit_timeout=0.1):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_queue_size = max_queue_size
+        self.submit_timeout = submit_timeout
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.reset()
+        atexit.register(self.close)
+        if hasattr(os, 'register_at_fork'):
+            # the sender threads don't survive fork
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def reset(self):
+        self.queue = Queue(self.max_queue_size)
+        self.threads = []
+
+    def after_fork(self):
+        # a thread of the parent may have held the lock, it is never released in the child
+        self.lock = threading.Lock()
+        self.reset()
+
+    def start(self):
+        with self.lock:
+            if not self.threads:
+                self.threads = [threading.Thread(target=self.run, name=f'notifier-{index}',
+                                                 daemon=True)
+                                for index in range(self.workers)]
+                for thread in self.threads:
+                    thread.start()
+
+    def submit(self, observer, message):
+        if not self.threads:
+            self.start()
+        try:
+            self.queue.put((observer, message), timeout=self.submit_timeout)
+        except Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        return True
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is self.stop_signal:
+                self.queue.task_done()
+                break
+            jobs = [job]
+            stop = False
+            while len(jobs) < self.batch_size:
+                try:
+                    job = self.queue.get_nowait()
+                except Empty:
+                    break
+                if job is self.stop_signal:
+                    stop = True
+                    break
+                jobs.append(job)
+            batches = {}
+            for observer, message in jobs:
+                batches.setdefault(id(observer), (observer, []))[1].append(message)
+            for observer, messages in batches.values():
+                self.deliver(observer, messages)
+            for _ in range(len(jobs) + stop):
+                self.queue.task_done()
+            if stop:
+                break
+
+    def deliver(self, observer, messages):
+        send_batch = getattr(observer, 'send_batch', None)
+        if send_batch is not None:
+            self.retry(send_batch, messages, len(messages))
+        else:
+            for message in messages:
+                self.retry(observer.send, message, 1)
+
+    def retry(self, send, argument, count):
+        for attempt in range(self.max_retries + 1):
+            try:
+                send(argument)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self.lock:
+                        self.failed += count
+                        self.last_error = e
+                    return False
+                with self.lock:
+                    self.retried += 1
+                sleep(self.retry_delay * 2 ** attempt)
+            else:
+                with self.lock:
+                    self.sent += count
+                return True
+
+    def stats(self):
+        with self.lock:
+            return {'queued': self.queue.qsize(), 'sent': self.sent, 'failed': self.failed,
+                    'retried': self.retried, 'rejected': self.rejected}
+
+    def flush(self):
+        """Waits until everything submitted before is sent or failed"""
+        if self.threads:
+            self.queue.join()
+
+    def close(self):
+        threads = [thread for thread in self.threads if thread.is_alive()]
+        for _ in threads:
+            self.queue.put(self.stop_signal)
+        for thread in threads:
+            thread.join()
+        self.threads = []
 
 
 class BaseSerializer:
@@ -49,10 +277,108 @@ class BaseSerializer:
         return loads(data)
 
 
+class Field:
+    """Schema field: attribute of the object, 'name'"""
+
+    def __init__(self, attr):
+        if not all(part.isidentifier() for part in attr.split('.')):
+            raise ValueError(f'Bad attribute {attr!r}')
+        self.attr = attr
+
+    def expression(self, index):
+        """Python expression of the value, the object is obj"""
+        return f'obj.{self.attr}'
+
+
+class Method(Field):
+    """Result of a method without arguments: Method('course_count')"""
+
+    def expression(self, index):
+        return f'obj.{self.attr}()'
+
+
+class Ref(Field):
+    """Related object as its key: Ref('category', 'id'), None stays None"""
+
+    def __init__(self, attr, key='id'):
+        super().__init__(attr)
+        self.key = Field(key).attr
+
+    def expression(self, index):
+        var = f'ref{index}'
+        return f'(None if ({var} := obj.{self.attr}) is None else {var}.{self.key})'
+
+
+class RefList(Ref):
+    """Related objects as a list of their keys: RefList('students', 'id')"""
+
+    def expression(self, index):
+        return f'[item.{self.key} for item in obj.{self.attr}]'
+
+
+class Schema:
+    """
+    Declarative serializer: fields = {'name': 'name', 'category': Ref('category')}.
+    Relations are written as keys, so the output is flat and has no cycles.
+    Every set of selected fields is compiled once into an encoder function,
+    fields are taken in the declared order, so a set is one cache key
+    whatever order the client asks them in
+    """
+
+    fields = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.fields = {name: Field(field) if isinstance(field, str) else field
+                      for name, field in cls.fields.items()}
+        cls.encoders = {}
+
+    def __init__(self, fields=None):
+        if fields:
+            unknown = [name for name in fields if name not in self.fields]
+            if unknown:
+                raise BadRequest(f'Unknown fields: {", ".join(unknown)}')
+            selected = set(fields)
+            fields = tuple(name for name in self.fields if name in selected)
+        else:
+            fields = tuple(self.fields)
+        self.encode_many = self.get_encoder(fields)
+
+    @classmethod
+    def get_encoder(cls, fields):
+        encoder = cls.encoders.get(fields)
+        if encoder is None:
+            encoder = cls.encoders[fields] = cls.compile(fields)
+        return encoder
+
+    @classmethod
+    def compile(cls, fields):
+        """def encode_many(objects): return [{'name': obj.name, ...} for obj in objects]"""
+        items = ', '.join(f'{name!r}: {cls.fields[name].expression(index)}'
+                          for index, name in enumerate(fields))
+        source = f'def encode_many(objects):\n    return [{{{items}}} for obj in objects]\n'
+        code = compile(source, f'<{cls.__name__} encoder>', 'exec')
+        namespace = {}
+        exec(code, namespace)
+        return namespace['encode_many']
+
+    def dump(self, obj):
+        return self.encode_many((obj,))[0]
+
+    def dump_many(self, objects):
+        return self.encode_many(objects)
+
+    @staticmethod
+    def dumps(data):
+        return json_dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
 class TemplateView:
     """behavior pattern template method"""
 
     template_name = 'template.html'
+    # render the page in chunks while sending it instead of building it in memory
+    stream = False
 
     def get_context_data(self):
         return {}
@@ -61,8 +387,12 @@ class TemplateView:
         return self.template_name
 
     def render_template_with_context(self):
+        return self.render_context(self.get_context_data())
+
+    def render_context(self, context):
         template_name = self.get_template()
-        context = self.get_context_data()
+        if self.stream:
+            return '200 OK', stream_render(template_name, **context)
         return '200 OK', render(template_name, **context)
 
     def __call__(self, request):
@@ -73,11 +403,36 @@ class ListView(TemplateView):
     queryset = []
     template_name = 'list.html'
     context_object_name = 'objects_list'
+    # keyset pagination: ?after=<id of the last object>&limit=<page size>,
+    # paginate_by - page size when the request has no limit, None - whole queryset
+    paginate_by = None
+    max_paginate_by = 1000
+    cursor_param = 'after'
+    page_size_param = 'limit'
 
     def get_queryset(self):
         print(self.queryset)
         return self.queryset
 
+    def paginate_queryset(self, after, limit):
+        """Objects with id > after, at most limit of them. Mappers do it in sql"""
+        queryset = self.get_queryset()
+        if after is not None:
+            queryset = (obj for obj in queryset if obj.id > after)
+        return list(islice(queryset, limit))
+
+    def get_page_params(self, request):
+        params = request.get('request_params') or {}
+        try:
+            after = int(params[self.cursor_param]) if self.cursor_param in params else None
+            limit = int(params.get(self.page_size_param) or self.paginate_by or 0)
+        except ValueError:
+            after, limit = None, self.paginate_by
+        if not limit and after is None:
+            return None, None
+        limit = min(max(limit or self.max_paginate_by, 1), self.max_paginate_by)
+        return after, limit
+
     def get_context_object_name(self):
         return self.context_object_name
 
@@ -87,6 +442,67 @@ class ListView(TemplateView):
         context = {context_object_name: queryset}
         return context
 
+    def get_page_context_data(self, after, limit):
+        # one extra object tells whether there is a next page
+        objects = self.paginate_queryset(after, limit + 1)
+        next_cursor = objects[limit - 1].id if len(objects) > limit else None
+        return {
+            self.get_context_object_name(): objects[:limit],
+            'next_cursor': next_cursor,
+            'page_size': limit,
+        }
+
+    def __call__(self, request):
+        after, limit = self.get_page_params(request)
+        if limit is None:
+            return super().__call__(request)
+        return self.render_context(self.get_page_context_data(after, limit))
+
+
+class ApiListView:
+    """
+    JSON list of objects serialized by schema:
+    ?fields=name,category - only these fields, ?offset=20&limit=10 - a page
+    """
+
+    schema = Schema
+    queryset = []
+    content_type = 'application/json'
+    fields_param = 'fields'
+    offset_param = 'offset'
+    page_size_param = 'limit'
+    max_paginate_by = 1000
+
+    def get_queryset(self):
+        return self.queryset
+
+    def get_schema(self, request):
+        fields = (request.get('request_params') or {}).get(self.fields_param)
+        if fields:
+            fields = [name.strip() for name in fields.split(',') if name.strip()]
+        return self.schema(fields)
+
+    def get_page_params(self, request):
+        params = request.get('request_params') or {}
+        try:
+            offset = int(params.get(self.offset_param) or 0)
+            limit = int(params.get(self.page_size_param) or self.max_paginate_by)
+        except ValueError:
+            raise BadRequest(f'{self.offset_param} and {self.page_size_param} must be integers')
+        return max(offset, 0), min(max(limit, 1), self.max_paginate_by)
+
+    def __call__(self, request):
+        schema = self.get_schema(request)
+        offset, limit = self.get_page_params(request)
+        queryset = self.get_queryset()
+        objects = queryset[offset:offset + limit]
+        end = offset + len(objects)
+        return '200 OK', schema.dumps({
+            'count': len(queryset),
+            'next_offset': end if end < len(queryset) else None,
+            'results': schema.dump_many(objects),
+        })
+
 
 class CreateView(TemplateView):
     template_name = 'create.html'
@@ -125,3 +541,126 @@ class FileWriter:
     def write(self, text):
         with open(self.file_name, 'a', encoding='utf-8') as f:
             f.write(f'{text}\n')
+
+
+class BufferedFileWriter:
+    """
+    behavior pattern Strategy
+    write() only puts the line into a queue, a background thread keeps
+    the file open and writes lines by batches: when batch_size lines are
+    buffered or flush_interval seconds passed since the first of them.
+    The file is rotated when it grows over max_bytes, the rest of the queue
+    is written at exit. A forked worker writes its own file (log.<pid>.txt),
+    so workers never rotate a file under each other
+    """
+
+    stop_signal = object()
+    flush_signal = object()
+
+    def __init__(self, file_name=None, batch_size=100, flush_interval=1.0,
+                 max_bytes=10 * 1024 * 1024, backup_count=3, max_queue_size=10000):
+        self.file_name = file_name or os.path.join('logs', 'log.txt')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.reset()
+        atexit.register(self.close)
+        if hasattr(os, 'register_at_fork'):
+            # the writer thread doesn't survive fork
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def reset(self):
+        self.queue = Queue(self.max_queue_size)
+        self.thread = None
+        self.file = None
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        self.reset()
+        root, ext = os.path.splitext(self.file_name)
+        self.file_name = f'{root}.{os.getpid()}{ext}'
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='log-writer', daemon=True)
+                self.thread.start()
+
+    def write(self, text):
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(f'{text}\n')
+        except Full:
+            # request threads never wait for the disk
+            with self.lock:
+                self.dropped += 1
+
+    def run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - monotonic())
+            try:
+                line = self.queue.get(timeout=timeout)
+            except Empty:
+                line = None
+            signal = line is self.stop_signal or line is self.flush_signal
+            if line is not None and not signal:
+                if not batch:
+                    deadline = monotonic() + self.flush_interval
+                batch.append(line)
+            if batch and (signal or len(batch) >= self.batch_size or monotonic() >= deadline):
+                self.write_batch(batch)
+                for _ in batch:
+                    self.queue.task_done()
+                batch = []
+                deadline = None
+            if signal:
+                self.queue.task_done()
+            if line is self.stop_signal:
+                break
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def write_batch(self, lines):
+        if self.file is None:
+            self.file = open(self.file_name, 'a', encoding='utf-8')
+        self.file.write(''.join(lines))
+        self.file.flush()
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """log.txt -> log.txt.1 -> ... -> log.txt.<backup_count>"""
+        self.file.close()
+        self.file = None
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.file_name}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.file_name}.{index + 1}')
+        if self.backup_count:
+            os.replace(self.file_name, f'{self.file_name}.1')
+        else:
+            os.remove(self.file_name)
+
+    def flush(self):
+        """Waits until everything written before is on disk"""
+        if self.thread is not None:
+            # lines waiting for a full batch are written at once
+            self.queue.put(self.flush_signal)
+            self.queue.join()
+
+    def close(self):
+        thread = self.thread
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(self.stop_signal)
+        thread.join()
+        self.thread = None
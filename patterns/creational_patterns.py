@@ -1,32 +1,58 @@
 import os
-from sqlite3 import connect
-from copy import deepcopy
-from quopri import decodestring
-from patterns.behavioral_patterns import FileWriter, Subject
-from patterns.architectural_system_patterns import DomainObject
+import threading
+from contextvars import ContextVar
+from queue import LifoQueue, Empty
+from sqlite3 import connect, Connection, Cursor
+from time import perf_counter, perf_counter_ns
+from copy import copy
+from urllib.parse import unquote_plus
+from framework.metrics import record, registry
+from patterns.behavioral_patterns import BufferedFileWriter, Subject, Schema, Method, Ref, RefList
+from patterns.architectural_system_patterns import AssociationTable, DomainObject, \
+    IndexedCollection, IdentityMap, LazyCollection, UnitOfWork
 
 
 class User:
     """abstract user"""
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
 
 class Teacher(User):
     """teacher"""
-    pass
+    __slots__ = ()
+
+
+# students - courses links, kept once for both sides
+enrollments = AssociationTable()
 
 
 class Student(User, DomainObject):
     """student"""
+    __slots__ = ('id', 'handle', '_courses', '_courses_loader')
+
+    courses = LazyCollection(enrollments)
+
     def __init__(self, name):
-        self.courses = []
+        self.id = None
+        self.handle = None
         super().__init__(name)
 
 
+class Enrollment(DomainObject):
+    """student enrolled on a course"""
+    __slots__ = ('student_id', 'course_name')
+
+    def __init__(self, student_id, course_name):
+        self.student_id = student_id
+        self.course_name = course_name
+
+
 class Staff(User):
     """staff"""
-    pass
+    __slots__ = ()
 
 
 class UserFactory:
@@ -44,40 +70,72 @@ class UserFactory:
 
 
 class CoursePrototype:
-    """Creational pattern prototype"""
-
-    def clone(self):
-        """Create a deepcopy of current object instead of creating new black object"""
-        return deepcopy(self)
+    """
+    Creational pattern prototype.
+    A clone references shared_fields of the original, gets shallow copies
+    of copied_fields, the rest are left to after_clone(). Nothing else of the
+    object graph is copied, so the cost doesn't depend on its size
+    """
+    __slots__ = ()
+
+    shared_fields = ()
+    copied_fields = ()
+
+    def clone(self, **changes):
+        """changes - new values of fields, set before after_clone() links the copy"""
+        cls = type(self)
+        clone = cls.__new__(cls)
+        for name in self.shared_fields:
+            setattr(clone, name, getattr(self, name))
+        for name in self.copied_fields:
+            setattr(clone, name, copy(getattr(self, name)))
+        for name, value in changes.items():
+            setattr(clone, name, value)
+        clone.after_clone(self)
+        return clone
+
+    def after_clone(self, original):
+        pass
 
 
 class Course(CoursePrototype, Subject):
     """Course based on prototype"""
+    __slots__ = ('name', 'category', 'handle')
+
+    students = LazyCollection(enrollments)
+
+    shared_fields = ('name', 'category')
+    # a tuple, attach() replaces it: the copy is copy-on-write for free
+    copied_fields = ('observers',)
 
     def __init__(self, name, category):
         self.name = name
         self.category = category
-        self.category.courses.append(self)
-        self.students = []
+        self.handle = None
         super().__init__()
+        category.add_course(self)
+
+    def after_clone(self, original):
+        # a new course: no students yet, listed by its category
+        self.handle = None
+        self.category.add_course(self)
 
     def __getitem__(self, item):
         return self.students[item]
 
     def add_student(self, student: Student):
-        self.students.append(student)
-        student.courses.append(self)
+        enrollments.add(student, self)
         self.notify()
 
 
 class InteractiveCourse(Course):
     """Interactive course"""
-    pass
+    __slots__ = ()
 
 
 class RecordCourse(Course):
     """Recorded course"""
-    pass
+    __slots__ = ()
 
 
 class CourseFactory:
@@ -94,7 +152,13 @@ class CourseFactory:
 
 
 class Category:
-    """Category"""
+    """
+    Category tree: children links and a materialized path of ids, '/0/3/'.
+    Course counters are updated when courses are added or removed,
+    so reading them doesn't walk the tree
+    """
+    __slots__ = ('id', 'name', 'parent_category', 'courses', 'children', 'path',
+                 'inherited_count', 'subtree_count')
 
     # incrementing category id on class's level:
     category_id = 0
@@ -105,11 +169,96 @@ class Category:
         self.name = name
         self.parent_category = category
         self.courses = []
+        self.children = []
+        # courses of all the ancestors
+        self.inherited_count = category.course_count() if category else 0
+        # own courses and courses of all the descendants
+        self.subtree_count = 0
+        if category is None:
+            self.path = f'/{self.id}/'
+        else:
+            self.path = f'{category.path}{self.id}/'
+            category.children.append(self)
+
+    @property
+    def depth(self):
+        return self.path.count('/') - 2
 
     def course_count(self):
+        """Own courses and courses of the ancestors"""
+        return self.inherited_count + len(self.courses)
+
+    def add_course(self, course):
+        self.courses.append(course)
+        self.courses_changed(1)
+
+    def remove_course(self, course):
+        self.courses.remove(course)
+        self.courses_changed(-1)
+
+    def courses_changed(self, delta):
+        category = self
+        while category is not None:
+            category.subtree_count += delta
+            category = category.parent_category
+        for descendant in self.descendants():
+            descendant.inherited_count += delta
+
+    def walk(self):
+        """The category and all its descendants, depth-first"""
+        stack = [self]
+        while stack:
+            category = stack.pop()
+            yield category
+            stack.extend(reversed(category.children))
+
+    def descendants(self):
+        walk = self.walk()
+        next(walk)
+        return walk
+
+    def ancestors(self):
+        category = self.parent_category
+        while category is not None:
+            yield category
+            category = category.parent_category
+
+    def is_descendant_of(self, other):
+        return self is not other and self.path.startswith(other.path)
+
+    def subtree_courses(self):
+        """Courses of the category and all its descendants"""
+        return [course for category in self.walk() for course in category.courses]
+
+
+class CourseSchema(Schema):
+    fields = {
+        'name': 'name',
+        'type': '__class__.__name__',
+        'category': Ref('category', 'id'),
+        'students': RefList('students', 'id'),
+    }
+
 
-        parents_courses = self.parent_category.course_count() if self.parent_category else 0
-        return parents_courses + len(self.courses)
+class CategorySchema(Schema):
+    fields = {
+        'id': 'id',
+        'name': 'name',
+        'parent': Ref('parent_category', 'id'),
+        'path': 'path',
+        'course_count': Method('course_count'),
+        'subtree_course_count': 'subtree_count',
+        'children': RefList('children', 'id'),
+        'courses': RefList('courses', 'name'),
+    }
+
+
+class StudentSchema(Schema):
+    fields = {
+        'id': 'id',
+        'name': 'name',
+        'courses': RefList('courses', 'name'),
+    }
 
 
 class Engine:
@@ -117,9 +266,10 @@ class Engine:
 
     def __init__(self):
         self.teachers = []
-        self.students = []
-        self.courses = []
-        self.categories = []
+        self.students = IndexedCollection(unique=('name',))
+        self.courses = IndexedCollection(
+            unique=('name',), multi={'category': lambda course: course.category.id})
+        self.categories = IndexedCollection(unique=('id',))
 
     @staticmethod
     def create_user(type_, name):
@@ -130,38 +280,40 @@ class Engine:
         return Category(name, category)
 
     def find_category_by_id(self, id):
-        for item in self.categories:
-            print('item', item.id)
-            if item.id == id:
-                return item
-        raise Exception(f'No category with id={id}')
+        category = self.categories.get('id', id)
+        if category is None:
+            raise Exception(f'No category with id={id}')
+        return category
 
     @staticmethod
     def create_course(type_, name: str, category):
         return CourseFactory.create(type_, name, category)
 
+    def clone_course(self, course, name):
+        """Copy of the course with a new name, added to the courses index"""
+        new_course = course.clone(name=name)
+        self.courses.append(new_course)
+        return new_course
+
     def find_course_by_name(self, name):
-        for item in self.courses:
-            if item.name == name:
-                return item
-        raise Exception(f'No course with name={name}')
+        course = self.courses.get('name', name)
+        if course is None:
+            raise Exception(f'No course with name={name}')
+        return course
+
+    def courses_by_category(self, category):
+        return self.courses.filter('category', category.id)
 
     def get_student(self, name) -> Student:
-        for item in self.students:
-            if item.name == name:
-                return item
+        return self.students.get('name', name)
 
     def get_course(self, name):
-        for item in self.courses:
-            if item.name == name:
-                return item
-        return None
+        return self.courses.get('name', name)
 
     @staticmethod
     def decode_value(val):
-        val_b = bytes(val.replace('%', '=').replace("+", " "), 'UTF-8')
-        val_decode_str = decodestring(val_b)
-        return val_decode_str.decode('UTF-8')
+        """Raw urlencoded value, request data is already decoded by the framework"""
+        return unquote_plus(val)
 
 
 class SingletonByName(type):
@@ -187,7 +339,7 @@ class SingletonByName(type):
 class Logger(metaclass=SingletonByName):
     """Logger"""
 
-    def __init__(self, name, writer=FileWriter()):
+    def __init__(self, name, writer=BufferedFileWriter()):
         self.name = name
         self.writer = writer
 
@@ -198,31 +350,87 @@ class Logger(metaclass=SingletonByName):
 
 class StudentMapper:
 
-    def __init__(self, connection):
+    def __init__(self, connection, identity_map=None):
         self.connection = connection
         self.cursor = connection.cursor()
         self.tablename = 'student'
+        self.identity_map = identity_map if identity_map is not None else IdentityMap()
+
+    def load(self, row, register=True, batch=None):
+        """
+        One object per row: already loaded students are taken from the identity map.
+        Courses of the students of one batch are loaded together, on the first access
+        """
+        id, name = row
+        student = self.identity_map.get(self.tablename, id)
+        if student is None:
+            student = Student(name)
+            student.id = id
+            if batch is None:
+                batch = CourseBatch(self, [id])
+            # a row is loaded again by every request: its courses stay on the object,
+            # the process-wide enrollments table keeps only the engine's students
+            LazyCollection.defer(student, 'courses', lambda: batch.pop(id), link=False)
+            if register:
+                self.identity_map.add(self.tablename, id, student)
+        return student
+
+    def load_many(self, rows, register=True):
+        batch = CourseBatch(self, [id for id, _ in rows])
+        return [self.load(row, register, batch) for row in rows]
 
     def all(self):
-        statement = f'SELECT * from {self.tablename}'
+        statement = f'SELECT id, name from {self.tablename}'
         self.cursor.execute(statement)
-        result = []
-        for item in self.cursor.fetchall():
-            id, name = item
-            student = Student(name)
-            student.id = id
-            result.append(student)
-        return result
+        return self.load_many(self.cursor.fetchall())
+
+    def page(self, after=None, limit=100):
+        """Keyset pagination: the next limit students after the given id"""
+        statement = f'SELECT id, name FROM {self.tablename} WHERE id > ? ORDER BY id LIMIT ?'
+        self.cursor.execute(statement, (after if after is not None else -1, limit))
+        return self.load_many(self.cursor.fetchall())
+
+    def iterate(self, batch_size=500):
+        """
+        Generator over the whole table, rows are fetched by batches.
+        Students not in the identity map yet aren't added to it, so memory stays bounded
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(f'SELECT id, name FROM {self.tablename} ORDER BY id')
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from self.load_many(rows, register=False)
+        finally:
+            cursor.close()
 
     def find_by_id(self, id):
+        student = self.identity_map.get(self.tablename, id)
+        if student is not None:
+            return student
         statement = f"SELECT id, name FROM {self.tablename} WHERE id=?"
         self.cursor.execute(statement, (id,))
         result = self.cursor.fetchone()
         if result:
-            return Student(*result)
+            return self.load(result)
         else:
             raise RecordNotFoundException(f'record with id={id} not found')
 
+    def find_courses(self, id):
+        return self.find_courses_many([id]).get(id, [])
+
+    @staticmethod
+    def find_courses_many(ids):
+        """{student id: [courses]}, by one query for a batch of students"""
+        course_names = MapperRegistry.get_current_mapper('enrollment').find_course_names_many(ids)
+        result = {}
+        for student_id, names in course_names.items():
+            courses = (MapperRegistry.resolve('course', name) for name in names)
+            result[student_id] = [course for course in courses if course is not None]
+        return result
+
     def insert(self, obj):
         statement = f"INSERT INTO {self.tablename} (name) VALUES (?)"
         self.cursor.execute(statement, (obj.name,))
@@ -248,27 +456,385 @@ class StudentMapper:
         except Exception as e:
             raise DbDeleteException(e.args)
 
+    # batch methods don't commit, the transaction belongs to the unit of work
+
+    def insert_many(self, objects):
+        """Returns generated ids in the order of objects"""
+        statement = f"INSERT INTO {self.tablename} (name) VALUES (?)"
+        self.cursor.executemany(statement, [(obj.name,) for obj in objects])
+        # ids of one executemany are consecutive: the unit of work holds the write lock
+        # (BEGIN IMMEDIATE), no other connection inserts rows between them
+        self.cursor.execute('SELECT last_insert_rowid()')
+        last_id = self.cursor.fetchone()[0]
+        return list(range(last_id - len(objects) + 1, last_id + 1))
+
+    def update_many(self, objects):
+        statement = f"UPDATE {self.tablename} SET name=? WHERE id=?"
+        self.cursor.executemany(statement, [(obj.name, obj.id) for obj in objects])
+
+    def delete_many(self, objects):
+        statement = f"DELETE FROM {self.tablename} WHERE id=?"
+        self.cursor.executemany(statement, [(obj.id,) for obj in objects])
+
+
+class CourseBatch:
+    """
+    Courses of students loaded together: the first student whose courses are read
+    loads them for the whole batch, so a list page makes one query instead of one per row
+    """
+
+    def __init__(self, mapper, ids):
+        self.mapper = mapper
+        self.ids = ids
+        self.courses = None
+
+    def pop(self, id):
+        if self.courses is None:
+            self.courses = self.mapper.find_courses_many(self.ids)
+        # every student takes its list once, the loader is dropped after the first access
+        return self.courses.pop(id, [])
+
+
+# ids in one IN (...): old sqlite builds allow only 999 query parameters
+IN_BATCH_SIZE = 500
 
-connection = connect('patterns.sqlite')
+
+class EnrollmentMapper:
+
+    def __init__(self, connection, identity_map=None):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.tablename = 'student_course'
+
+    def find_course_names(self, student_id):
+        return self.find_course_names_many([student_id]).get(student_id, [])
+
+    def find_course_names_many(self, student_ids):
+        """{student_id: [course names]}, ids go by IN_BATCH_SIZE into one query"""
+        result = {}
+        for start in range(0, len(student_ids), IN_BATCH_SIZE):
+            ids = student_ids[start:start + IN_BATCH_SIZE]
+            statement = f"SELECT student_id, course_name FROM {self.tablename} " \
+                        f"WHERE student_id IN ({', '.join('?' * len(ids))})"
+            self.cursor.execute(statement, ids)
+            for student_id, course_name in self.cursor.fetchall():
+                result.setdefault(student_id, []).append(course_name)
+        return result
+
+    def insert_many(self, objects):
+        statement = f"INSERT OR IGNORE INTO {self.tablename} (student_id, course_name) VALUES (?, ?)"
+        self.cursor.executemany(statement, [(obj.student_id, obj.course_name) for obj in objects])
+        return [None] * len(objects)
+
+    def update_many(self, objects):
+        pass
+
+    def delete_many(self, objects):
+        statement = f"DELETE FROM {self.tablename} WHERE student_id=? AND course_name=?"
+        self.cursor.executemany(statement, [(obj.student_id, obj.course_name) for obj in objects])
+
+
+class TimedCursor(Cursor):
+    """Cursor adding query time to the db time of the current request"""
+
+    def execute(self, *args):
+        start = perf_counter_ns()
+        try:
+            return super().execute(*args)
+        finally:
+            record('db', perf_counter_ns() - start)
+
+    def executemany(self, *args):
+        start = perf_counter_ns()
+        try:
+            return super().executemany(*args)
+        finally:
+            record('db', perf_counter_ns() - start)
+
+    def fetchone(self):
+        start = perf_counter_ns()
+        try:
+            return super().fetchone()
+        finally:
+            record('db', perf_counter_ns() - start)
+
+    def fetchmany(self, *args):
+        start = perf_counter_ns()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            record('db', perf_counter_ns() - start)
+
+    def fetchall(self):
+        start = perf_counter_ns()
+        try:
+            return super().fetchall()
+        finally:
+            record('db', perf_counter_ns() - start)
+
+
+class TimedConnection(Connection):
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+class PooledConnection:
+    """
+    Connection checked out by a request or a thread, returned to the pool
+    by release() or when the checkout is garbage collected
+    """
+
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = connection
+
+    def release(self):
+        if self.connection is not None:
+            self.pool.release(self.connection)
+            self.connection = None
+
+    def __del__(self):
+        self.release()
+
+
+class ConnectionPool:
+    """Creational pattern object pool: sqlite connections"""
+
+    pragmas = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA busy_timeout=5000',
+        'PRAGMA foreign_keys=ON',
+    )
+
+    def __init__(self, database, max_size=8, timeout=10.0, cached_statements=128, schema=()):
+        self.database = database
+        self.max_size = max_size
+        # CREATE ... IF NOT EXISTS statements run by the first connection
+        self.schema = schema
+        self.schema_ready = not schema
+        self.timeout = timeout
+        # prepared statements are reused by sqlite3 per connection, keyed by sql text
+        self.cached_statements = cached_statements
+        # checkout of the current request, see begin_request()
+        self.request_checkout = ContextVar(f'connection_checkout_{id(self)}', default=None)
+        self.reset()
+        if hasattr(os, 'register_at_fork'):
+            # sqlite connections must not cross fork, a worker opens its own
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self.idle = LifoQueue()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.size = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def open(self):
+        connection = connect(self.database, check_same_thread=False,
+                             cached_statements=self.cached_statements, factory=TimedConnection)
+        for pragma in self.pragmas:
+            connection.execute(pragma)
+        if not self.schema_ready:
+            for statement in self.schema:
+                connection.execute(statement)
+            connection.commit()
+            self.schema_ready = True
+        return connection
+
+    def acquire(self):
+        start = perf_counter()
+        try:
+            connection = self.idle.get_nowait()
+        except Empty:
+            with self.lock:
+                can_open = self.size < self.max_size
+                if can_open:
+                    self.size += 1
+            if can_open:
+                try:
+                    connection = self.open()
+                except Exception:
+                    with self.lock:
+                        self.size -= 1
+                    raise
+            else:
+                try:
+                    connection = self.idle.get(timeout=self.timeout)
+                except Empty:
+                    with self.lock:
+                        self.timeouts += 1
+                    raise PoolTimeoutException(
+                        f'no free connection in {self.timeout} s, pool size {self.max_size}')
+        wait = perf_counter() - start
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+        return connection
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        with self.lock:
+            self.in_use -= 1
+        self.idle.put(connection)
+
+    def connection(self):
+        """Per-request checkout: with pool.connection() as connection: ..."""
+        return ConnectionCheckout(self)
+
+    def ensure_size(self, size):
+        """At least size connections, e.g. one per server thread"""
+        with self.lock:
+            self.max_size = max(self.max_size, size)
+
+    def begin_request(self):
+        """
+        Per-request checkout: the connection is taken on the first query
+        of the request and goes back to the pool in end_request(token)
+        """
+        return self.request_checkout.set(PooledConnection(self, None))
+
+    def end_request(self, token, release=True):
+        """
+        Returns the checkout of the request, release=False leaves the connection
+        checked out for a streamed body: checkout.release() when it's sent
+        """
+        checkout = self.request_checkout.get()
+        try:
+            self.request_checkout.reset(token)
+        except ValueError:
+            # the token was made in another context
+            self.request_checkout.set(None)
+        if release and checkout is not None:
+            checkout.release()
+        return checkout
+
+    def get_connection(self):
+        """
+        The connection of the current request, outside of a request (scripts,
+        benchmarks) the thread keeps its own one until release_thread() or thread exit
+        """
+        checkout = self.request_checkout.get()
+        if checkout is not None:
+            if checkout.connection is None:
+                checkout.connection = self.acquire()
+            return checkout.connection
+        checkout = getattr(self.local, 'checkout', None)
+        if checkout is None or checkout.connection is None:
+            checkout = self.local.checkout = PooledConnection(self, self.acquire())
+        return checkout.connection
+
+    def release_thread(self):
+        checkout = getattr(self.local, 'checkout', None)
+        if checkout is not None:
+            checkout.release()
+            self.local.checkout = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+                'avg_wait_time': self.wait_time / self.checkouts if self.checkouts else 0.0,
+            }
+
+    def close(self):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except Empty:
+                break
+            connection.close()
+            with self.lock:
+                self.size -= 1
+
+
+class ConnectionCheckout:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+
+    def __enter__(self):
+        self.connection = self.pool.acquire()
+        return self.connection
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.pool.release(self.connection)
+        self.connection = None
+
+
+# tables added after utils/create_db.sql was run on existing databases
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS student_course ('
+    'student_id INTEGER NOT NULL REFERENCES student (id) ON DELETE CASCADE, '
+    'course_name VARCHAR (32) NOT NULL, PRIMARY KEY (student_id, course_name))',
+)
+
+# connections are opened lazily, on the first query of a request
+connection_pool = ConnectionPool(
+    os.environ.get('DB_NAME', 'patterns.sqlite'),
+    max_size=int(os.environ.get('DB_POOL_SIZE', 8)), schema=SCHEMA)
+registry.register('framework_db_pool', lambda: [({}, connection_pool.stats())])
 
 
 # архитектурный системный паттерн - Data Mapper
 class MapperRegistry:
     mappers = {
         'student': StudentMapper,
+        'enrollment': EnrollmentMapper,
         #'category': CategoryMapper
     }
+    pool = connection_pool
+    # objects that live only in memory (courses) are looked up by the project
+    resolvers = {}
+
+    @classmethod
+    def set_pool(cls, pool):
+        cls.pool = pool
+
+    @classmethod
+    def set_resolver(cls, name, resolver):
+        cls.resolvers[name] = resolver
+
+    @classmethod
+    def resolve(cls, name, key):
+        resolver = cls.resolvers.get(name)
+        return resolver(key) if resolver else None
 
     @staticmethod
-    def get_mapper(obj):
+    def get_identity_map():
+        """Identity map of the current request, None outside of a unit of work"""
+        unit_of_work = UnitOfWork.get_current()
+        return unit_of_work.identity_map if unit_of_work is not None else None
+
+    @classmethod
+    def get_mapper(cls, obj):
 
         if isinstance(obj, Student):
 
-            return StudentMapper(connection)
+            return StudentMapper(cls.pool.get_connection(), cls.get_identity_map())
 
-    @staticmethod
-    def get_current_mapper(name):
-        return MapperRegistry.mappers[name](connection)
+        if isinstance(obj, Enrollment):
+
+            return EnrollmentMapper(cls.pool.get_connection())
+
+    @classmethod
+    def get_current_mapper(cls, name):
+        return cls.mappers[name](cls.pool.get_connection(), cls.get_identity_map())
 
 
 class DbCommitException(Exception):
@@ -286,6 +852,11 @@ class DbDeleteException(Exception):
         super().__init__(f'Db delete error: {message}')
 
 
+class PoolTimeoutException(Exception):
+    def __init__(self, message):
+        super().__init__(f'Connection pool timeout: {message}')
+
+
 class RecordNotFoundException(Exception):
     def __init__(self, message):
         super().__init__(f'Record not found: {message}')
@@ -1,34 +1,73 @@
-from time import time
+from time import perf_counter_ns
+
+from framework.metrics import registry
+from framework.routing import Router
 
 routes = dict()
 
 
 class AppRoute:
-    """Decorator"""
+    """
+    Decorator
+    url may contain typed segments: /courses-list/<int:id>/
+    methods limits the view to given http methods: methods=('GET',),
+    a view without methods on the same url serves the rest of them
+    cache - seconds to keep rendered GET responses (True - default ttl)
+    invalidates_cache - successful calls clear cached responses
+    (True - all of them, or a list of url prefixes)
+    """
 
-    def __init__(self, url):
+    def __init__(self, url, methods=None, cache=None, invalidates_cache=None):
         self.routes = routes
         self.url = url
+        self.methods = methods
+        self.cache = cache
+        self.invalidates_cache = invalidates_cache
 
     def __call__(self, cls):
-        self.routes[self.url] = cls()
+        view = cls()
+        if self.cache:
+            view.cache_ttl = self.cache
+        if self.invalidates_cache:
+            view.invalidates_cache = self.invalidates_cache
+        registered = self.routes.get(self.url)
+        if self.methods:
+            if registered is None:
+                registered = self.routes[self.url] = {}
+            elif not isinstance(registered, dict):
+                # a view for all methods is already there, it serves the other methods
+                registered = self.routes[self.url] = {Router.ANY: registered}
+            for method in self.methods:
+                registered[method.upper()] = view
+        elif isinstance(registered, dict):
+            registered[Router.ANY] = view
+        else:
+            self.routes[self.url] = view
+        return cls
 
 
 class Debug:
-    """Decorator"""
+    """
+    Decorator
+    time of every call goes to framework_debug_duration_seconds{name=...} metric,
+    verbose=True also prints it
+    """
 
-    def __init__(self, name):
+    def __init__(self, name, verbose=False):
         self.name = name
+        self.verbose = verbose
+        self.histogram = registry.histogram('framework_debug_duration_seconds', name=name)
 
     def __call__(self, cls):
         def timeit(method):
             def timed(*args, **kw):
-                ts = time()
+                ts = perf_counter_ns()
                 result = method(*args, **kw)
-                te = time()
-                delta = te - ts
+                delta = perf_counter_ns() - ts
+                self.histogram.observe(delta)
 
-                print(f'DEBUG: {self.name} took {delta:2.2f} ms')
+                if self.verbose:
+                    print(f'DEBUG: {self.name} took {delta / 1e6:.2f} ms')
                 return result
 
             return timed
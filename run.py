@@ -1,12 +1,28 @@
+import argparse
 from wsgiref.simple_server import make_server
 
 from framework.main import Framework
-from urls import fronts
+from framework.server import add_arguments, serve
+from framework.templator import precompile
+from urls import fronts, static_files
+from patterns.creational_patterns import connection_pool
 from patterns.structural_patterns import routes
 
 
 if __name__ == '__main__':
-    application = Framework(routes, fronts)
-    with make_server('', 8080, application) as httpd:
-        print("Starting server http://127.0.0.1:8080...")
-        httpd.serve_forever()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefork', action='store_true',
+                        help='prefork server with keep-alive instead of wsgiref')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    # a database connection for every server thread
+    connection_pool.ensure_size(args.threads)
+    application = Framework(routes, fronts, static=static_files)
+    print(f'Templates precompiled: {precompile()}')
+    if args.prefork:
+        serve(application, args)
+    else:
+        with make_server(args.host, args.port, application) as httpd:
+            print(f"Starting server http://127.0.0.1:{args.port}...")
+            httpd.serve_forever()
@@ -0,0 +1,8 @@
+from framework.asgi import AsgiFramework
+from urls import fronts, static_files
+from patterns.creational_patterns import connection_pool
+from patterns.structural_patterns import routes
+
+
+# no more view threads than database connections
+application = AsgiFramework(routes, fronts, max_workers=connection_pool.max_size, static=static_files)
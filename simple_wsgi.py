@@ -1,6 +1,7 @@
 from framework.main import Framework
-from urls import routes, fronts
+from urls import fronts, static_files
+from patterns.structural_patterns import routes
 
 
-if __name__ == '__main__':
-    application = Framework(routes, fronts)
+# routes are registered by AppRoute when urls imports views
+application = Framework(routes, fronts, static=static_files)
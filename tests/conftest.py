@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# tests import the project packages the way run.py does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from patterns.creational_patterns import ConnectionPool, MapperRegistry  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """Mapper registry on an empty database made from utils/create_db.sql"""
+    pool = ConnectionPool(str(tmp_path / 'test.sqlite'), max_size=2, timeout=0.5)
+    with open(os.path.join(ROOT, 'utils', 'create_db.sql'), encoding='utf-8') as f:
+        pool.get_connection().executescript(f.read())
+    pool.release_thread()
+    previous = MapperRegistry.pool
+    MapperRegistry.set_pool(pool)
+    yield pool
+    MapperRegistry.set_pool(previous)
+    pool.release_thread()
+    pool.close()
@@ -0,0 +1,125 @@
+from io import BytesIO
+
+from framework.cache import ResponseCache
+from framework.main import Framework
+from framework.middleware import Middleware
+
+
+class Counter:
+    cache_ttl = 60
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        return '200 OK', f'page {self.calls}'
+
+
+class Form:
+    invalidates_cache = True
+
+    def __call__(self, request):
+        return '200 OK', 'form'
+
+
+class Rejected(Form):
+    def __call__(self, request):
+        return '400 Bad Request', 'invalid'
+
+
+def get(application, path, method='GET', **extra):
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '',
+               'wsgi.input': BytesIO(b''), **extra}
+    result = {}
+
+    def start_response(code, headers):
+        result['code'] = code
+        result['headers'] = dict(headers)
+
+    result['body'] = b''.join(application(environ, start_response))
+    return result
+
+
+def make_application():
+    counter = Counter()
+    views = {'/page/': counter, '/form/': Form(), '/rejected/': Rejected()}
+    return Framework(views, []), counter
+
+
+def test_cached_get_and_etag():
+    application, counter = make_application()
+    first = get(application, '/page/')
+    assert get(application, '/page/')['body'] == first['body'] == b'page 1'
+    assert counter.calls == 1
+    not_modified = get(application, '/page/', HTTP_IF_NONE_MATCH=first['headers']['ETag'])
+    assert not_modified['code'].startswith('304')
+    assert not_modified['body'] == b''
+
+
+def test_get_of_a_form_page_keeps_the_cache():
+    application, counter = make_application()
+    get(application, '/page/')
+    get(application, '/form/')
+    get(application, '/form/', method='HEAD')
+    assert get(application, '/page/')['body'] == b'page 1'
+    assert counter.calls == 1
+
+
+def test_successful_post_invalidates():
+    application, counter = make_application()
+    get(application, '/page/')
+    get(application, '/form/', method='POST')
+    assert get(application, '/page/')['body'] == b'page 2'
+
+
+def test_failed_post_keeps_the_cache():
+    application, counter = make_application()
+    get(application, '/page/')
+    get(application, '/rejected/', method='POST')
+    assert get(application, '/page/')['body'] == b'page 1'
+
+
+def test_invalidate_by_prefix():
+    cache = ResponseCache()
+    cache.set('/courses/?', '200 OK', [], b'courses')
+    cache.set('/students/?', '200 OK', [], b'students')
+    cache.invalidate('/courses/')
+    assert cache.get('/courses/?') is None
+    assert cache.get('/students/?').body == b'students'
+
+
+class Commit(Middleware):
+    """Front writing the view's changes after the response, like the unit of work"""
+
+    def __init__(self, rows, application_getter):
+        self.rows = rows
+        self.application_getter = application_getter
+
+    def complete_response(self, request, response):
+        if request.method == 'POST':
+            # another request reads the page before the commit and caches the old rows
+            get(self.application_getter(), '/rows/')
+            self.rows['value'] = self.rows.pop('pending')
+
+
+def test_cache_is_invalidated_after_the_commit():
+    rows = {'value': 'old'}
+
+    class Rows:
+        cache_ttl = 60
+
+        def __call__(self, request):
+            return '200 OK', rows['value']
+
+    class Update(Form):
+        def __call__(self, request):
+            rows['pending'] = 'new'
+            return '200 OK', 'updated'
+
+    application = None
+    application = Framework({'/rows/': Rows(), '/update/': Update()},
+                            [Commit(rows, lambda: application)])
+    assert get(application, '/rows/')['body'] == b'old'
+    get(application, '/update/', method='POST')
+    assert get(application, '/rows/')['body'] == b'new'
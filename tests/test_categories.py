@@ -0,0 +1,72 @@
+from patterns.creational_patterns import Category, CourseFactory
+
+
+def recount(category):
+    """(own and ancestors' courses, own and descendants' courses) counted from scratch"""
+    inherited = len(category.courses)
+    parent = category.parent_category
+    while parent is not None:
+        inherited += len(parent.courses)
+        parent = parent.parent_category
+    subtree = len(category.courses) + sum(recount(child)[1] for child in category.children)
+    return inherited, subtree
+
+
+def assert_counts(root):
+    for category in root.walk():
+        assert (category.course_count(), category.subtree_count) == recount(category), category.name
+
+
+def make_tree():
+    root = Category('root', None)
+    left = Category('left', root)
+    right = Category('right', root)
+    leaf = Category('leaf', left)
+    return root, left, right, leaf
+
+
+def test_tree_links_and_paths():
+    root, left, right, leaf = make_tree()
+    assert root.children == [left, right]
+    assert leaf.path == f'/{root.id}/{left.id}/{leaf.id}/'
+    assert leaf.depth == 2
+    assert list(leaf.ancestors()) == [left, root]
+    assert list(root.descendants()) == [left, leaf, right]
+    assert leaf.is_descendant_of(root)
+    assert not root.is_descendant_of(root)
+    assert not right.is_descendant_of(left)
+
+
+def test_adding_courses_updates_ancestors_and_descendants():
+    root, left, right, leaf = make_tree()
+    CourseFactory.create('record', 'root course', root)
+    CourseFactory.create('interactive', 'left course', left)
+    CourseFactory.create('record', 'leaf course', leaf)
+    assert_counts(root)
+    assert leaf.course_count() == 3
+    assert right.course_count() == 1
+    assert root.subtree_count == 3
+    assert [course.name for course in left.subtree_courses()] == ['left course', 'leaf course']
+
+
+def test_category_added_later_inherits_the_counts():
+    root, left, right, leaf = make_tree()
+    CourseFactory.create('record', 'first', root)
+    CourseFactory.create('record', 'second', left)
+    late = Category('late', leaf)
+    assert late.course_count() == 2
+    CourseFactory.create('record', 'third', late)
+    assert_counts(root)
+
+
+def test_clone_and_remove_keep_the_counts():
+    root, left, right, leaf = make_tree()
+    course = CourseFactory.create('record', 'original', left)
+    clone = course.clone(name='copy')
+    assert_counts(root)
+    assert leaf.course_count() == 2
+    left.remove_course(course)
+    assert_counts(root)
+    assert leaf.course_count() == 1
+    assert left.courses == [clone]
+    assert root.subtree_count == 1
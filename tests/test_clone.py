@@ -0,0 +1,65 @@
+from patterns.creational_patterns import Category, CourseFactory, Engine, RecordCourse, Student
+
+
+class Listener:
+    def __init__(self):
+        self.updates = []
+
+    def message(self, subject):
+        return subject.name
+
+    def update(self, subject):
+        self.updates.append(subject.name)
+
+    def send(self, message):
+        self.updates.append(message)
+
+
+def make_course(name):
+    category = Category(f'{name} category', None)
+    course = CourseFactory.create('record', name, category)
+    return category, course
+
+
+def test_clone_shares_fields_and_is_linked_into_the_category():
+    category, course = make_course('prototype')
+    clone = course.clone(name='prototype copy')
+    assert type(clone) is RecordCourse
+    assert clone.name == 'prototype copy'
+    assert course.name == 'prototype'
+    assert clone.category is category
+    assert category.courses == [course, clone]
+
+
+def test_clone_starts_without_students():
+    _, course = make_course('with students')
+    student = Student('enrolled')
+    course.add_student(student)
+    clone = course.clone(name='without students')
+    assert list(clone.students) == []
+    assert list(course.students) == [student]
+    clone.add_student(Student('other'))
+    assert list(course.students) == [student]
+
+
+def test_observers_are_copied_on_write():
+    _, course = make_course('observed')
+    first, second = Listener(), Listener()
+    course.attach(first)
+    clone = course.clone(name='observed copy')
+    assert list(clone.observers) == [first]
+    clone.attach(second)
+    course.detach(first)
+    assert list(clone.observers) == [first, second]
+    assert list(course.observers) == []
+
+
+def test_engine_clone_is_indexed_by_its_new_name():
+    site = Engine()
+    category, course = make_course('indexed')
+    site.categories.append(category)
+    site.courses.append(course)
+    clone = site.clone_course(course, 'copy_indexed')
+    assert site.get_course('copy_indexed') is clone
+    assert site.get_course('indexed') is course
+    assert site.courses_by_category(category) == [course, clone]
@@ -0,0 +1,77 @@
+from patterns.architectural_system_patterns import IndexedCollection
+
+
+class Item:
+    def __init__(self, id, name, group):
+        self.id = id
+        self.name = name
+        self.group = group
+
+    def __repr__(self):
+        return f'<Item {self.id}>'
+
+
+def make(*items):
+    return IndexedCollection(items, unique=('id', 'name'),
+                             multi={'group': lambda item: item.group})
+
+
+def assert_indexes_match(collection):
+    """Indexes equal the ones built from scratch"""
+    fresh = make(*collection)
+    for attr, index in collection.unique.items():
+        assert index == fresh.unique[attr]
+    for name, (_, index) in collection.multi.items():
+        assert {key: group for key, group in index.items() if group} == \
+            {key: group for key, group in fresh.multi[name][1].items() if group}
+
+
+def test_lookups():
+    a, b, c = Item(1, 'a', 'x'), Item(2, 'b', 'x'), Item(3, 'c', 'y')
+    collection = make(a, b, c)
+    assert collection.get('id', 2) is b
+    assert collection.get('name', 'c') is c
+    assert collection.get('name', 'missing') is None
+    assert collection.filter('group', 'x') == [a, b]
+    assert collection.filter('group', 'none') == []
+    # filter gives a copy, the index can't be changed through it
+    collection.filter('group', 'x').clear()
+    assert collection.filter('group', 'x') == [a, b]
+
+
+def test_append_and_remove():
+    a, b = Item(1, 'a', 'x'), Item(2, 'b', 'y')
+    collection = make(a)
+    collection.append(b)
+    collection += [Item(3, 'c', 'y')]
+    assert collection.get('id', 2) is b
+    collection.remove(b)
+    assert collection.get('id', 2) is None
+    assert [item.id for item in collection.filter('group', 'y')] == [3]
+    assert_indexes_match(collection)
+
+
+def test_duplicate_value_takes_the_place_of_the_removed_one():
+    first, second = Item(1, 'same', 'x'), Item(2, 'same', 'x')
+    collection = make(first, second)
+    assert collection.get('name', 'same') is first
+    collection.remove(first)
+    assert collection.get('name', 'same') is second
+    collection.pop()
+    assert collection.get('name', 'same') is None
+    assert_indexes_match(collection)
+
+
+def test_positional_changes_reindex():
+    items = [Item(i, f'item_{i}', i % 2) for i in range(6)]
+    collection = make(*items)
+    collection.insert(0, Item(10, 'first', 1))
+    del collection[3]
+    collection[1] = Item(11, 'replaced', 0)
+    collection.pop(0)
+    assert_indexes_match(collection)
+    assert collection.get('id', 10) is None
+    assert collection.get('id', 11) is collection[0]
+    collection.clear()
+    assert collection.get('id', 11) is None
+    assert collection.filter('group', 0) == []
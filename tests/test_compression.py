@@ -0,0 +1,162 @@
+import asyncio
+import gzip
+import threading
+import zlib
+
+import pytest
+
+from framework.asgi import AsgiFramework
+from framework.compression import CompressionMiddleware, get_header, parse_accept_encoding
+
+HTML = [('Content-Type', 'text/html; charset=utf-8')]
+PAGE = '<p>курс</p>\n' * 100
+
+
+class Request:
+    def __init__(self, accept_encoding=None):
+        self.environ = {}
+        if accept_encoding is not None:
+            self.environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+
+
+def respond(accept_encoding, body, headers=HTML, code='200 OK', **kwargs):
+    middleware = CompressionMiddleware(**kwargs)
+    return middleware.after_response(Request(accept_encoding), (code, list(headers), body))
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip;q=0.5, Deflate , br;q=bad,') == \
+        {'gzip': 0.5, 'deflate': 1.0, 'br': 0.0}
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, None),
+    ('', None),
+    ('gzip', 'gzip'),
+    ('deflate, gzip', 'gzip'),
+    ('gzip;q=0.5, deflate', 'deflate'),
+    ('gzip;q=0, deflate;q=0', None),
+    ('identity;q=0, gzip', 'gzip'),
+    ('identity', None),
+    ('br', None),
+    ('*', 'gzip'),
+    ('*;q=0.1, deflate;q=0.5', 'deflate'),
+    ('*, gzip;q=0', 'deflate'),
+])
+def test_choose_encoding(accept_encoding, expected):
+    assert CompressionMiddleware().choose_encoding(accept_encoding) == expected
+
+
+def test_body_is_compressed_with_the_negotiated_encoding():
+    code, headers, body = respond('gzip', PAGE, HTML + [('ETag', '"abc"')])
+    assert gzip.decompress(body).decode('utf-8') == PAGE
+    assert get_header(headers, 'Content-Encoding') == 'gzip'
+    assert get_header(headers, 'Content-Length') == str(len(body))
+    assert get_header(headers, 'ETag') == 'W/"abc"'
+    code, headers, body = respond('deflate', PAGE)
+    assert zlib.decompress(body).decode('utf-8') == PAGE
+
+
+def test_small_and_binary_bodies_stay_as_they_are():
+    small = 'x' * 499
+    code, headers, body = respond('gzip', small)
+    assert body == small.encode('utf-8')
+    assert get_header(headers, 'Content-Encoding') is None
+    assert get_header(headers, 'Vary') == 'Accept-Encoding'
+    assert get_header(respond('gzip', small, min_size=100)[1], 'Content-Encoding') == 'gzip'
+    image = [('Content-Type', 'image/png')]
+    assert respond('gzip', b'\x89PNG' * 500, image) == ('200 OK', image, b'\x89PNG' * 500)
+
+
+def test_vary_is_added_or_merged():
+    assert get_header(respond(None, PAGE)[1], 'Vary') == 'Accept-Encoding'
+    assert get_header(respond('gzip', PAGE, HTML + [('Vary', 'Cookie')])[1], 'Vary') == \
+        'Cookie, Accept-Encoding'
+    headers = respond('gzip', PAGE, HTML + [('Vary', 'accept-encoding')])[1]
+    assert [name for name, _ in headers].count('Vary') == 1
+
+
+def test_not_modified_keeps_the_weak_etag():
+    code, headers, _ = respond('gzip', b'', [('ETag', '"abc"')], code='304 Not Modified')
+    assert get_header(headers, 'ETag') == 'W/"abc"'
+    assert get_header(headers, 'Vary') == 'Accept-Encoding'
+    code, headers, _ = respond(None, b'', [('ETag', '"abc"')], code='304 Not Modified')
+    assert get_header(headers, 'ETag') == '"abc"'
+
+
+def test_stream_is_compressed_chunk_by_chunk():
+    closed = []
+
+    class Stream:
+        def __iter__(self):
+            for line in PAGE.splitlines(keepends=True):
+                yield line
+
+        def close(self):
+            closed.append(True)
+
+    code, headers, body = respond('gzip', Stream(), HTML + [('Content-Length', '9999')])
+    assert get_header(headers, 'Content-Encoding') == 'gzip'
+    assert get_header(headers, 'Content-Length') is None
+    chunks = list(body)
+    assert len(chunks) > 2
+    assert gzip.decompress(b''.join(chunks)).decode('utf-8') == PAGE
+    assert closed
+    # every chunk is flushed: what's sent so far decompresses to a prefix of the page
+    decompressor = zlib.decompressobj(31)
+    assert PAGE.encode('utf-8').startswith(decompressor.decompress(chunks[0]))
+
+
+def test_same_etag_is_compressed_once():
+    middleware = CompressionMiddleware()
+    request = Request('gzip')
+    headers = HTML + [('ETag', '"v1"')]
+    first = middleware.after_response(request, ('200 OK', headers, PAGE))[2]
+    second = middleware.after_response(request, ('200 OK', headers, PAGE))[2]
+    assert first is second
+
+
+def test_stream_is_not_read_by_after_response():
+    pulled = []
+
+    def stream():
+        for line in PAGE.splitlines(keepends=True):
+            pulled.append(line)
+            yield line
+
+    code, headers, body = respond('gzip', stream())
+    assert pulled == []
+    assert get_header(headers, 'Content-Encoding') == 'gzip'
+    assert gzip.decompress(b''.join(body)).decode('utf-8') == PAGE
+    # a short stream is compressed too, unless its Content-Length says it's short
+    assert gzip.decompress(b''.join(respond('gzip', iter(['short']))[2])) == b'short'
+    short = respond('gzip', iter(['short']), HTML + [('Content-Length', '5')])
+    assert get_header(short[1], 'Content-Encoding') is None
+
+
+def test_asgi_stream_is_read_outside_the_event_loop():
+    threads = set()
+
+    def view(request):
+        def stream():
+            for line in PAGE.splitlines(keepends=True):
+                threads.add(threading.current_thread())
+                yield line
+        return '200 OK', stream()
+
+    application = AsgiFramework({'/page/': view}, [CompressionMiddleware()], max_workers=2)
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/page/', 'query_string': b'',
+             'headers': [(b'accept-encoding', b'gzip')], 'server': ('testserver', 80)}
+    asyncio.run(application(scope, receive, send))
+    assert (b'content-encoding', b'gzip') in messages[0]['headers']
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    assert gzip.decompress(body).decode('utf-8') == PAGE
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from io import BytesIO
+
+from framework.main import Framework
+from patterns.architectural_system_patterns import UnitOfWorkMiddleware
+from patterns.creational_patterns import SCHEMA, ConnectionPool, MapperRegistry
+
+
+def environ(path='/'):
+    return {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'wsgi.input': BytesIO(b'')}
+
+
+def test_request_checkout_is_returned(pool):
+    token = pool.begin_request()
+    connection = pool.get_connection()
+    assert pool.get_connection() is connection
+    assert pool.stats()['in_use'] == 1
+    pool.end_request(token)
+    assert pool.stats()['in_use'] == 0
+
+
+def test_more_threads_than_connections(pool):
+    errors = []
+
+    def work():
+        try:
+            for _ in range(20):
+                token = pool.begin_request()
+                pool.get_connection().execute('SELECT 1').fetchall()
+                pool.end_request(token)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert pool.stats()['timeouts'] == 0
+    assert pool.stats()['size'] <= pool.max_size
+
+
+class Rows:
+    def __call__(self, request):
+        cursor = MapperRegistry.pool.get_connection().execute('SELECT 1 UNION ALL SELECT 2')
+        return '200 OK', (f'{row[0]}\n' for row in cursor)
+
+
+class Failing:
+    def __call__(self, request):
+        MapperRegistry.pool.get_connection()
+        raise RuntimeError('view failed')
+
+
+def test_streamed_body_keeps_the_connection_until_closed(pool):
+    application = Framework({'/rows/': Rows()}, [UnitOfWorkMiddleware(MapperRegistry)])
+    result = application(environ('/rows/'), lambda code, headers: None)
+    assert pool.stats()['in_use'] == 1
+    assert b''.join(result) == b'1\n2\n'
+    assert pool.stats()['in_use'] == 0
+
+
+def test_connection_is_returned_on_error(pool):
+    application = Framework({'/fail/': Failing()}, [UnitOfWorkMiddleware(MapperRegistry)])
+    try:
+        application(environ('/fail/'), lambda code, headers: None)
+    except RuntimeError:
+        pass
+    assert pool.stats()['in_use'] == 0
+
+
+class LazyRows:
+    """Queries run while the body is sent, like lazy collections of a streamed template"""
+
+    def __call__(self, request):
+        def body():
+            for number in (1, 2):
+                row = MapperRegistry.pool.get_connection().execute('SELECT ?', (number,)).fetchone()
+                yield f'{row[0]}\n'
+        return '200 OK', body()
+
+
+def test_streamed_body_queries_use_the_request_connection(pool):
+    application = Framework({'/lazy/': LazyRows()}, [UnitOfWorkMiddleware(MapperRegistry)])
+    for _ in range(3):
+        result = application(environ('/lazy/'), lambda code, headers: None)
+        assert b''.join(result) == b'1\n2\n'
+        result.close()
+        assert pool.stats()['in_use'] == 0
+
+
+def test_schema_is_created_on_an_old_database(tmp_path):
+    database = str(tmp_path / 'old.sqlite')
+    connection = sqlite3.connect(database)
+    connection.execute('CREATE TABLE student (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR (32))')
+    connection.close()
+    pool = ConnectionPool(database, max_size=1, schema=SCHEMA)
+    with pool.connection() as connection:
+        tables = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    pool.close()
+    assert 'student_course' in tables
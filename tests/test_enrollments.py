@@ -0,0 +1,93 @@
+from patterns.architectural_system_patterns import AssociationTable, UnitOfWork
+from patterns.creational_patterns import Category, CourseFactory, MapperRegistry, Student, enrollments
+
+
+class Item:
+    __slots__ = ('name', 'handle')
+
+    def __init__(self, name):
+        self.name = name
+        self.handle = None
+
+
+def test_add_is_idempotent_and_ordered():
+    table = AssociationTable()
+    student, first, second = Item('student'), Item('first'), Item('second')
+    assert table.add(student, first)
+    assert table.add(student, second)
+    assert not table.add(student, first)
+    assert table.related(student) == [first, second]
+    assert table.related(first) == [student]
+    assert len(table) == 2
+
+
+def test_discard_reuses_the_handle():
+    table = AssociationTable()
+    student, course = Item('student'), Item('course')
+    table.add(student, course)
+    handle = student.handle
+    table.discard(student)
+    assert table.related(course) == []
+    other = Item('other')
+    table.add(other, course)
+    assert other.handle == handle
+    assert len(table.objects) == 2
+
+
+def test_loading_a_student_twice_does_not_duplicate_enrollments(pool):
+    course = CourseFactory.create('record', 'enrollment_test_course', Category('enrollments', None))
+    MapperRegistry.set_resolver('course', lambda name: course if name == course.name else None)
+    connection = pool.get_connection()
+    connection.execute("INSERT INTO student (id, name) VALUES (1, 'Petr')")
+    connection.execute("INSERT INTO student_course (student_id, course_name) VALUES (1, ?)", (course.name,))
+    connection.commit()
+    objects_before = len(enrollments.objects)
+
+    for _ in range(3):
+        # every request has its own unit of work and identity map
+        token = UnitOfWork.set_current(UnitOfWork())
+        try:
+            student = MapperRegistry.get_current_mapper('student').page(limit=10)[0]
+            assert [loaded.name for loaded in student.courses] == [course.name]
+        finally:
+            UnitOfWork.current.reset(token)
+
+    assert course.students == []
+    assert len(enrollments.objects) == objects_before
+    engine_student = Student('Ivan')
+    course.add_student(engine_student)
+    assert course.students == [engine_student]
+
+
+def test_courses_of_listed_students_are_loaded_by_batches(pool, monkeypatch):
+    category = Category('batches', None)
+    courses = {name: CourseFactory.create('record', name, category) for name in ('math', 'art')}
+    monkeypatch.setitem(MapperRegistry.resolvers, 'course', courses.get)
+    connection = pool.get_connection()
+    connection.executemany('INSERT INTO student (id, name) VALUES (?, ?)',
+                           [(id, f'student_{id}') for id in range(1, 302)])
+    connection.executemany('INSERT INTO student_course (student_id, course_name) VALUES (?, ?)',
+                           [(id, name) for id in range(1, 302, 2) for name in courses])
+    connection.commit()
+    queries = []
+    connection.set_trace_callback(queries.append)
+    token = UnitOfWork.set_current(UnitOfWork())
+    try:
+        mapper = MapperRegistry.get_current_mapper('student')
+        loaded = {student.id: sorted(course.name for course in student.courses)
+                  for student in mapper.iterate(batch_size=100)}
+        # one select of the students, one of the courses per fetchmany batch
+        assert len([query for query in queries if 'student_course' in query]) == 4
+        assert loaded[1] == ['art', 'math']
+        assert loaded[2] == []
+        assert len(loaded) == 301
+        queries.clear()
+        page = mapper.page(limit=50)
+        assert sorted(course.name for course in page[0].courses) == loaded[1]
+        assert all(student.courses == [] for student in page[1::2])
+        assert len([query for query in queries if 'student_course' in query]) == 1
+        # a student found by id loads only its own courses
+        assert sorted(course.name for course in mapper.find_by_id(301).courses) == ['art', 'math']
+    finally:
+        UnitOfWork.current.reset(token)
+        connection.set_trace_callback(None)
@@ -0,0 +1,53 @@
+import os
+import time
+
+from patterns.behavioral_patterns import BufferedFileWriter
+
+
+def read(file_name):
+    if not os.path.exists(file_name):
+        return ''
+    with open(file_name, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_lines_wait_for_a_batch_or_the_interval(tmp_path):
+    file_name = str(tmp_path / 'log.txt')
+    writer = BufferedFileWriter(file_name, batch_size=3, flush_interval=0.3)
+    try:
+        writer.write('first')
+        time.sleep(0.1)
+        assert read(file_name) == ''
+        writer.write('second')
+        writer.write('third')
+        time.sleep(0.1)
+        assert read(file_name) == 'first\nsecond\nthird\n'
+        writer.write('fourth')
+        time.sleep(0.5)
+        assert read(file_name).endswith('fourth\n')
+    finally:
+        writer.close()
+
+
+def test_flush_writes_a_partial_batch(tmp_path):
+    file_name = str(tmp_path / 'log.txt')
+    writer = BufferedFileWriter(file_name, batch_size=100, flush_interval=60)
+    try:
+        writer.write('line')
+        writer.flush()
+        assert read(file_name) == 'line\n'
+    finally:
+        writer.close()
+
+
+def test_forked_worker_writes_its_own_file(tmp_path):
+    file_name = str(tmp_path / 'log.txt')
+    writer = BufferedFileWriter(file_name)
+    writer.after_fork()
+    try:
+        writer.write('worker')
+        writer.flush()
+    finally:
+        writer.close()
+    assert read(str(tmp_path / f'log.{os.getpid()}.txt')) == 'worker\n'
+    assert not os.path.exists(file_name)
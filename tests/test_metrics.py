@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import os
+import tracemalloc
+from io import BytesIO
+
+from framework.asgi import AsgiFramework
+from framework.http_requests import Request
+from framework.main import Framework
+from framework.metrics import MetricsMiddleware, ProfilingMiddleware, memory_tracing, registry
+from patterns.structural_patterns import Debug
+
+
+def profiled_view(request):
+    return '200 OK', 'profiled'
+
+
+def environ(path='/page/'):
+    return {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'wsgi.input': BytesIO(b'')}
+
+
+def read_profiles(folder):
+    return [open(os.path.join(folder, name), encoding='utf-8').read()
+            for name in os.listdir(folder)]
+
+
+def test_wsgi_profiles_the_view(tmp_path):
+    profiler = ProfilingMiddleware(sample_rate=1, slow_ms=0, folder=str(tmp_path))
+    application = Framework({'/page/': profiled_view}, [profiler])
+    assert b''.join(application(environ(), lambda code, headers: None)) == b'profiled'
+    profiles = read_profiles(str(tmp_path))
+    assert len(profiles) == 1
+    assert 'profiled_view' in profiles[0]
+
+
+def test_asgi_profiles_the_view_thread(tmp_path):
+    profiler = ProfilingMiddleware(sample_rate=1, slow_ms=0, folder=str(tmp_path))
+    application = AsgiFramework({'/page/': profiled_view}, [profiler], max_workers=1)
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/page/', 'query_string': b'',
+             'headers': [], 'server': ('testserver', 80)}
+    asyncio.run(application(scope, receive, send))
+    profiles = read_profiles(str(tmp_path))
+    assert len(profiles) == 1
+    assert 'profiled_view' in profiles[0]
+
+
+def test_overlapping_memory_profiles(tmp_path):
+    profiler = ProfilingMiddleware(sample_rate=1, slow_ms=0, folder=str(tmp_path), memory=True)
+    first, second = contextvars.copy_context(), contextvars.copy_context()
+    first_request, second_request = Request(environ(), '/page/'), Request(environ(), '/page/')
+    first.run(profiler.before_request, first_request)
+    second.run(profiler.before_request, second_request)
+    first.run(profiler.after_response, first_request, ('200 OK', [], b''))
+    # the second request still needs tracing
+    assert tracemalloc.is_tracing()
+    second.run(profiler.after_response, second_request, ('200 OK', [], b''))
+    assert not tracemalloc.is_tracing()
+    assert memory_tracing.users == 0
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_failed_view_stops_tracing(tmp_path):
+    def failing_view(request):
+        raise RuntimeError('view failed')
+
+    profiler = ProfilingMiddleware(sample_rate=1, slow_ms=0, folder=str(tmp_path), memory=True)
+    application = Framework({'/page/': failing_view}, [profiler])
+    try:
+        application(environ(), lambda code, headers: None)
+    except RuntimeError:
+        pass
+    assert not tracemalloc.is_tracing()
+    assert memory_tracing.users == 0
+
+
+def test_stage_timers_and_pool_are_exported():
+    application = Framework({'/page/': profiled_view}, [MetricsMiddleware()])
+    application(environ(), lambda code, headers: None)
+    text = registry.prometheus()
+    assert '# TYPE framework_stage_count gauge' in text
+    assert 'framework_stage_count{stage="MetricsMiddleware"} 1\n' in text
+    assert 'framework_stage_max_ms{stage="MetricsMiddleware"}' in text
+    # the pool of patterns.creational_patterns registers itself on import
+    assert '\nframework_db_pool_max_size ' in text
+    assert '\nframework_db_pool_in_use 0\n' in text
+
+
+def test_debug_is_quiet_by_default(capsys):
+    @Debug(name='quiet')
+    def view():
+        return 'done'
+
+    assert view() == 'done'
+    assert capsys.readouterr().out == ''
+    assert registry.histogram('framework_debug_duration_seconds', name='quiet').count == 1
@@ -0,0 +1,92 @@
+import asyncio
+
+from framework.middleware import Middleware, compile_pipeline, wrap_async_stage, wrap_stage
+
+
+class Recorder(Middleware):
+    def __init__(self, name, events, order=0, response=None):
+        self.__name__ = name
+        self.events = events
+        self.order = order
+        self.response = response
+
+    def before_request(self, request):
+        self.events.append(f'before {self.__name__}')
+        return self.response
+
+    def after_response(self, request, response):
+        self.events.append(f'after {self.__name__}')
+        code, headers, body = response
+        return code, headers, f'{body} {self.__name__}'
+
+
+def make_view(events):
+    def view(request):
+        events.append('view')
+        return '200 OK', [], 'body'
+    return view
+
+
+def test_stages_run_by_order_and_unwind_in_reverse():
+    events = []
+
+    def front(request):
+        events.append('front')
+
+    fronts = [Recorder('last', events, order=10), front, Recorder('first', events, order=-5)]
+    handler, timers = compile_pipeline(fronts, make_view(events), wrap_stage)
+    response = handler({})
+    assert events == ['before first', 'front', 'before last', 'view', 'after last', 'after first']
+    assert response == ('200 OK', [], 'body last first')
+    assert set(timers) == {'first', 'front', 'last'}
+    assert all(timer.stats()['count'] == 1 for timer in timers.values())
+
+
+def test_before_request_response_skips_the_inner_stages():
+    events = []
+    fronts = [Recorder('outer', events, order=-1),
+              Recorder('guard', events, response=('403 Forbidden', 'no')),
+              Recorder('inner', events, order=1)]
+    handler, _ = compile_pipeline(fronts, make_view(events), wrap_stage)
+    code, headers, body = handler({})
+    assert events == ['before outer', 'before guard', 'after outer']
+    assert code == '403 Forbidden'
+    assert body == 'no outer'
+    assert headers == [('Content-Type', 'text/html')]
+
+
+def test_after_response_returning_none_keeps_the_response():
+    class Passive(Middleware):
+        def after_response(self, request, response):
+            return None
+
+    handler, _ = compile_pipeline([Passive()], make_view([]), wrap_stage)
+    assert handler({}) == ('200 OK', [], 'body')
+
+
+def test_stage_names_are_unique():
+    events = []
+    fronts = [Recorder('same', events), Recorder('same', events)]
+    _, timers = compile_pipeline(fronts, make_view(events), wrap_stage)
+    assert len(timers) == 2
+
+
+def test_no_fronts_give_the_handler_itself():
+    view = make_view([])
+    handler, timers = compile_pipeline([], view, wrap_stage)
+    assert handler is view
+    assert timers == {}
+
+
+def test_async_stages_keep_the_order():
+    events = []
+
+    async def view(request):
+        events.append('view')
+        return '200 OK', [], 'body'
+
+    fronts = [Recorder('b', events, order=2), Recorder('a', events, order=1)]
+    handler, _ = compile_pipeline(fronts, view, wrap_async_stage)
+    response = asyncio.run(handler({}))
+    assert events == ['before a', 'before b', 'view', 'after b', 'after a']
+    assert response == ('200 OK', [], 'body b a')
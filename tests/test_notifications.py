@@ -0,0 +1,154 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from patterns import behavioral_patterns
+from patterns.behavioral_patterns import EmailNotifier, FakeGateway, NotificationDispatcher, \
+    Notifier, Subject
+from patterns.creational_patterns import Category, CourseFactory, Student
+
+
+class Blocker:
+    """Observer keeping the worker busy until released"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def send(self, message):
+        self.started.set()
+        self.released.wait(5)
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = NotificationDispatcher(workers=1, batch_size=20, max_retries=3, retry_delay=0.001)
+    yield dispatcher
+    dispatcher.close()
+
+
+def occupy(dispatcher):
+    blocker = Blocker()
+    dispatcher.submit(blocker, 'block')
+    assert blocker.started.wait(5)
+    return blocker
+
+
+def test_messages_of_one_observer_go_by_batches(dispatcher):
+    gateway = FakeGateway()
+    notifier = Notifier(gateway)
+    blocker = occupy(dispatcher)
+    for index in range(10):
+        assert dispatcher.submit(notifier, f'message {index}')
+    blocker.released.set()
+    dispatcher.flush()
+    assert gateway.messages == [f'message {index}' for index in range(10)]
+    assert gateway.calls == 1
+    assert dispatcher.stats()['sent'] == 11
+
+
+def test_failed_send_is_retried(dispatcher):
+    gateway = FakeGateway(fail_times=2)
+    dispatcher.submit(Notifier(gateway), 'hello')
+    dispatcher.flush()
+    assert gateway.messages == ['hello']
+    assert gateway.calls == 3
+    stats = dispatcher.stats()
+    assert (stats['sent'], stats['retried'], stats['failed']) == (1, 2, 0)
+
+
+def test_retries_back_off_exponentially(dispatcher, monkeypatch):
+    delays = []
+    monkeypatch.setattr(behavioral_patterns, 'sleep', delays.append)
+    gateway = FakeGateway(fail_times=3)
+    dispatcher.retry_delay = 0.5
+    dispatcher.submit(Notifier(gateway), 'hello')
+    dispatcher.flush()
+    assert [delay for delay in delays if delay] == [0.5, 1.0, 2.0]
+    assert gateway.messages == ['hello']
+
+
+def test_send_fails_after_the_last_retry(dispatcher):
+    gateway = FakeGateway(fail_times=10)
+    dispatcher.submit(Notifier(gateway), 'first')
+    dispatcher.submit(Notifier(gateway), 'second')
+    dispatcher.flush()
+    assert gateway.messages == []
+    stats = dispatcher.stats()
+    assert stats['failed'] == 2
+    assert stats['retried'] == 6
+    assert isinstance(dispatcher.last_error, ConnectionError)
+
+
+def test_full_queue_rejects_after_the_timeout():
+    dispatcher = NotificationDispatcher(workers=1, max_queue_size=1, submit_timeout=0.01)
+    try:
+        gateway = FakeGateway()
+        notifier = Notifier(gateway)
+        blocker = occupy(dispatcher)
+        assert dispatcher.submit(notifier, 'queued')
+        assert not dispatcher.submit(notifier, 'rejected')
+        assert dispatcher.stats()['rejected'] == 1
+        blocker.released.set()
+        dispatcher.flush()
+        assert gateway.messages == ['queued']
+    finally:
+        dispatcher.close()
+
+
+def test_course_notifies_through_the_dispatcher(dispatcher, monkeypatch):
+    monkeypatch.setattr(Subject, 'dispatcher', dispatcher)
+    gateway = FakeGateway()
+    course = CourseFactory.create('record', 'dispatched course', Category('notifications', None))
+    course.attach(EmailNotifier(gateway))
+    course.add_student(Student('Ivan'))
+    dispatcher.flush()
+    assert gateway.messages == ['Welcome onboard, Ivan']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_child_gets_its_own_threads_and_lock(dispatcher):
+    gateway = FakeGateway()
+    dispatcher.submit(Notifier(gateway), 'parent')
+    dispatcher.flush()
+    # a thread of the parent holds the lock while the process forks
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with dispatcher.lock:
+            locked.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    assert locked.wait(5)
+    pid = os.fork()
+    if not pid:
+        code = 1
+        try:
+            if dispatcher.submit(Notifier(gateway), 'child'):
+                dispatcher.flush()
+                code = 0 if gateway.messages == ['parent', 'child'] else 2
+        finally:
+            os._exit(code)
+    release.set()
+    holder.join()
+    deadline = time.monotonic() + 5
+    status = None
+    while time.monotonic() < deadline:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            break
+        time.sleep(0.01)
+    else:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        pytest.fail('the child is stuck on the lock of the parent')
+    assert os.waitstatus_to_exitcode(status) == 0
+    # the parent's dispatcher goes on as before
+    dispatcher.submit(Notifier(gateway), 'parent again')
+    dispatcher.flush()
+    assert gateway.messages == ['parent', 'parent again']
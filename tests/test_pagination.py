@@ -0,0 +1,100 @@
+import os
+import sqlite3
+
+import pytest
+
+from patterns.behavioral_patterns import ListView
+from patterns.creational_patterns import StudentMapper
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Row:
+    def __init__(self, id):
+        self.id = id
+
+
+class RowsView(ListView):
+    queryset = [Row(id) for id in range(1, 8)]
+    max_paginate_by = 5
+
+    def render_context(self, context):
+        return '200 OK', context
+
+
+def params(**values):
+    return {'request_params': {key: str(value) for key, value in values.items()}}
+
+
+@pytest.mark.parametrize('values, expected', [
+    ({}, (None, None)),
+    ({'limit': 3}, (None, 3)),
+    ({'after': 4}, (4, 5)),
+    ({'after': 0, 'limit': 2}, (0, 2)),
+    ({'limit': 100}, (None, 5)),
+    ({'limit': -3}, (None, 1)),
+    ({'after': 'x', 'limit': 2}, (None, None)),
+])
+def test_page_params(values, expected):
+    assert RowsView().get_page_params(params(**values)) == expected
+
+
+def test_page_size_default_from_paginate_by():
+    view = RowsView()
+    view.paginate_by = 2
+    assert view.get_page_params(params()) == (None, 2)
+    assert view.get_page_params(params(after='bad')) == (None, 2)
+
+
+@pytest.mark.parametrize('after, limit, ids, next_cursor', [
+    (None, 3, [1, 2, 3], 3),
+    (3, 3, [4, 5, 6], 6),
+    # the last page is full: no extra row, no next page
+    (4, 3, [5, 6, 7], None),
+    (6, 3, [7], None),
+    (7, 3, [], None),
+])
+def test_page_boundaries(after, limit, ids, next_cursor):
+    context = RowsView().get_page_context_data(after, limit)
+    assert [row.id for row in context['objects_list']] == ids
+    assert context['next_cursor'] == next_cursor
+    assert context['page_size'] == limit
+
+
+def test_request_without_page_params_gets_everything():
+    code, context = RowsView()(params())
+    assert len(context['objects_list']) == 7
+    code, context = RowsView()(params(after=5, limit=1))
+    assert [row.id for row in context['objects_list']] == [6]
+    assert context['next_cursor'] == 6
+
+
+@pytest.fixture
+def students():
+    connection = sqlite3.connect(':memory:')
+    with open(os.path.join(ROOT, 'utils', 'create_db.sql'), encoding='utf-8') as f:
+        connection.executescript(f.read())
+    connection.executemany('INSERT INTO student (name) VALUES (?)',
+                           [(f'student_{index}',) for index in range(7)])
+    connection.commit()
+    yield StudentMapper(connection)
+    connection.close()
+
+
+def test_mapper_pages_follow_the_cursor(students):
+    pages = []
+    after = None
+    while True:
+        page = students.page(after, 3)
+        if not page:
+            break
+        pages.append([student.id for student in page])
+        after = page[-1].id
+    assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+    assert students.page(7, 3) == []
+
+
+def test_mapper_iterates_by_batches(students):
+    rows = list(students.iterate(batch_size=2))
+    assert [student.name for student in rows] == [f'student_{index}' for index in range(7)]
+    assert len(students.identity_map) == 0
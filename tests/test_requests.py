@@ -0,0 +1,164 @@
+from io import BytesIO
+from urllib.parse import unquote_plus
+
+import pytest
+
+from framework.http_requests import BadRequest, MultipartParser, PostRequest, Request, \
+    RequestEntityTooLarge, RequestParser
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('plain', 'plain'),
+    ('two+words', 'two words'),
+    ('a%20b', 'a b'),
+    ('%D0%BA%D1%83%D1%80%D1%81', 'курс'),
+    ('100%', '100%'),
+    ('%zz', '%zz'),
+    ('back\\slash%21', 'back\\slash!'),
+    ('%E2%82', '\ufffd'),
+])
+def test_unquote(raw, expected):
+    assert RequestParser.unquote(raw) == expected
+
+
+@pytest.mark.parametrize('raw', [
+    '%3D', 'a=%41', '%41=', 'x%3d%3D', '%\n%41', '100%25+', 'a++%20', '%e2%82%ac', '%ff',
+    '%2', '%%41', 'я%20', '\t%41\r', '%41%0A', '%d0%b0%',
+])
+def test_unquote_matches_urllib(raw):
+    assert RequestParser.unquote(raw) == unquote_plus(raw)
+
+
+def test_parse_input_data_edge_cases():
+    data = RequestParser.parse_input_data('a=1&&a=2&flag&empty=&=orphan&b=x%26y')
+    assert data['a'] == '2'
+    assert data.getlist('a') == ['1', '2']
+    assert data['flag'] == ''
+    assert data['empty'] == ''
+    assert data[''] == 'orphan'
+    assert data['b'] == 'x&y'
+    # lists only for the repeated keys
+    assert data.lists == {'a': ['1', '2']}
+    assert data.getlist('b') == ['x&y']
+    assert data.getlist('missing') == []
+    data['a'] = '3'
+    assert data.getlist('a') == ['3']
+    assert RequestParser.parse_input_data('') == {}
+
+
+def environ(method='GET', body=b'', content_type='', query='', **extra):
+    result = {'REQUEST_METHOD': method, 'PATH_INFO': '/', 'QUERY_STRING': query,
+              'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body)) if body else '',
+              'wsgi.input': BytesIO(body)}
+    result.update(extra)
+    return result
+
+
+def test_content_length_errors():
+    with pytest.raises(BadRequest):
+        PostRequest().get_content_length({'CONTENT_LENGTH': 'ten'})
+    with pytest.raises(RequestEntityTooLarge):
+        PostRequest(max_body_size=10).get_content_length({'CONTENT_LENGTH': '11'})
+    assert PostRequest().get_content_length({'CONTENT_LENGTH': ''}) == 0
+
+
+def test_request_is_parsed_lazily():
+    request = Request(environ('POST', b'name=%D0%B0&name=b',
+                              'application/x-www-form-urlencoded', query='id=5',
+                              HTTP_COOKIE='session=abc; broken="', HTTP_X_TOKEN='t'))
+    assert request._data is None
+    assert request['data'].getlist('name') == ['а', 'b']
+    assert request.params['id'] == '5'
+    assert request.headers['x-token'] == 't'
+    assert request.headers['content-type'] == 'application/x-www-form-urlencoded'
+    assert request.cookies == {'session': 'abc'}
+    request['date'] = 'today'
+    assert request.get('date') == 'today'
+    assert request.get('missing') is None
+
+
+def test_get_has_no_body_data():
+    request = Request(environ('GET', b'name=x', 'application/x-www-form-urlencoded'))
+    assert request.data == {}
+    assert request.files == {}
+
+
+def test_body_stream_is_limited_by_content_length():
+    request = Request(environ('PUT', b'abc', 'application/octet-stream'))
+    request.environ['wsgi.input'] = BytesIO(b'abcdef')
+    assert request.body.read() == b'abc'
+    assert request.body.read() == b''
+
+
+BOUNDARY = 'xYzZY'
+
+
+def multipart(*parts):
+    body = b''
+    for headers, content in parts:
+        body += f'--{BOUNDARY}\r\n{headers}\r\n\r\n'.encode('utf-8') + content + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode('utf-8')
+
+
+FORM = multipart(
+    ('Content-Disposition: form-data; name="title"', 'Курс'.encode('utf-8')),
+    ('Content-Disposition: form-data; name="tag"', b'a'),
+    ('Content-Disposition: form-data; name="tag"', b'b'),
+    ('Content-Disposition: form-data; name="file"; filename="notes.txt"\r\n'
+     'Content-Type: text/plain', b'line\r\n--xYz not a boundary\r\n' * 20),
+)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 65536])
+def test_multipart_fields_and_files(chunk_size):
+    parser = MultipartParser(BytesIO(FORM), BOUNDARY.encode('latin-1'), len(FORM),
+                             chunk_size=chunk_size)
+    fields, files = parser.parse()
+    assert fields['title'] == 'Курс'
+    assert fields.getlist('tag') == ['a', 'b']
+    uploaded = files['file']
+    assert uploaded.filename == 'notes.txt'
+    assert uploaded.content_type == 'text/plain'
+    assert uploaded.read() == b'line\r\n--xYz not a boundary\r\n' * 20
+    assert uploaded.size == len(b'line\r\n--xYz not a boundary\r\n') * 20
+
+
+def test_multipart_through_the_request():
+    request = Request(environ('POST', FORM, f'multipart/form-data; boundary="{BOUNDARY}"'))
+    assert request.data['title'] == 'Курс'
+    assert request.files['file'].filename == 'notes.txt'
+
+
+def test_post_request_parses_multipart():
+    environ = {'CONTENT_TYPE': f'multipart/form-data; boundary="{BOUNDARY}"',
+               'CONTENT_LENGTH': str(len(FORM)), 'wsgi.input': BytesIO(FORM)}
+    post_request = PostRequest()
+    data = post_request.get_request_params(environ)
+    assert data['title'] == 'Курс'
+    assert post_request.files['file'].filename == 'notes.txt'
+
+
+def test_big_upload_is_spooled_to_disk():
+    content = b'x' * 5000
+    body = multipart(('Content-Disposition: form-data; name="file"; filename="big.bin"', content))
+    parser = MultipartParser(BytesIO(body), BOUNDARY.encode('latin-1'), len(body),
+                             chunk_size=1024, max_memory_file_size=1000)
+    _, files = parser.parse()
+    assert files['file'].file._rolled
+    assert files['file'].read() == content
+
+
+@pytest.mark.parametrize('body', [
+    FORM[:-30],
+    multipart(('Content-Disposition: form-data', b'no name')),
+    b'--xYzZY\r\nContent-Disposition: form-data; name="a"',
+])
+def test_broken_multipart(body):
+    parser = MultipartParser(BytesIO(body), BOUNDARY.encode('latin-1'), len(body))
+    with pytest.raises(BadRequest):
+        parser.parse()
+
+
+def test_multipart_without_boundary():
+    with pytest.raises(BadRequest):
+        PostRequest.get_boundary('multipart/form-data')
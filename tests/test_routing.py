@@ -0,0 +1,47 @@
+from framework.routing import Router
+from patterns.structural_patterns import AppRoute
+
+
+class View:
+    def __call__(self, request):
+        return '200 OK', type(self).__name__
+
+
+class ListView(View):
+    pass
+
+
+class CreateView(View):
+    pass
+
+
+def register(routes, url, cls, methods=None):
+    route = AppRoute(url, methods=methods)
+    route.routes = routes
+    route(cls)
+
+
+def test_methods_after_plain_view():
+    routes = {}
+    register(routes, '/items/', ListView)
+    register(routes, '/items/', CreateView, methods=['post'])
+    handlers, _ = Router(routes).match('/items/')
+    assert type(handlers['POST']) is CreateView
+    assert type(handlers[Router.ANY]) is ListView
+
+
+def test_plain_view_after_methods():
+    routes = {}
+    register(routes, '/items/', CreateView, methods=['POST'])
+    register(routes, '/items/', ListView)
+    handlers, _ = Router(routes).match('/items/')
+    assert type(handlers['POST']) is CreateView
+    assert type(handlers[Router.ANY]) is ListView
+
+
+def test_typed_segment():
+    routes = {}
+    register(routes, '/courses/<int:id>/', ListView)
+    handlers, params = Router(routes).match('/courses/12/')
+    assert params == {'id': 12}
+    assert Router(routes).match('/courses/abc/')[0] is None
@@ -0,0 +1,18 @@
+import pytest
+
+from framework.http_requests import BadRequest
+from patterns.creational_patterns import Category, CategorySchema
+
+
+def test_fields_order_shares_one_encoder():
+    first = CategorySchema(['name', 'id'])
+    second = CategorySchema(['id', 'name', 'id'])
+    assert first.encode_many is second.encode_many
+    category = Category('serializers', None)
+    assert list(first.dump(category)) == ['id', 'name']
+    assert first.dump(category)['name'] == 'serializers'
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(BadRequest):
+        CategorySchema(['name', 'password'])
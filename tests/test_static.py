@@ -0,0 +1,132 @@
+import gzip
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from framework import templator
+from framework.static import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, StaticFiles
+
+CSS = ('body { color: black; }\n' * 100).encode('utf-8')
+
+
+@pytest.fixture
+def static(tmp_path):
+    folder = tmp_path / 'static'
+    (folder / 'img').mkdir(parents=True)
+    (folder / 'style.css').write_bytes(CSS)
+    (folder / 'img' / 'dot.gif').write_bytes(b'GIF89a')
+    (tmp_path / 'secret.txt').write_text('secret', encoding='utf-8')
+    return StaticFiles(str(folder), prefix='/static/', auto_reload=True)
+
+
+def get(static, path, **headers):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    environ.update(headers)
+    code, headers, body = static.get_response(environ)
+    if not isinstance(body, bytes):
+        with body:
+            body = body.read()
+    return code, dict(headers), body
+
+
+def test_fingerprinted_url_is_cached_for_a_year(static):
+    url = static.url('style.css')
+    assert re.fullmatch(r'/static/style\.[0-9a-f]{10}\.css', url)
+    code, headers, body = get(static, url)
+    assert code == '200 OK'
+    assert body == CSS
+    assert headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert headers['Content-Type'] == 'text/css; charset=utf-8'
+    code, headers, _ = get(static, '/static/style.css')
+    assert headers['Cache-Control'] == REVALIDATE_CACHE_CONTROL
+    assert static.url('missing.css') == '/static/missing.css'
+
+
+def test_etag_and_last_modified_give_304(static):
+    _, headers, _ = get(static, '/static/img/dot.gif')
+    code, _, body = get(static, '/static/img/dot.gif', HTTP_IF_NONE_MATCH=headers['ETag'])
+    assert code == '304 Not Modified'
+    assert body == b''
+    code, _, _ = get(static, '/static/img/dot.gif',
+                     HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+    assert code == '304 Not Modified'
+    code, _, _ = get(static, '/static/img/dot.gif', HTTP_IF_NONE_MATCH='"other"')
+    assert code == '200 OK'
+
+
+def test_gzip_variant_by_accept_encoding(static):
+    code, headers, body = get(static, '/static/style.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(body) == CSS
+    assert headers['ETag'].endswith('-gzip"')
+    # the plain and the compressed body are different representations
+    code, _, _ = get(static, '/static/style.css', HTTP_ACCEPT_ENCODING='gzip',
+                     HTTP_IF_NONE_MATCH=get(static, '/static/style.css')[1]['ETag'])
+    assert code == '200 OK'
+    _, headers, _ = get(static, '/static/style.css', HTTP_ACCEPT_ENCODING='gzip;q=0')
+    assert 'Content-Encoding' not in headers
+
+
+def test_precompressed_file_is_served_as_is(tmp_path, static):
+    prebuilt = gzip.compress(CSS, compresslevel=1, mtime=1)
+    (tmp_path / 'static' / 'style.css.gz').write_bytes(prebuilt)
+    static.scan()
+    _, headers, body = get(static, '/static/style.css', HTTP_ACCEPT_ENCODING='gzip')
+    assert body == prebuilt
+    assert headers['Content-Length'] == str(len(prebuilt))
+    # the .gz file isn't served on its own
+    assert get(static, '/static/style.css.gz')[0].startswith('404')
+
+
+@pytest.mark.parametrize('path', [
+    '/static/../secret.txt',
+    '/static/img/../../secret.txt',
+    '/static//etc/passwd',
+    '/static/' + os.path.abspath(os.sep),
+])
+def test_paths_outside_the_folder_are_not_found(static, path):
+    code, _, body = get(static, path)
+    assert code.startswith('404')
+    assert b'secret' not in body
+
+
+def test_changed_file_is_read_again(tmp_path, static):
+    old_url = static.url('style.css')
+    path = tmp_path / 'static' / 'style.css'
+    path.write_bytes(CSS + b'a { color: red; }\n')
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+    assert get(static, '/static/style.css')[2].endswith(b'red; }\n')
+    assert static.url('style.css') != old_url
+
+
+def test_only_get_and_head(static):
+    code, headers, _ = static.get_response({'REQUEST_METHOD': 'POST', 'PATH_INFO': '/static/style.css'})
+    assert code.startswith('405')
+    code, headers, body = static.get_response({'REQUEST_METHOD': 'HEAD', 'PATH_INFO': '/static/style.css'})
+    assert body == b''
+    assert headers[-1] == ('Content-Length', str(len(CSS)))
+
+
+def test_templates_render_without_static_files_registered():
+    # urls.py registers StaticFiles.url, a template rendered before it gets plain urls
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ("from framework.templator import render\n"
+            "print(render('index.html', objects_list=[]))\n")
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert 'href="/static/style.css"' in result.stdout
+
+
+def test_registered_static_files_give_fingerprinted_urls(static, tmp_path, monkeypatch):
+    monkeypatch.setattr(templator, 'environments', {})
+    monkeypatch.setattr(templator, 'template_globals', dict(templator.template_globals))
+    (tmp_path / 'page.html').write_text("{{ static('style.css') }}", encoding='utf-8')
+    assert templator.render('page.html', folder=str(tmp_path)) == '/static/style.css'
+    templator.add_global('static', static.url)
+    assert templator.render('page.html', folder=str(tmp_path)) == static.url('style.css')
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from framework import templator
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    """Templates folder with its own environment, the settings are restored after the test"""
+    monkeypatch.setattr(templator, 'AUTO_RELOAD', True)
+    monkeypatch.setattr(templator, 'BYTECODE_CACHE_DIR', str(tmp_path / 'bytecode'))
+    folder = tmp_path / 'templates'
+    folder.mkdir()
+    (folder / 'hello.html').write_text('Hello, {{ name }}!', encoding='utf-8')
+    (folder / 'page.html').write_text('{% include "hello.html" %}', encoding='utf-8')
+    yield str(folder)
+    templator.environments.pop(str(folder), None)
+
+
+def touch(path, text):
+    """New content with a later mtime, the reload check compares them"""
+    mtime = os.stat(path).st_mtime
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.utime(path, (mtime + 10, mtime + 10))
+
+
+def test_environment_and_templates_are_reused(folder):
+    env = templator.get_environment(folder)
+    assert templator.get_environment(folder) is env
+    assert env.get_template('hello.html') is env.get_template('hello.html')
+    assert templator.render('hello.html', folder=folder, name='world') == 'Hello, world!'
+
+
+def test_changed_template_is_reloaded(folder):
+    assert templator.render('page.html', folder=folder, name='a') == 'Hello, a!'
+    touch(os.path.join(folder, 'hello.html'), 'Bye, {{ name }}!')
+    assert templator.render('page.html', folder=folder, name='a') == 'Bye, a!'
+
+
+def test_without_auto_reload_the_compiled_template_stays(folder, monkeypatch):
+    monkeypatch.setattr(templator, 'AUTO_RELOAD', False)
+    assert templator.render('hello.html', folder=folder, name='a') == 'Hello, a!'
+    touch(os.path.join(folder, 'hello.html'), 'Bye, {{ name }}!')
+    assert templator.render('hello.html', folder=folder, name='a') == 'Hello, a!'
+
+
+def test_precompile_fills_the_bytecode_cache(folder):
+    assert templator.precompile(folder) == 2
+    assert len(os.listdir(templator.BYTECODE_CACHE_DIR)) == 2
+    # a new environment loads the bytecode instead of compiling
+    templator.environments.pop(folder)
+    assert templator.render('hello.html', folder=folder, name='b') == 'Hello, b!'
+
+
+def test_configure_drops_the_environments(folder):
+    env = templator.get_environment(folder)
+    templator.configure(cache_size=templator.CACHE_SIZE)
+    assert templator.get_environment(folder) is not env
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from io import BytesIO
+
+import pytest
+
+from framework.asgi import AsgiFramework
+from framework.main import Framework
+from patterns.architectural_system_patterns import UnitOfWork, UnitOfWorkMiddleware
+from patterns.creational_patterns import MapperRegistry, Student
+
+
+class CreateStudents:
+    def __init__(self, code='200 OK', error=None):
+        self.code = code
+        self.error = error
+
+    def __call__(self, request):
+        for name in ('first', 'second', 'third'):
+            Student(name).mark_new()
+        if self.error is not None:
+            raise self.error
+        return self.code, 'ok'
+
+
+def environ(path):
+    return {'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'wsgi.input': BytesIO(b'')}
+
+
+def student_rows(pool):
+    token = pool.begin_request()
+    try:
+        return pool.get_connection().execute('SELECT id, name FROM student ORDER BY id').fetchall()
+    finally:
+        pool.end_request(token)
+
+
+def make_application(views):
+    return Framework(views, [UnitOfWorkMiddleware(MapperRegistry)])
+
+
+def test_commit_after_success_gives_ids(pool):
+    application = make_application({'/create/': CreateStudents()})
+    assert b''.join(application(environ('/create/'), lambda code, headers: None)) == b'ok'
+    rows = student_rows(pool)
+    assert [name for _, name in rows] == ['first', 'second', 'third']
+    ids = [row_id for row_id, _ in rows]
+    assert ids == list(range(ids[0], ids[0] + 3))
+    assert UnitOfWork.get_current() is None
+    assert pool.stats()['in_use'] == 0
+
+
+def test_rollback_after_error_response(pool):
+    application = make_application({'/create/': CreateStudents('400 Bad Request')})
+    application(environ('/create/'), lambda code, headers: None)
+    assert student_rows(pool) == []
+    assert pool.stats()['in_use'] == 0
+
+
+def test_rollback_after_exception(pool):
+    application = make_application({'/create/': CreateStudents(error=RuntimeError('view failed'))})
+    with pytest.raises(RuntimeError):
+        application(environ('/create/'), lambda code, headers: None)
+    assert student_rows(pool) == []
+    assert UnitOfWork.get_current() is None
+    assert pool.stats()['in_use'] == 0
+
+
+def test_failed_commit_releases_the_connection(pool, monkeypatch):
+    def commit(self):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(UnitOfWork, 'commit', commit)
+    application = make_application({'/create/': CreateStudents()})
+    with pytest.raises(RuntimeError):
+        application(environ('/create/'), lambda code, headers: None)
+    assert UnitOfWork.get_current() is None
+    assert pool.stats()['in_use'] == 0
+
+
+def test_asgi_commits_outside_the_event_loop(pool, monkeypatch):
+    threads = []
+    commit = UnitOfWork.commit
+
+    def recording_commit(self):
+        threads.append(threading.current_thread())
+        commit(self)
+
+    monkeypatch.setattr(UnitOfWork, 'commit', recording_commit)
+    application = AsgiFramework({'/create/': CreateStudents()},
+                                [UnitOfWorkMiddleware(MapperRegistry)], max_workers=2)
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/create/', 'query_string': b'',
+             'headers': [], 'server': ('testserver', 80)}
+    asyncio.run(application(scope, receive, send))
+    assert messages[0]['status'] == 200
+    assert threads and threads[0] is not threading.main_thread()
+    assert [name for _, name in student_rows(pool)] == ['first', 'second', 'third']
+    assert pool.stats()['in_use'] == 0
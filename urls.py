@@ -1,17 +1,37 @@
+import os
 from datetime import date
 
+from framework.compression import CompressionMiddleware
+from framework.metrics import MetricsMiddleware, ProfilingMiddleware
+from framework.recorder import TrafficRecorder
+from framework.static import StaticFiles
+from framework.templator import add_global
+from patterns.architectural_system_patterns import UnitOfWorkMiddleware
+from patterns.creational_patterns import MapperRegistry
+
 from views import Index, Contact, Courses, CreateCategory, CoursesList, CreateCourse, CopyCourse
 
 
-# front controller
-# def date_adding(request):
-#     request['date'] = date.today()
-#
-#
-# def other_front(request):
-#     request['key'] = 'key'
-#
-#
-# fronts = [date_adding, other_front]
-fronts = []
+# front controller: functions front(request) or Middleware objects
+# with before_request/after_response hooks
+def date_adding(request):
+    request['date'] = date.today()
+
+
+# every request gets its own unit of work
+# responses are compressed by Accept-Encoding of the client
+fronts = [MetricsMiddleware(), CompressionMiddleware(), UnitOfWorkMiddleware(MapperRegistry), date_adding]
+# PROFILE_SAMPLE_RATE=0.05 - every 20th request is profiled, slow ones are dumped to logs/profiles
+if os.environ.get('PROFILE_SAMPLE_RATE'):
+    fronts.append(ProfilingMiddleware(
+        sample_rate=float(os.environ['PROFILE_SAMPLE_RATE']),
+        slow_ms=float(os.environ.get('PROFILE_SLOW_MS', 500)),
+        memory=os.environ.get('PROFILE_MEMORY') == '1'))
+# RECORD_TRAFFIC=logs/traffic.jsonl - requests are written for python -m benchmarks.loadtest replay
+if os.environ.get('RECORD_TRAFFIC'):
+    fronts.append(TrafficRecorder(os.environ['RECORD_TRAFFIC']))
 routes = {}
+
+# css and other files of static/, {{ static('style.css') }} gives the fingerprinted url
+static_files = StaticFiles('static', prefix='/static/')
+add_global('static', static_files.url)
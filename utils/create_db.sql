@@ -5,5 +5,8 @@ BEGIN TRANSACTION;
 DROP TABLE IF EXISTS student;
 CREATE TABLE student (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL UNIQUE, name VARCHAR (32));
 
+DROP TABLE IF EXISTS student_course;
+CREATE TABLE student_course (student_id INTEGER NOT NULL REFERENCES student (id) ON DELETE CASCADE, course_name VARCHAR (32) NOT NULL, PRIMARY KEY (student_id, course_name));
+
 COMMIT TRANSACTION;
 PRAGMA foreign_keys = on;
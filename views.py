@@ -1,18 +1,20 @@
+from framework.metrics import registry
 from framework.templator import render
 from patterns.behavioral_patterns import *
-from patterns.creational_patterns import Engine, Logger, MapperRegistry
-from patterns.structural_patterns import AppRoute, routes, Debug
-from patterns.architectural_system_patterns import UnitOfWork
+from patterns.creational_patterns import Engine, Logger, MapperRegistry, Enrollment, \
+    CourseSchema, CategorySchema, StudentSchema
+from patterns.structural_patterns import AppRoute, Debug
 
 site = Engine()
 logger = Logger('main')
 email_notifier = EmailNotifier()
 sms_notifier = SmsNotifier()
-UnitOfWork.new_current()
-UnitOfWork.get_current().set_mapper_registry(MapperRegistry)
+# enrollment doesn't wait for SMS/email gateways
+Subject.dispatcher = NotificationDispatcher()
+MapperRegistry.set_resolver('course', site.get_course)
 
 
-@AppRoute('/')
+@AppRoute('/', cache=60)
 class Index:
     def __call__(self, request):
         return '200 OK', render('index.html', objects_list=site.categories)
@@ -24,25 +26,29 @@ class Contact:
         return '200 OK', render('contact.html', date=request.get('date', None))
 
 
-@AppRoute('/courses/')
+@AppRoute('/courses/', cache=60)
 class Courses:
     def __call__(self, request):
         return '200 OK', render('courses.html', objects_list=site.categories)
 
 
-@AppRoute('/students/')
+@AppRoute('/students/', cache=60)
 class Courses:
     def __call__(self, request):
         return '200 OK', render('students.html', objects_list=site.categories)
 
 
 @AppRoute('/courses-list/')
+@AppRoute('/courses-list/<int:id>/')
 class CoursesList:
     def __call__(self, request):
         logger.log('Список курсов')
         try:
-            category = site.find_category_by_id(
-                int(request['request_params']['id']))
+            if 'id' in request['path_params']:
+                category_id = request['path_params']['id']
+            else:
+                category_id = int(request['request_params']['id'])
+            category = site.find_category_by_id(category_id)
             return '200 OK', render('course_list.html',
                                     objects_list=category.courses,
                                     name=category.name, id=category.id)
@@ -50,7 +56,7 @@ class CoursesList:
             return '200 OK', 'No courses have been added yet'
 
 
-@AppRoute('/create-course/')
+@AppRoute('/create-course/', invalidates_cache=True)
 class CreateCourse:
     category_id = -1
 
@@ -58,14 +64,13 @@ class CreateCourse:
         if request['method'] == 'POST':
             data = request['data']
             name = data['name']
-            name = site.decode_value(name)
 
             category = None
             if self.category_id != -1:
                 category = site.find_category_by_id(int(self.category_id))
                 course = site.create_course('record', name, category)
-                course.observers.append(email_notifier)
-                course.observers.append(sms_notifier)
+                course.attach(email_notifier)
+                course.attach(sms_notifier)
                 site.courses.append(course)
 
             return '200 OK', render('course_list.html',
@@ -84,14 +89,13 @@ class CreateCourse:
                 return '200 OK', 'No categories have been added yet'
 
 
-@AppRoute('/create-category/')
+@AppRoute('/create-category/', invalidates_cache=True)
 class CreateCategory:
     def __call__(self, request):
 
         if request['method'] == 'POST':
             data = request['data']
             name = data['name']
-            name = site.decode_value(name)
             category_id = data.get('category_id')
 
             category = None
@@ -108,7 +112,7 @@ class CreateCategory:
                                     categories=categories)
 
 
-@AppRoute('/copy-course/')
+@AppRoute('/copy-course/', invalidates_cache=True)
 class CopyCourse:
     def __call__(self, request):
         request_params = request['request_params']
@@ -118,10 +122,7 @@ class CopyCourse:
 
             old_course = site.find_course_by_name(name)
             if old_course:
-                new_name = f'copy_{name}'
-                new_course = old_course.clone()
-                new_course.name = new_name
-                site.courses.append(new_course)
+                new_course = site.clone_course(old_course, f'copy_{name}')
 
             return '200 OK', render('course_list.html',
                                     objects_list=site.courses,
@@ -134,26 +135,31 @@ class CopyCourse:
 class StudentListView(ListView):
     # queryset = site.students
     template_name = 'student_list.html'
+    stream = True
 
     def get_queryset(self):
+        # rendered while rows are fetched, the table isn't loaded at once
         mapper = MapperRegistry.get_current_mapper('student')
-        return mapper.all()
+        return mapper.iterate()
+
+    def paginate_queryset(self, after, limit):
+        mapper = MapperRegistry.get_current_mapper('student')
+        return mapper.page(after, limit)
 
 
-@AppRoute('/create-student/')
+@AppRoute('/create-student/', invalidates_cache=True)
 class StudentCreateView(CreateView):
     template_name = 'create_student.html'
 
     def create_obj(self, data: dict):
         name = data['name']
-        name = site.decode_value(name)
         new_obj = site.create_user('student', name)
         site.students.append(new_obj)
+        # committed by UnitOfWorkMiddleware when the response is ready
         new_obj.mark_new()
-        UnitOfWork.get_current().commit()
 
 
-@AppRoute('/add-student/')
+@AppRoute('/add-student/', invalidates_cache=True)
 class AddStudentByCourseCreateView(CreateView):
     template_name = 'add_student.html'
 
@@ -165,16 +171,45 @@ class AddStudentByCourseCreateView(CreateView):
 
     def create_obj(self, data: dict):
         course_name = data['course_name']
-        course_name = site.decode_value(course_name)
         course = site.get_course(course_name)
         student_name = data['student_name']
-        student_name = site.decode_value(student_name)
         student = site.get_student(student_name)
         course.add_student(student)
+        if getattr(student, 'id', None) is not None:
+            Enrollment(student.id, course.name).mark_new()
+
 
+@AppRoute('/api/', cache=60)
+class CourseApi(ApiListView):
+    schema = CourseSchema
 
-@AppRoute('/api/')
-class CourseApi:
     @Debug(name='CourseApi')
     def __call__(self, request):
-        return '200 OK', BaseSerializer(site.courses).save()
+        return super().__call__(request)
+
+    def get_queryset(self):
+        return site.courses
+
+
+@AppRoute('/api/categories/', cache=60)
+class CategoryApi(ApiListView):
+    schema = CategorySchema
+
+    def get_queryset(self):
+        return site.categories
+
+
+@AppRoute('/api/students/', cache=60)
+class StudentApi(ApiListView):
+    schema = StudentSchema
+
+    def get_queryset(self):
+        return site.students
+
+
+@AppRoute('/metrics/', methods=['GET'])
+class Metrics:
+    content_type = 'text/plain; version=0.0.4'
+
+    def __call__(self, request):
+        return '200 OK', registry.prometheus()